@@ -0,0 +1,461 @@
+# benchmark.py
+
+# Offline benchmarks of song analysis and storage, run with: python benchmark.py [options]
+# Lyrics are synthetic (generated from a fixed seed), so results are reproducible.
+
+import argparse
+import gc
+import json
+import os
+import pathlib
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import pronouncing
+import utility
+import song_utility as sutil
+import rhyme_index
+from pair_cache import PairCache
+from song import Song
+from song_store import SongStore
+from lyrics_store import LyricsStore
+
+# Kinds of fixtures: number of songs and, per song, a list of (section header, lines, words per line)
+FIXTURES = {
+    'pop' : (20, [('[Verse 1]', 8, 7), ('[Chorus]', 6, 6), ('[Verse 2]', 8, 7), ('[Chorus]', 6, 6),
+                  ('[Bridge]', 4, 6), ('[Chorus]', 6, 6)]),
+    'rap' : (4, [('[Verse 1]', 80, 12), ('[Hook]', 8, 8), ('[Verse 2]', 80, 12), ('[Hook]', 8, 8),
+                 ('[Verse 3]', 80, 12), ('[Hook]', 8, 8)]),
+    'album' : (2, [(header, 8, 8) for _ in range(10) for header in ['[Verse]', '[Pre-Chorus]', '[Chorus]', '[Bridge]']]),
+}
+
+# Words used often in lyrics (songs mix them with words from the CMU dictionary)
+_COMMON_WORDS = ['i', 'you', 'me', 'the', 'a', 'and', 'to', 'in', 'my', 'your', 'we', 'so', 'oh', 'yeah',
+                 'love', 'night', 'light', 'baby', 'heart', 'fire', 'rain', 'money', 'street', 'time', 'know',
+                 "don't", "can't", "i'm", "it's", 'gon\'', 'rock-n-roll', 'café', '&', 'mr.', '—']
+
+'''
+Return the songs of a fixture as (name, artist, lyrics, ID) tuples. The lyrics only depend on
+the kind of fixture and the seed.
+    kind : Kind of fixture (key of FIXTURES)
+    seed : Seed of the random generator
+'''
+def make_fixture(kind: str, seed: int = 0) -> [(str, str, str, str)]:
+    count, layout = FIXTURES[kind]
+    rng = random.Random(f'{kind}:{seed}')
+    pronouncing.init_cmu()
+    dictionary = sorted({word for word, _ in pronouncing.pronunciations if word.isalpha()})
+    songs = []
+    for i in range(count):
+        vocabulary = _COMMON_WORDS + rng.sample(dictionary, 40 * len(layout))
+        chorus = None
+        lines = []
+        for header, line_count, word_count in layout:
+            lines.append(header)
+            section = [' '.join(rng.choice(vocabulary) for _ in range(word_count)) for _ in range(line_count)]
+            if header in ['[Chorus]', '[Hook]']:
+                # Choruses and hooks repeat within a song
+                chorus = chorus or section
+                section = chorus
+            lines.extend(section)
+            lines.append('')
+        lyrics = '\n'.join(lines) + '\n12EmbedShare URLCopyEmbedCopy'
+        songs.append((f'{kind.title()} Song {i}', 'Benchmark Artist', lyrics, f'{kind}-{seed}-{i}'))
+    return songs
+
+'''
+Return the stages to benchmark as (name, prepare, run) tuples. prepare(songs) returns the
+input of run (and is not timed); run(input) does the work of the stage.
+    directory : Temporary directory for the storage stages
+'''
+def _get_stages(directory: pathlib.Path) -> [(str, 'function', 'function')]:
+    def words(songs):
+        return [(song.get_all_words(), song.get_unique_words(), song.get_sections(), song.get_sections_unique())
+                for song in (Song(*song) for song in songs)]
+    def uncached_words(songs):
+        utility.syllable_count.cache_clear()
+        return words(songs)
+    def matrices(songs):
+        return [(sutil.find_rhyme_matrix(w[1]), w[3]) for w in words(songs)]
+    def new_store(songs):
+        return songs, pathlib.Path(tempfile.mkdtemp(dir=directory))
+    def save(arguments):
+        songs, path = arguments
+        song_store, lyrics_store = SongStore(path / 'song_data.db'), LyricsStore(path)
+        with song_store.batch(), lyrics_store.batch():
+            for song in songs:
+                song = Song(*song)
+                lyrics_store.put(song.get_id(), song.get_name(), song.get_artist(), song.get_lyrics())
+                song_store.upsert(song.get_stat_group(), song.get_lyrics_hash())
+        song_store.close()
+        lyrics_store.close()
+    def saved_store(songs):
+        songs, path = new_store(songs)
+        save((songs, path))
+        return LyricsStore(path), [song[3] for song in songs]
+    def load(arguments):
+        lyrics_store, ids = arguments
+        for song_id in ids:
+            lyrics_store.get(song_id)
+        lyrics_store.close()
+
+    return [
+        ('remove_tag', lambda songs: [song[2] for song in songs],
+            lambda lyrics: [sutil.remove_tag(text) for text in lyrics]),
+        ('clean_string', lambda songs: [line for song in songs for line in song[2].split('\n')],
+            lambda lines: [utility.clean_string(line) for line in lines]),
+        ('extract_sections', lambda songs: [song[2] for song in songs],
+            lambda lyrics: [sutil.extract_sections_and_words(text) for text in lyrics]),
+        ('syllables', uncached_words,
+            lambda data: [sutil.find_syllables_per_word(w[0]) for w in data]),
+        ('section_similarity', words,
+            lambda data: [sutil.find_shared_unique_pct(w[2], w[3], len(w[1])) for w in data]),
+        ('rhyme_scores', words,
+            lambda data: [sutil.rhyme_scores_from_matrix(*sutil.find_rhyme_matrix(w[1])) for w in data]),
+        ('proximity_rhyme', matrices,
+            lambda data: [sutil.find_proximity_rhyme_score(*matrix, unique) for matrix, unique in data]),
+        ('song_stats', lambda songs: songs,
+            lambda songs: [Song(*song).get_stat_group() for song in songs]),
+        ('save', new_store, save),
+        ('load', saved_store, load),
+    ]
+
+'''
+Return the smallest wall time of repeated runs of a stage (the input is prepared again
+before every run).
+    prepare : Function that returns the input of the stage
+    run     : Function that runs the stage
+    repeats : Number of runs
+'''
+def _time_stage(prepare, run, repeats: int) -> float:
+    best = None
+    for _ in range(repeats):
+        data = prepare()
+        start = time.perf_counter()
+        run(data)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+'''
+Run every stage on every fixture and return the results: for each fixture and stage, the wall
+time in seconds (best of the repeats), the throughput in songs and words per second, and the
+peak memory allocated while the stage ran (measured in a separate run, since tracing memory
+slows the stage down).
+    fixtures : Kinds of fixtures to run (None = all)
+    repeats  : Number of timed runs of each stage
+    stages   : Names of the stages to run (None = all)
+'''
+def run_benchmarks(fixtures: [str] = None, repeats: int = 3, stages: [str] = None) -> {str : {str : {str : float}}}:
+    if repeats <= 0:
+        raise ValueError(f"run_benchmarks: Parameter repeats must be a positive integer")
+    # The rhyme index is loaded once, before timing
+    rhyme_index.get_index()
+    results = dict()
+    with tempfile.TemporaryDirectory() as directory:
+        for kind in fixtures or FIXTURES:
+            songs = make_fixture(kind)
+            word_count = sum(len(line.split()) for song in songs for line in song[2].split('\n'))
+            results[kind] = dict()
+            for name, prepare, run in _get_stages(pathlib.Path(directory)):
+                if stages is not None and name not in stages:
+                    continue
+                seconds = _time_stage(lambda: prepare(songs), run, repeats)
+                data = prepare(songs)
+                tracemalloc.start()
+                run(data)
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                results[kind][name] = {'seconds' : seconds, 'songs_per_sec' : len(songs) / seconds,
+                                       'words_per_sec' : word_count / seconds, 'peak_kib' : peak / 1024}
+    return results
+
+'''
+Return a description of every stage that is slower than in the baseline by more than the
+threshold (stages missing from either set of results are skipped). Differences smaller than
+min_seconds are timing noise and never count as regressions.
+    results     : Results of run_benchmarks()
+    baseline    : Results of an earlier run_benchmarks()
+    threshold   : Allowed slowdown as a fraction of the baseline time (0.2 = 20% slower)
+    min_seconds : Smallest slowdown (in seconds) that can count as a regression
+'''
+def find_regressions(results: dict, baseline: dict, threshold: float, min_seconds: float = 0.002) -> [str]:
+    regressions = []
+    for kind, stages in results.items():
+        for name, result in stages.items():
+            base = baseline.get(kind, {}).get(name)
+            if base is not None and result['seconds'] > base['seconds'] * (1 + threshold) \
+                    and result['seconds'] - base['seconds'] >= min_seconds:
+                regressions.append(f'{kind}/{name}: {result["seconds"]:.4f}s vs {base["seconds"]:.4f}s '
+                                   f'(+{result["seconds"] / base["seconds"] - 1:.0%})')
+    return regressions
+
+'''
+Print the results of run_benchmarks() as a table (and the change from the baseline, if given).
+    results  : Results of run_benchmarks()
+    baseline : Results of an earlier run (None = no comparison)
+'''
+def print_results(results: dict, baseline: dict = None) -> None:
+    print(f'{"fixture":<8} {"stage":<20} {"seconds":>9} {"songs/s":>10} {"words/s":>12} {"peak KiB":>10}'
+          + (f' {"vs base":>8}' if baseline else ''))
+    for kind, stages in results.items():
+        for name, result in stages.items():
+            line = (f'{kind:<8} {name:<20} {result["seconds"]:>9.4f} {result["songs_per_sec"]:>10.1f} '
+                    f'{result["words_per_sec"]:>12.0f} {result["peak_kib"]:>10.0f}')
+            base = (baseline or {}).get(kind, {}).get(name)
+            if base is not None:
+                line += f' {result["seconds"] / base["seconds"] - 1:>+8.0%}'
+            print(line)
+
+# Ways of keeping analyzed songs in memory, measured by measure_memory()
+def _keep_song(song):
+    song.get_stat_group()
+    return song
+def _keep_compact_with_lyrics(song):
+    song.compact(keep_lyrics = True)
+    return song
+def _keep_compact(song):
+    song.compact()
+    return song
+def _keep_record(song):
+    return song.to_record()
+_MEMORY_MODES = {'song' : _keep_song, 'compact+lyrics' : _keep_compact_with_lyrics,
+                 'compact' : _keep_compact, 'record' : _keep_record}
+
+'''
+Return the memory (in bytes per song) kept alive by analyzed songs of each fixture, for each way
+of keeping them: whole Song objects ('song'), songs compacted with and without their lyrics
+('compact+lyrics', 'compact'), and SongRecord objects ('record'). Each fixture is analyzed once
+before measuring, so caches shared by all songs (and interned words) are not counted.
+    fixtures : Kinds of fixtures to measure (None = all)
+'''
+def measure_memory(fixtures: [str] = None) -> {str : {str : float}}:
+    rhyme_index.get_index()
+    results = dict()
+    for kind in fixtures or FIXTURES:
+        songs = make_fixture(kind)
+        kept = [Song(*song).get_stat_group() for song in songs]
+        results[kind] = dict()
+        for mode, keep in _MEMORY_MODES.items():
+            gc.collect()
+            tracemalloc.start()
+            start = tracemalloc.get_traced_memory()[0]
+            kept = [keep(Song(*song)) for song in songs]
+            gc.collect()
+            results[kind][mode] = (tracemalloc.get_traced_memory()[0] - start) / len(songs)
+            tracemalloc.stop()
+            kept = None
+    return results
+
+# Steps of a cold start, each timed in a new interpreter ({index} and {lyrics} are filled in)
+_COLD_START = {
+    'interpreter' : "pass",
+    'import' : "import lyric_empirics",
+    'load_rhyme_index' : "import rhyme_index; rhyme_index.set_index_path({index!r}); rhyme_index.get_index()",
+    'first_song' : "import lyric_empirics; from song import Song; Song('Song', 'Artist', {lyrics!r}, 1).get_stat_group()",
+}
+
+'''
+Return the time of each step of a cold start (see _COLD_START), in the same form as the results
+of run_benchmarks() (under the 'cold_start' fixture) so they can be compared with a baseline.
+Every step runs in a new interpreter, in an empty directory, with the rhyme index already saved
+in the cache directory (LYRIC_EMPIRICS_CACHE, see rhyme_index.get_default_index_path()), and is
+timed from the start of the interpreter to its exit (the 'interpreter' step does nothing else).
+The best of the repeats is kept. Raises a RuntimeError if importing lyric_empirics writes files.
+    repeats : Number of runs of each step
+'''
+def measure_cold_start(repeats: int = 5) -> {str : {str : {str : float}}}:
+    if repeats <= 0:
+        raise ValueError(f"measure_cold_start: Parameter repeats must be a positive integer")
+    results = dict()
+    source = pathlib.Path(__file__).resolve().parent
+    with tempfile.TemporaryDirectory() as cache, tempfile.TemporaryDirectory() as directory:
+        index = pathlib.Path(cache) / 'rhyme_index.pkl'
+        rhyme_index.get_index().save(index)
+        lyrics = make_fixture('pop')[0][2]
+        environment = {**os.environ, 'PYTHONPATH' : str(source), 'LYRIC_EMPIRICS_CACHE' : cache}
+        for name, code in _COLD_START.items():
+            command = [sys.executable, '-c', code.format(index=str(index), lyrics=lyrics)]
+            best = None
+            for _ in range(repeats):
+                start = time.perf_counter()
+                subprocess.run(command, cwd=directory, env=environment, check=True, capture_output=True)
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            results[name] = {'seconds' : best}
+            if name == 'import' and any(pathlib.Path(directory).iterdir()):
+                raise RuntimeError(f"measure_cold_start: Importing lyric_empirics wrote files in {directory}")
+    return {'cold_start' : results}
+
+'''
+Print the results of measure_cold_start() as a table (and the change from the baseline, if given).
+    results  : Results of measure_cold_start()
+    baseline : Results of an earlier run (None = no comparison)
+'''
+def print_cold_start(results: dict, baseline: dict = None) -> None:
+    print(f'{"step":<20} {"ms":>9}' + (f' {"vs base":>8}' if baseline else ''))
+    for name, result in results['cold_start'].items():
+        line = f'{name:<20} {result["seconds"] * 1000:>9.1f}'
+        base = (baseline or {}).get('cold_start', {}).get(name)
+        if base is not None:
+            line += f' {result["seconds"] / base["seconds"] - 1:>+8.0%}'
+        print(line)
+
+# Implementations of clean_string compared by measure_clean_string()
+_CLEAN_STRING = {'clean_string' : utility.clean_string, 'clean_string_reference' : utility.clean_string_reference}
+
+'''
+Return the throughput (in lines per second) of each implementation of clean_string (see
+_CLEAN_STRING) on the lyrics lines of each fixture, along with the best wall time of the repeats.
+    fixtures : Kinds of fixtures to run (None = all)
+    repeats  : Number of timed runs of each implementation
+'''
+def measure_clean_string(fixtures: [str] = None, repeats: int = 3) -> {str : {str : {str : float}}}:
+    if repeats <= 0:
+        raise ValueError(f"measure_clean_string: Parameter repeats must be a positive integer")
+    results = dict()
+    for kind in fixtures or FIXTURES:
+        lines = [line for song in make_fixture(kind) for line in song[2].split('\n')]
+        results[kind] = dict()
+        for name, clean in _CLEAN_STRING.items():
+            seconds = _time_stage(lambda: lines, lambda lines: [clean(line) for line in lines], repeats)
+            results[kind][name] = {'seconds' : seconds, 'lines_per_sec' : len(lines) / seconds}
+    return results
+
+'''
+Print the results of measure_clean_string() as a table (with the speedup of clean_string over
+the reference implementation).
+    results : Results of measure_clean_string()
+'''
+def print_clean_string(results: dict) -> None:
+    print(f'{"fixture":<8} ' + ' '.join(f'{name:>22}' for name in _CLEAN_STRING) + f' {"speedup":>8}   (lines/s)')
+    for kind, names in results.items():
+        speedup = names['clean_string_reference']['seconds'] / names['clean_string']['seconds']
+        print(f'{kind:<8} ' + ' '.join(f'{names[name]["lines_per_sec"]:>22.0f}' for name in _CLEAN_STRING)
+              + f' {speedup:>7.1f}x')
+
+# Pair score cache states timed by measure_pair_cache()
+_PAIR_CACHE_MODES = ['no_cache', 'cold', 'warm_memory', 'warm_disk']
+
+'''
+Return the time taken to find the rhyme score matrices of the songs of each fixture with the pair
+score cache in each state: no cache ('no_cache'), a new cache ('cold'), a cache that already holds
+the fixture's pairs in memory ('warm_memory'), and a new process's cache reading them from the
+file written by a cold run ('warm_disk'). Each result also holds the size of that file. The best
+of the repeats is kept.
+    fixtures : Kinds of fixtures to run (None = all)
+    repeats  : Number of timed runs of each state
+'''
+def measure_pair_cache(fixtures: [str] = None, repeats: int = 3) -> {str : {str : {str : float}}}:
+    if repeats <= 0:
+        raise ValueError(f"measure_pair_cache: Parameter repeats must be a positive integer")
+    rhyme_index.get_index()
+    previous = utility.get_pair_cache()
+    results = dict()
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            for kind in fixtures or FIXTURES:
+                word_sets = [Song(*song).get_unique_words() for song in make_fixture(kind)]
+                path = pathlib.Path(directory) / f'{kind}.db'
+                caches = {'no_cache' : lambda: None,
+                          'cold' : lambda: (path.unlink(missing_ok=True), PairCache(path=path))[1],
+                          'warm_memory' : lambda: warm,
+                          'warm_disk' : lambda: PairCache(path=path, read_only=True)}
+                warm = PairCache()
+                utility.set_pair_cache(warm)
+                for words in word_sets:
+                    sutil.find_rhyme_matrix(words)
+                results[kind] = dict()
+                for mode in _PAIR_CACHE_MODES:
+                    def prepare():
+                        utility.set_pair_cache(caches[mode]())
+                    def run(_):
+                        for words in word_sets:
+                            sutil.find_rhyme_matrix(words)
+                    results[kind][mode] = {'seconds' : _time_stage(prepare, run, repeats)}
+                    if utility.get_pair_cache() not in (None, warm):
+                        utility.get_pair_cache().close()
+                file_kib = path.stat().st_size / 1024
+                for mode in _PAIR_CACHE_MODES:
+                    results[kind][mode]['file_kib'] = file_kib
+    finally:
+        utility.set_pair_cache(previous)
+    return results
+
+'''
+Print the results of measure_pair_cache() as a table (with the time of each state relative to
+no cache).
+    results : Results of measure_pair_cache()
+'''
+def print_pair_cache(results: dict) -> None:
+    print(f'{"fixture":<8} ' + ' '.join(f'{mode:>12}' for mode in _PAIR_CACHE_MODES) + f' {"file KiB":>9}   (seconds)')
+    for kind, modes in results.items():
+        print(f'{kind:<8} ' + ' '.join(f'{modes[mode]["seconds"]:>12.4f}' for mode in _PAIR_CACHE_MODES)
+              + f' {modes["cold"]["file_kib"]:>9.0f}')
+        print(f'{"":<8} ' + ' '.join(f'{modes[mode]["seconds"] / modes["no_cache"]["seconds"]:>11.2f}x'
+                                     for mode in _PAIR_CACHE_MODES))
+
+'''
+Print the results of measure_memory() as a table.
+    results : Results of measure_memory()
+'''
+def print_memory(results: dict) -> None:
+    print(f'{"fixture":<8} ' + ' '.join(f'{mode:>15}' for mode in _MEMORY_MODES) + '   (bytes per song)')
+    for kind, modes in results.items():
+        print(f'{kind:<8} ' + ' '.join(f'{modes[mode]:>15.0f}' for mode in _MEMORY_MODES))
+
+def main(argv: [str] = None) -> int:
+    parser = argparse.ArgumentParser(description='Offline benchmarks of song analysis and storage.')
+    parser.add_argument('--fixtures', nargs='+', choices=list(FIXTURES), help='fixtures to run (default: all)')
+    parser.add_argument('--stages', nargs='+', help='stages to run (default: all)')
+    parser.add_argument('--repeats', type=int, default=3, help='timed runs per stage (default: 3)')
+    parser.add_argument('--save-baseline', metavar='FILE', help='write the results to FILE')
+    parser.add_argument('--baseline', metavar='FILE', help='compare the results with FILE')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='allowed slowdown compared with the baseline (default: 0.2 = 20%%)')
+    parser.add_argument('--memory', action='store_true', help='measure the memory kept per song instead')
+    parser.add_argument('--cold-start', action='store_true',
+                        help='time imports and the first song in new interpreters instead')
+    parser.add_argument('--pair-cache', action='store_true',
+                        help='time rhyme scoring with no, cold, and warm pair score caches instead')
+    parser.add_argument('--clean-string', action='store_true',
+                        help='compare clean_string with its reference implementation (lines/s) instead')
+    args = parser.parse_args(argv)
+
+    if args.memory:
+        print_memory(measure_memory(args.fixtures))
+        return 0
+    if args.pair_cache:
+        print_pair_cache(measure_pair_cache(args.fixtures, args.repeats))
+        return 0
+    if args.clean_string:
+        print_clean_string(measure_clean_string(args.fixtures, args.repeats))
+        return 0
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as file:
+            baseline = json.load(file)['results']
+    if args.cold_start:
+        results = measure_cold_start(args.repeats)
+        print_cold_start(results, baseline)
+    else:
+        results = run_benchmarks(args.fixtures, args.repeats, args.stages)
+        print_results(results, baseline)
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as file:
+            json.dump({'python' : platform.python_version(), 'platform' : platform.platform(),
+                       'results' : results}, file, indent=2)
+    if baseline is not None:
+        regressions = find_regressions(results, baseline, args.threshold)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,50 @@
+# job_runner.py
+
+# Resumable batch jobs, run with: python job_runner.py MANIFEST [options]
+# Each line of the manifest is 'title<TAB>artist' or the path of lyrics (see lyric_empirics.run_job()).
+
+import argparse
+import os
+import sys
+import lyric_empirics as le
+
+'''
+Run the job of a manifest from the command line. Returns the exit status: 0 if every song was
+processed, 1 if some songs are left in the retry queue, 2 for invalid arguments, and 130 if the
+job was stopped (running it again resumes it).
+    argv : Command-line arguments (None = sys.argv)
+'''
+def main(argv: [str] = None) -> int:
+    parser = argparse.ArgumentParser(description='Analyze and save every song of a manifest, resuming '
+                                                 'where the last run of the job stopped.')
+    parser.add_argument('manifest', help="file with one song per line: 'title<TAB>artist' or a path of lyrics "
+                                         "(file, directory, archive, or JSONL dump)")
+    parser.add_argument('--name', help='job name (default: manifest file name without its extension)')
+    parser.add_argument('--token', help='Genius API client token (default: GENIUS_ACCESS_TOKEN environment variable)')
+    parser.add_argument('--chunk-size', type=int, default=500, help='songs saved per checkpoint (default: 500)')
+    parser.add_argument('--workers', type=int, default=1, help='worker processes analyzing songs (default: 1)')
+    parser.add_argument('--retries', type=int, default=3, help='retries after a search times out (default: 3)')
+    parser.add_argument('--restart', action='store_true', help='start the job over instead of resuming it')
+    parser.add_argument('--cache', action='store_true', help='cache search results and lyrics')
+    parser.add_argument('--offline', action='store_true', help='only find songs in the song cache')
+    parser.add_argument('--verbose', action='store_true', help='print a status message for every song')
+    args = parser.parse_args(argv)
+
+    token = args.token or os.environ.get('GENIUS_ACCESS_TOKEN')
+    if token:
+        le.init_genius(token, display = args.verbose)
+    if args.cache or args.offline:
+        le.enable_song_cache()
+    le.set_offline_mode(args.offline)
+    try:
+        counts = le.run_job(args.manifest, args.name, args.chunk_size, args.workers, args.retries, args.restart)
+    except ValueError as error:
+        print(error, file=sys.stderr)
+        return 2
+    except KeyboardInterrupt:
+        print('Job stopped; run it again to resume it', file=sys.stderr)
+        return 130
+    return 1 if counts['failed'] else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
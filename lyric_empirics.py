@@ -4,18 +4,44 @@
 
 # lyric_empirics.py
 # Program runs through this file. Holds public functions users can call.
+# Slow imports (lyricsgenius, requests, pandas) happen when the functions that need them are first
+# called, so scoring lyrics does not pay for them.
 
-
-import lyricsgenius as lg
-from song import Song
+from song import Song, STAT_NAMES
 import utility
+import rhyme_index
+from pair_cache import PairCache
+from song_cache import SongCache
+from song_store import SongStore
+from lyrics_store import LyricsStore
+from song_query import SongIndex
+import lyrics_source
+import profiling
 import pathlib
-import pandas as pd
+import concurrent.futures
+import collections
+import contextlib
+import copy
+import datetime
+import functools
+import hashlib
+import itertools
+import os
+import threading
+import time
 
 _genius = None # Genius API Client
-_song_df = None # Dataframe for songs
+_song_store = None # Store of song statistics (opened on first use)
 _dir1 = pathlib.Path('LyricEmpiricsStorage')
-_dir2 = _dir1 / "SongLyrics"
+_dir2 = _dir1 / "SongLyrics" # Lyrics files written by earlier versions
+_dir3 = _dir1 / "LyricsStore"
+_lyrics_store = None # Store of saved lyrics (opened on first use)
+_song_cache = None # Cache of search results and lyrics (None = no caching)
+_offline = False # If True, songs are only found in the song cache
+_profile_collector = None # Collector of song profiles (None = profiling is off)
+_song_index = None # Index of saved song statistics for queries (built on first query)
+_song_index_changes = None # Song store and its change count the index is up to date with
+_RETRY_DELAY = 0.5 # Seconds to wait before the first retry of a timed out request
 
 '''
 Return the Genius API Client object that allows requests to be made based on
@@ -28,7 +54,7 @@ the arguments given.
 '''
 def init_genius(token: str, max_time: int = 10, sleep: float = 0.2,
                 display: bool = True, exclude: [str] = ["(Live)"]) -> None:
-    global _genius, _song_df
+    global _genius
     if max_time <= 0:
         raise ValueError(f"init_genius: Parameter max_time must be a positive integer")
     if sleep <= 0:
@@ -36,19 +62,13 @@ def init_genius(token: str, max_time: int = 10, sleep: float = 0.2,
     for word in exclude:
         if not isinstance(word, str):
             raise ValueError(f"init_genius: Parameter exclude must contain only strings")
+    import lyricsgenius as lg
     _genius = lg.Genius(token, timeout = max_time, sleep_time = sleep,
                      verbose = display, excluded_terms = exclude)
     if _genius.verbose:
         print('Genius API Client successfully created')
 
     _dir1.mkdir(exist_ok=True)
-    _dir2.mkdir(exist_ok=True)
-
-    # Also load songs from file into _song_df
-    try:
-        _song_df = pd.read_csv(_dir1 / 'song_data.csv')
-    except:
-        _song_df = pd.DataFrame()
 
 '''
 Change the timeout limit for the Genius API Client.
@@ -114,58 +134,957 @@ def remove_excluded_word(word: str) -> None:
         if genius._verbose:
             print(f'\"{word}\" is not currently excluded')    
 
+'''
+Change the address the Genius API Client sends requests to (e.g. a local server that stands in
+for Genius.com when testing).
+    root : Base URL (such as 'http://localhost:8000/'), or None to use Genius.com again
+'''
+def change_genius_root(root: str) -> None:
+    global _genius
+    if root is None:
+        for attribute in ['API_ROOT', 'PUBLIC_API_ROOT', 'WEB_ROOT']:
+            _genius.__dict__.pop(attribute, None)
+    else:
+        root = root if root.endswith('/') else root + '/'
+        _genius.API_ROOT = root
+        _genius.PUBLIC_API_ROOT = root + 'api/'
+        _genius.WEB_ROOT = root
+    if _genius.verbose:
+        print(f'Requests will be sent to {_genius.WEB_ROOT}')
+
 '''
 Find song based on song title and artist name.
     name    : Song title
     artist  : Artist name
 '''
 def find_song(name: str, artist: str) -> Song:
-    song_found = _genius.search_song(name, artist)
-    if song_found != None:
-        if _genius.verbose:
-            print(f'Found {song_found.title} ~~~ {song_found.primary_artist.name}')
-        return Song(song_found.title, song_found.primary_artist.name,
-                               song_found.lyrics, song_found.id)
+    source = _search_song(name, artist)
+    if source != None:
+        return Song(*source)
     else:
         return None
 
 '''
-Save the song to 'song_data.csv' and its lyrics to a separate text file.
+Find song based on its Genius.com ID.
+    song_id : Song Genius.com ID
+'''
+def find_song_by_id(song_id) -> Song:
+    source = None if _song_cache is None else _song_cache.get_by_id(song_id)
+    if source is None and not _offline:
+        song_found = _genius.search_song(song_id = song_id)
+        if song_found != None:
+            source = _song_source(song_found)
+            if _song_cache is not None:
+                _song_cache.put(None, None, source, song_found.to_dict())
+    if source != None:
+        return Song(*source)
+    else:
+        return None
+
+'''
+Return True if status messages are turned on; False otherwise (or if there is no Genius API Client).
+'''
+def _verbose() -> bool:
+    return _genius is not None and _genius.verbose
+
+'''
+Return the (name, artist, lyrics, ID) of a song found by the Genius API Client.
+    song_found : Song returned by the Genius API Client
+'''
+def _song_source(song_found) -> (str, str, str, str):
+    if _genius.verbose:
+        print(f'Found {song_found.title} ~~~ {song_found.primary_artist.name}')
+    return song_found.title, song_found.primary_artist.name, song_found.lyrics, song_found.id
+
+'''
+Search for a song, using the song cache if it is turned on. In offline mode, only the cache is
+used. Otherwise, the Genius API Client is used for searches that are not cached, retrying with
+exponential backoff when a request times out (the timeout is set by change_genius_timeout()).
+Returns the (name, artist, lyrics, ID) of the song, or None if it was not found.
+    name    : Song title
+    artist  : Artist name
+    retries : Number of retries after a timeout (the last timeout is raised)
+    client  : Genius API Client to search with (None = the one created by init_genius())
+'''
+def _search_song(name: str, artist: str, retries: int = 0, client = None) -> (str, str, str, str):
+    if _song_cache is not None:
+        cached, source = _song_cache.get(name, artist)
+        if cached:
+            if source is not None and _verbose():
+                print(f'Found {source[0]} ~~~ {source[1]} (cached)')
+            return source
+    if _offline:
+        if _verbose():
+            print(f'{name} ~~~ {artist} is not cached (offline mode)')
+        return None
+
+    import requests
+    for attempt in range(retries + 1):
+        try:
+            song_found = (client or _genius).search_song(name, artist)
+            break
+        except requests.exceptions.Timeout:
+            if attempt == retries:
+                raise
+            time.sleep(_RETRY_DELAY * 2**attempt)
+    source = None if song_found is None else _song_source(song_found)
+    if _song_cache is not None:
+        _song_cache.put(name, artist, source, None if song_found is None else song_found.to_dict())
+    return source
+
+class _TokenBucket:
+    '''
+    Initializes a token bucket that allows rate requests per second on average and bursts of
+    up to capacity requests. Safe to share between threads.
+        rate     : Average number of requests per second
+        capacity : Maximum number of requests made at once after being idle
+    '''
+    def __init__(self, rate: float, capacity: int):
+        self._rate = rate
+        self._capacity = capacity
+        self._tokens = capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    '''
+    Wait until a request may be made.
+    '''
+    def acquire(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self._capacity, self._tokens + (now - self._last) * self._rate)
+            self._last = now
+            # Take the token now (the count may go negative) and wait for it outside the lock
+            self._tokens -= 1
+            wait = -self._tokens / self._rate if self._tokens < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
+
+'''
+Return an HTTP session that waits for a token from a token bucket before every request and
+keeps a pool of connections open for concurrent requests.
+    bucket    : Token bucket shared by all requests
+    pool_size : Number of connections kept open per host
+'''
+def _rate_limited_session(bucket: _TokenBucket, pool_size: int) -> 'requests.Session':
+    import requests
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections = pool_size, pool_maxsize = pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    send = session.request
+    def request(*args, **kwargs) -> requests.Response:
+        bucket.acquire()
+        return send(*args, **kwargs)
+    session.request = request
+    return session
+
+'''
+Return a copy of the Genius API Client that sends its requests through the given session and
+does not sleep between requests, so concurrent searches can share it without changing the
+client created by init_genius().
+    session : HTTP session of the copy
+'''
+def _session_client(session: 'requests.Session'):
+    client = copy.copy(_genius)
+    session.headers.update(_genius._session.headers)
+    session.proxies.update(_genius._session.proxies)
+    client._session = session
+    client.sleep_time = 0
+    return client
+
+'''
+Search for a song (see _search_song()), returning None if every attempt timed out.
+    item    : (title, artist) pair
+    retries : Number of retries after a timeout
+    client  : Genius API Client to search with (None = the one created by init_genius())
+'''
+def _fetch_song(item: (str, str), retries: int, client = None) -> (str, str, str, str):
+    import requests
+    name, artist = item
+    try:
+        return _search_song(name, artist, retries, client)
+    except requests.exceptions.Timeout:
+        if _verbose():
+            print(f'Search for {name} ~~~ {artist} timed out')
+        return None
+
+'''
+Find many songs at once based on song titles and artist names. Searches run concurrently over a
+pool of connections of their own (the Genius API Client is copied, not changed), and a token
+bucket limits the request rate (replacing the sleep time between requests). Yields (item, result)
+pairs as songs are found, where result is a Song (or a (name, artist, lyrics, ID) tuple if raw is
+True), or None if the song was not found.
+    songs   : Iterable of (title, artist) pairs
+    workers : Number of concurrent searches
+    rate    : Maximum average number of requests per second (None = 1 / sleep time)
+    retries : Number of retries (with backoff) after a request times out
+    raw     : If True, yield (name, artist, lyrics, ID) tuples instead of Song objects
+    ordered : If True, yield songs in the order given; otherwise, yield them as they are found
+'''
+def find_songs(songs, workers: int = 8, rate: float = None, retries: int = 3,
+               raw: bool = False, ordered: bool = False) -> ((str, str), Song):
+    if workers <= 0:
+        raise ValueError(f"find_songs: Parameter workers must be a positive integer")
+    if retries < 0:
+        raise ValueError(f"find_songs: Parameter retries must be a non-negative integer")
+    if rate is not None and rate <= 0:
+        raise ValueError(f"find_songs: Parameter rate must be positive")
+
+    # In offline mode, songs only come from the song cache and the client is not needed
+    session = client = None
+    if not _offline:
+        session = _rate_limited_session(_TokenBucket(rate or 1 / _genius.sleep_time, workers), workers)
+        client = _session_client(session)
+    try:
+        def fetch(item):
+            return item, _fetch_song(item, retries, client)
+        with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+            for item, source in _run_bounded(executor, fetch, songs, 2 * workers, ordered):
+                if source is not None and not raw:
+                    source = Song(*source)
+                yield item, source
+    finally:
+        if session is not None:
+            session.close()
+
+'''
+Return the store of song statistics ('song_data.db' in the LyricEmpiricsStorage directory),
+opening it on first use. Rows of an existing 'song_data.csv' are imported into a new store.
+'''
+def _get_song_store() -> SongStore:
+    global _song_store
+    if _song_store is None:
+        _dir1.mkdir(exist_ok=True)
+        new_store = not (_dir1 / 'song_data.db').exists()
+        _song_store = SongStore(_dir1 / 'song_data.db')
+        if new_store and (_dir1 / 'song_data.csv').exists():
+            _song_store.import_csv(_dir1 / 'song_data.csv')
+            if _verbose():
+                print(f'Imported {len(_song_store)} songs from song_data.csv')
+    return _song_store
+
+'''
+Return the store of saved lyrics (the LyricsStore directory in LyricEmpiricsStorage), opening it
+on first use. Lyrics files in the SongLyrics directory of an earlier version are imported into
+a new store.
+'''
+def _get_lyrics_store() -> LyricsStore:
+    global _lyrics_store
+    if _lyrics_store is None:
+        new_store = not (_dir3 / 'lyrics_index.db').exists()
+        _lyrics_store = LyricsStore(_dir3)
+        if new_store and _dir2.is_dir():
+            migrate_song_lyrics()
+    return _lyrics_store
+
+'''
+Import the lyrics files of a SongLyrics directory (one 'Name_Artist.txt' file per song, written
+by earlier versions of save_song()) into the lyrics store. Files are keyed by the ID of the saved
+song with the same name and artist (whose name and artist they get), or by their file name if
+there is no such song. The files are left in place.
+    path : Directory of lyrics files (None = SongLyrics in LyricEmpiricsStorage)
+Returns the number of files imported.
+'''
+def migrate_song_lyrics(path = None) -> int:
+    if path is None:
+        path = _dir2
+    songs = dict()
+    table = _get_song_store().to_dataframe()
+    for name, artist, song_id in zip(table['Name'].tolist(), table['Artist'].tolist(), table['ID'].tolist()):
+        stem = LyricsStore.song_key(None, str(name), str(artist))
+        # Songs whose names collide cannot be told apart; their file is keyed by its name
+        songs[stem] = None if stem in songs else (song_id, name, artist)
+    songs = {stem : song for stem, song in songs.items() if song is not None}
+    count = _get_lyrics_store().import_directory(path, songs)
+    if _verbose():
+        print(f'Imported {count} lyrics files from {path}')
+    return count
+
+'''
+Return a saved song (created from its saved lyrics), or None if no song with that key is saved.
+    song_id : Song Genius.com ID (or 'Name_Artist' for songs saved without an ID)
+'''
+def load_saved_song(song_id) -> Song:
+    source = _get_lyrics_store().get_song(song_id)
+    return None if source is None else Song(*source)
+
+'''
+Save the song's statistics to 'song_data.db' and its lyrics to the lyrics store.
     song: Song object to save
 '''
 def save_song(song: Song) -> None:
-    global _song_df
     if song == None:
-        if _genius.verbose:
+        if _verbose():
             print('Song cannot be saved (it does not exist)')
-            return
-    name = utility.keep_alphanum(song.get_name())
-    artist = utility.keep_alphanum(song.get_artist())
+        return
+    key = LyricsStore.song_key(song.get_id(), song.get_name(), song.get_artist())
+    _get_lyrics_store().put(song.get_id(), song.get_name(), song.get_artist(), song.get_lyrics())
 
-    lyrics_path = _dir2 / (name+'_'+artist+'.txt')
+    if _verbose():
+        print(f'Lyrics of {song} saved in {_dir3} (key {key})')
 
-    with open(lyrics_path, 'w', encoding='utf-8') as file:
-        file.write(song.get_lyrics())
+    # Replaces the row of a song that was saved before (same key)
+    store = _get_song_store()
+    store.upsert(song.get_stat_group(), song.get_lyrics_hash(), store.add_version(Song.get_stat_fingerprints()))
 
-    if _genius.verbose:
-        print(f'Lyrics of {song} saved in {lyrics_path}')
-
-    storage_path = _dir1 / 'song_data.csv'
-
-    headers = ['Name','Artist','ID','NumSects','WdCnt','UnqWdCnt','UnqWdPct',
-               'TotRS','ProxRS','RymDens','LgRymDens','Wd/Sect','Syll/Wd',
-               'UnqWd/Sect','RS/Sect','RS/Wd','ProxRS/Sect',
-               'ProxRS/Wd','SectSim','LyrStren']
-
-    stat_group = song.get_stat_group()
-    stats_as_str = [str(x) for x in stat_group]
-    stat_dict = {headers[i] : stats_as_str[i] for i in range(len(headers))}
-    
-    if not _song_df.empty:
-        _song_df.drop(_song_df[_song_df['ID'] == song.get_id()].index,inplace=True)
-        if _song_df.empty: # Happens when the only row in the dataframe was of the song to be added
-            _song_df = pd.DataFrame()
-    _song_df = _song_df.append(stat_dict, ignore_index = True)
-    _song_df.to_csv(storage_path, index=False, encoding='utf-8')
-   
+'''
+Save many songs at once. Statistics and lyrics are committed in one transaction per chunk of
+songs (as are the pair scores added to the pair score cache), so songs can be streamed from a
+large source (e.g. stream_songs()). If saving is interrupted (or an exception is raised), the
+current chunk is rolled back; earlier chunks stay saved.
+    songs      : Iterable of Song objects to save
+    chunk_size : Number of songs saved per transaction
+'''
+def save_songs(songs, chunk_size: int = 1000) -> None:
+    if chunk_size <= 0:
+        raise ValueError(f"save_songs: Parameter chunk_size must be a positive integer")
+    songs = iter(songs)
+    while True:
+        chunk = list(itertools.islice(songs, chunk_size))
+        if not chunk:
+            break
+        with _get_song_store().batch(), _get_lyrics_store().batch(), _pair_cache_batch():
+            for song in chunk:
+                save_song(song)
+
+'''
+Re-score saved songs whose statistics are out of date, using their saved lyrics. Songs whose
+lyrics changed (or that were saved without a lyrics hash and version) are fully re-scored. For
+other songs, only the statistics whose computation changed since they were saved (see
+Song._VERSIONS), and the statistics that depend on them, are recomputed; the rest are kept, so
+e.g. a change to lyrical strength does not redo rhyme scoring.
+    chunk_size : Number of songs saved per transaction
+Returns the number of songs that were 'unchanged', 'partial'ly or 'full'y re-scored, and
+'missing' their saved lyrics (those are left as they are).
+'''
+def rescore_songs(chunk_size: int = 1000) -> {str : int}:
+    if chunk_size <= 0:
+        raise ValueError(f"rescore_songs: Parameter chunk_size must be a positive integer")
+    store = _get_song_store()
+    lyrics_store = _get_lyrics_store()
+    fingerprints = Song.get_stat_fingerprints()
+    version = store.add_version(fingerprints)
+    counts = {'unchanged' : 0, 'partial' : 0, 'full' : 0, 'missing' : 0}
+
+    def rescored_rows():
+        for row in store.iter_rows():
+            source = lyrics_store.get_song(LyricsStore.song_key(row['ID'], row['Name'], row['Artist']))
+            if source is None:
+                counts['missing'] += 1
+                continue
+            song = Song(*source)
+            old_fingerprints = None if row['ScoreVer'] is None else store.get_version(row['ScoreVer'])
+            if row['LyrHash'] != song.get_lyrics_hash() or old_fingerprints is None:
+                counts['full'] += 1
+            elif row['ScoreVer'] == version:
+                counts['unchanged'] += 1
+                continue
+            else:
+                song.load_stats({header : row[header] for header, name in STAT_NAMES.items()
+                                 if old_fingerprints.get(name) == fingerprints[name]})
+                counts['partial'] += 1
+            yield song.get_stat_group() + [song.get_lyrics_hash(), version]
+
+    rows = rescored_rows()
+    while chunk := list(itertools.islice(rows, chunk_size)):
+        store.upsert_many(chunk)
+    if _verbose():
+        print(f'Re-scored songs: {counts}')
+    return counts
+
+'''
+Yield the songs stored locally at one or more paths, without the Genius API Client. A path can
+be a lyrics file (like the ones written by save_song()), a directory of them, a tar/zip archive,
+or a JSONL dump with one song per line ('title', 'artist', 'lyrics', and 'id' keys). Songs are
+read lazily, so memory use does not grow with the number of songs.
+    paths : Path or list of paths to read
+    stats : If True, yield the song's get_stat_group() values instead of the Song object
+'''
+def stream_songs(paths, stats: bool = False):
+    if isinstance(paths, (str, pathlib.PurePath)):
+        paths = [paths]
+    for path in paths:
+        for source in lyrics_source.read_sources(path):
+            song = Song(*source)
+            yield song.get_stat_group() if stats else song
+
+'''
+Return the index of saved song statistics used by queries. It is built on the first query; later
+queries apply the songs saved, rescored, or removed since (by this or another process), reading
+only those songs.
+'''
+def _get_song_index() -> SongIndex:
+    global _song_index, _song_index_changes
+    store = _get_song_store()
+    count = store.get_change_count()
+    if _song_index is not None and _song_index_changes[0] is store and _song_index_changes[1] <= count:
+        if _song_index_changes[1] < count:
+            count, saved, removed = store.get_changes(_song_index_changes[1])
+            _song_index, _song_index_changes = _song_index.updated(saved, removed), (store, count)
+        return _song_index
+    # The change count is read before the rows, so changes saved in between are applied again later
+    _song_index, _song_index_changes = SongIndex(store.to_dataframe()), (store, count)
+    return _song_index
+
+'''
+Return the saved songs with the highest (or lowest) value of a statistic as a DataFrame (columns
+of 'song_data.csv'), best first. Songs without a value for the statistic are left out.
+    stat      : Column name of the statistic (e.g. 'LyrStren', 'RymDens', 'UnqWdPct')
+    k         : Number of songs
+    artist    : Only consider the songs of this artist (case-insensitive; None = all songs)
+    ascending : If True, return the songs with the lowest values instead
+'''
+def top_songs(stat: str, k: int = 10, artist: str = None, ascending: bool = False) -> 'pandas.DataFrame':
+    return _get_song_index().top(stat, k, artist, ascending)
+
+'''
+Return the statistics of the saved songs of an artist (case-insensitive) as a DataFrame.
+    artist : Artist name
+'''
+def songs_by_artist(artist: str) -> 'pandas.DataFrame':
+    return _get_song_index().by_artist(artist)
+
+'''
+Return the saved songs whose statistics are most similar to those of a saved song as a
+DataFrame, most similar first. Each statistic is normalized over the saved songs (mean 0,
+standard deviation 1) and songs are compared by the Euclidean distance between their normalized
+statistics (the 'Distance' column). Songs without sections are never similar to anything.
+    song_id : Genius.com ID of a saved song (or 'Name_Artist' for songs saved without one)
+    k       : Number of songs
+    artist  : Only consider the songs of this artist (case-insensitive; None = all songs)
+'''
+def similar_songs(song_id, k: int = 10, artist: str = None) -> 'pandas.DataFrame':
+    return _get_song_index().similar(song_id, k, artist)
+
+'''
+Return a summary of a statistic over all saved songs, or over the saved songs of an artist: a
+dict with the count, mean, sample variance and standard deviation (None for fewer than two
+songs), min, max, and 'quantiles' (a dict of quantile and value, within 1%). Summaries are kept
+up to date as songs are saved, so this does not read the songs. Songs without a value for the
+statistic are left out.
+    stat      : Column name of the statistic (e.g. 'LyrStren', 'RymDens', 'UnqWdPct')
+    artist    : Only consider the songs of this artist (case-insensitive; None = all songs)
+    quantiles : Quantiles to include (e.g. 0.5 for the median)
+'''
+def summarize_stat(stat: str, artist: str = None, quantiles = (0.25, 0.5, 0.75)) -> dict:
+    column = _get_song_store().get_summary(artist).get_column(stat)
+    summary = column.get_stats()
+    summary['quantiles'] = {q : column.quantile(q) for q in quantiles}
+    return summary
+
+'''
+Return the q-quantile of a statistic over all saved songs, or over the saved songs of an artist
+(within 1%; see summarize_stat()), or None if no song has a value for it.
+    stat   : Column name of the statistic (e.g. 'LyrStren')
+    q      : Quantile, between 0 and 1 (e.g. 0.5 for the median)
+    artist : Only consider the songs of this artist (case-insensitive; None = all songs)
+'''
+def get_stat_quantile(stat: str, q: float, artist: str = None) -> float:
+    return _get_song_store().get_summary(artist).get_column(stat).quantile(q)
+
+'''
+Write the statistics of all saved songs to a CSV file (same layout as the original
+'song_data.csv') or a Parquet file.
+    path    : File to write (None = 'song_data.csv' or 'song_data.parquet' in LyricEmpiricsStorage)
+    parquet : If True, write a Parquet file (requires pyarrow or fastparquet); otherwise, a CSV file
+'''
+def export_song_data(path = None, parquet: bool = False) -> None:
+    if path is None:
+        path = _dir1 / ('song_data.parquet' if parquet else 'song_data.csv')
+    if parquet:
+        _get_song_store().export_parquet(path)
+    else:
+        _get_song_store().export_csv(path)
+
+'''
+Return the statistics of many songs as a DataFrame with one row per song and one typed column
+per statistic (the columns of 'song_data.csv'). Averages, percentages, and lyrical strength are
+computed for all songs at once.
+    songs : Iterable of Song objects or (name, artist, lyrics, ID) tuples
+'''
+def extract_stats(songs) -> 'pandas.DataFrame':
+    import stat_table
+    return stat_table.build_stat_table(songs)
+
+'''
+Return the results of calling function on each argument, submitting calls to an executor
+while keeping at most max_pending of them in flight (so arguments are read lazily).
+    executor    : Executor that runs the calls
+    function    : Function to call
+    arguments   : Iterable of arguments (one call per argument)
+    max_pending : Maximum number of calls in flight
+    ordered     : If True, yield results in the order of arguments; otherwise, yield them
+                  as soon as they are finished
+'''
+def _run_bounded(executor: concurrent.futures.Executor, function, arguments, max_pending: int, ordered: bool):
+    arguments = iter(arguments)
+    pending = collections.deque()
+    while True:
+        for argument in itertools.islice(arguments, max_pending - len(pending)):
+            pending.append(executor.submit(function, argument))
+        if not pending:
+            break
+        if ordered:
+            done = pending.popleft()
+        else:
+            done = next(concurrent.futures.as_completed(pending))
+            pending.remove(done)
+        yield done.result()
+
+'''
+Set up a worker process of analyze_songs().
+    index_path    : File of the rhyme index (None = build it in memory)
+    cache_path    : File of the pair score cache, opened read-only (None = no file)
+    cache_size    : Maximum number of pairs kept in memory by the cache (None = no cache)
+    cmu_syllables : Whether syllable counts come from the CMU dictionary when possible
+    profile       : Whether songs record profiles (they are reported in the calling process)
+'''
+def _init_worker(index_path: pathlib.Path, cache_path: pathlib.Path, cache_size: int, cmu_syllables: bool,
+                 profile: bool) -> None:
+    rhyme_index.set_index_path(index_path)
+    utility.set_cmu_syllables(cmu_syllables)
+    # Forked workers inherit the callbacks of the calling process, which reports profiles itself
+    profiling.disable()
+    if profile:
+        profiling.enable()
+    if cache_size is not None:
+        # New scores are sent to the calling process, which adds them to its cache (see _in_worker())
+        utility.set_pair_cache(PairCache(cache_size, cache_path, read_only = True))
+
+'''
+Return the arguments of _init_worker() for the current settings. The rhyme index is built (or
+loaded) here, once, so workers only have to load it.
+'''
+def _worker_initargs() -> tuple:
+    if rhyme_index.get_index_path() is None:
+        rhyme_index.set_index_path('default')
+    rhyme_index.get_index()
+    cache = utility.get_pair_cache()
+    cache_path = None if cache is None else cache.get_path()
+    cache_size = None if cache is None else cache.get_stats()['max_size']
+    return (rhyme_index.get_index_path(), cache_path, cache_size, utility.get_cmu_syllables(),
+            profiling.is_enabled())
+
+'''
+Call a function that creates songs in a worker process, and return its result along with the
+pair scores added to the worker's cache. Workers open the cache file read-only, so their new
+scores are added to the cache of the calling process by _save_worker_scores().
+    function : Function to call
+    jobs     : Argument of the function
+'''
+def _in_worker(function, jobs):
+    cache = utility.get_pair_cache()
+    return function(jobs), None if cache is None else cache.take_unsaved()
+
+'''
+Add the pair scores returned by a worker process (see _in_worker()) to the pair score cache.
+    scores : Block of new scores of the worker (None = the worker has no cache)
+'''
+def _save_worker_scores(scores) -> None:
+    cache = utility.get_pair_cache()
+    if cache is not None and scores is not None:
+        cache.put_block(*scores)
+
+'''
+Return a with-block that writes the new scores of the pair score cache in one transaction at its
+end (see PairCache.batch), or that does nothing if caching is off.
+'''
+def _pair_cache_batch():
+    cache = utility.get_pair_cache()
+    return contextlib.nullcontext() if cache is None else cache.batch()
+
+'''
+Create the songs of a chunk of jobs (runs in a worker process of analyze_songs()). Each job is
+an (item, source) pair, where source is a lyrics file path, the (name, artist, lyrics, ID) of
+a song, or None if the song was not found.
+    jobs : List of (item, source) pairs
+'''
+def _build_songs(jobs: [('item', 'source')]) -> [('item', Song)]:
+    songs = []
+    for item, source in jobs:
+        if isinstance(source, pathlib.Path):
+            source = lyrics_source.read_lyrics_file(source)
+        song = None if source is None else Song(*source)
+        if song is not None:
+            # Statistics are computed here, in the worker, rather than on first use
+            song.compute_stats()
+        songs.append((item, song))
+    return songs
+
+'''
+Return the source of a song for each item given to analyze_songs(). Songs given by
+(title, artist) are searched for with the Genius API Client here, in the calling process.
+Directories, archives, and JSONL dumps are read here too, one song at a time.
+    items : Iterable of (title, artist) pairs or paths
+'''
+def _song_sources(items) -> ('item', 'source'):
+    for item in items:
+        if isinstance(item, (str, pathlib.PurePath)):
+            path = pathlib.Path(item)
+            if path.suffix == '.txt':
+                yield item, path
+            else:
+                for source in lyrics_source.read_sources(path):
+                    yield item, source
+            continue
+        name, artist = item
+        yield item, _search_song(name, artist)
+
+'''
+Analyze many songs at once, creating the Song objects in a pool of worker processes. Items can
+be (title, artist) pairs (found with the Genius API Client, like find_song()) or paths of
+lyrics files (e.g. the ones written by save_song()), directories, archives, or JSONL dumps (see
+stream_songs()). Yields (item, Song) pairs as songs are finished, where a path that holds many
+songs is the item of each of them; the Song is None if a (title, artist) pair was not found.
+    items     : Iterable of (title, artist) pairs or paths
+    workers   : Number of worker processes (None = number of CPUs)
+    chunksize : Number of songs sent to a worker at once
+    ordered   : If True, yield songs in the order of items; otherwise, yield them as soon
+                as they are finished
+'''
+def analyze_songs(items, workers: int = None, chunksize: int = 8, ordered: bool = True) -> ('item', Song):
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 0:
+        raise ValueError(f"analyze_songs: Parameter workers must be a positive integer")
+    if chunksize <= 0:
+        raise ValueError(f"analyze_songs: Parameter chunksize must be a positive integer")
+
+    sources = _song_sources(items)
+    # Keep a bounded number of chunks in flight so items are read lazily
+    max_pending = 2 * workers
+    with concurrent.futures.ProcessPoolExecutor(workers, initializer = _init_worker,
+                                                initargs = _worker_initargs()) as executor:
+        chunks = iter(lambda: list(itertools.islice(sources, chunksize)), [])
+        for songs, scores in _run_bounded(executor, functools.partial(_in_worker, _build_songs), chunks,
+                                          max_pending, ordered):
+            _save_worker_scores(scores)
+            for item, song in songs:
+                # Profiles recorded in workers are reported to the callbacks of this process
+                if song is not None and profiling.is_enabled() and song.get_profile() is not None:
+                    profiling.emit(song, song.get_profile())
+                yield item, song
+
+'''
+Yield the lines of a job manifest that hold an item (blank lines and lines starting with '#'
+are skipped).
+    manifest : Manifest file
+'''
+def _manifest_lines(manifest: pathlib.Path) -> str:
+    with open(manifest, 'r', encoding='utf-8') as file:
+        for line in file:
+            line = line.strip('\r\n')
+            if line.strip() and not line.lstrip().startswith('#'):
+                yield line
+
+'''
+Yield the units of work of a job, in the order of its manifest. Each line of a manifest is either
+'title<TAB>artist' (a song found with the Genius API Client) or the path of a lyrics file,
+directory, archive, or JSONL dump (relative to the manifest's directory). Units are dicts of JSON
+values, so failed ones can be stored and tried again: {'title', 'artist'} for a search, {'path'}
+for a lyrics file (read when it is processed), or {'source'} for the (name, artist, lyrics, ID)
+of one song of a path that holds many.
+    manifest : Manifest file
+'''
+def _job_units(manifest: pathlib.Path) -> dict:
+    for line in _manifest_lines(manifest):
+        if '\t' in line:
+            title, artist = line.split('\t', 1)
+            yield {'title' : title.strip(), 'artist' : artist.strip()}
+            continue
+        path = manifest.absolute().parent / line.strip()
+        if path.suffix == '.txt':
+            yield {'path' : str(path)}
+        else:
+            for source in lyrics_source.read_sources(path):
+                yield {'source' : list(source)}
+
+'''
+Return the source of a unit of work of a job (see _build_songs()), or None if its song was not
+found. Searches run here, in the calling process.
+    unit    : Unit of work (see _job_units())
+    retries : Number of retries after a search times out
+'''
+def _job_source(unit: dict, retries: int):
+    if 'title' in unit:
+        return _search_song(unit['title'], unit['artist'], retries)
+    if 'path' in unit:
+        return pathlib.Path(unit['path'])
+    return tuple(unit['source'])
+
+'''
+Create the songs of a chunk of a job (in a worker process if the job has workers). Unlike
+_build_songs(), the error of a song that cannot be created is returned instead of raised, so
+one bad song does not stop the job.
+    jobs : List of (unit position, source) pairs
+Returns a list of (unit position, Song, error) triples, where either Song or error is None.
+'''
+def _build_job_songs(jobs: [(int, 'source')]) -> [(int, Song, str)]:
+    results = []
+    for position, source in jobs:
+        try:
+            results.append((position, _build_songs([(position, source)])[0][1], None))
+        except Exception as error:
+            results.append((position, None, f'{type(error).__name__}: {error}'))
+    return results
+
+'''
+Process a chunk of units of a job, then save its songs, its failures, and the job's progress in
+one transaction (so after a crash, the job resumes exactly after the last saved chunk).
+    name     : Job name
+    state    : State of the job (updated)
+    chunk    : List of (unit position, unit) pairs
+    executor : Process pool creating the songs (None = create them in this process)
+    retries  : Number of retries after a search times out
+    advance  : If True, the chunk is the next one of the job (rather than failed units tried
+               again), so the job's progress moves past it
+'''
+def _run_job_chunk(name: str, state: dict, chunk: [(int, dict)], executor: concurrent.futures.Executor,
+                   retries: int, advance: bool) -> None:
+    results, jobs = [], []
+    for position, unit in chunk:
+        try:
+            source = _job_source(unit, retries)
+        except Exception as error:
+            results.append((position, None, f'{type(error).__name__}: {error}'))
+            continue
+        if source is None:
+            results.append((position, None, None))
+        else:
+            jobs.append((position, source))
+    batches = [jobs[i:i + 8] for i in range(0, len(jobs), 8)]
+    if executor is None:
+        built = ((songs, None) for songs in map(_build_job_songs, batches))
+    else:
+        built = executor.map(functools.partial(_in_worker, _build_job_songs), batches)
+    with _pair_cache_batch():
+        for songs, scores in built:
+            _save_worker_scores(scores)
+            results.extend(songs)
+
+    units = dict(chunk)
+    store = _get_song_store()
+    # The state is changed once the chunk is committed (if saving fails, the chunk is rolled back)
+    new_state = dict(state)
+    with store.batch(), _get_lyrics_store().batch():
+        for position, song, error in sorted(results, key = lambda result: result[0]):
+            if error is not None:
+                store.put_job_failure(name, position, units[position], error)
+                continue
+            store.delete_job_failure(name, position)
+            if song is None:
+                new_state['not_found'] += 1
+            else:
+                save_song(song)
+                new_state['saved'] += 1
+        if advance:
+            new_state['done'] = chunk[-1][0] + 1
+        store.put_job(name, new_state)
+    state.update(new_state)
+
+'''
+Print the progress of a job: songs processed, throughput of this run, estimated time left, and
+failures.
+    name      : Job name
+    state     : State of the job
+    processed : Number of songs processed by this run
+    seconds   : Time (in seconds) since this run started
+'''
+def _report_job(name: str, state: dict, processed: int, seconds: float) -> None:
+    rate = processed / seconds if seconds > 0 else 0.0
+    left = state['total'] - state['done']
+    eta = str(datetime.timedelta(seconds = round(left / rate))) if rate > 0 else 'unknown'
+    print(f"{name}: {state['done']}/{state['total']} songs ({state['done'] / max(state['total'], 1):.1%}), "
+          f"{rate:.1f} songs/s, ETA {eta}, {_get_song_store().count_job_failures(name)} failed")
+
+'''
+Run a batch job: analyze and save every song of a manifest (see _job_units()). Songs are
+processed in chunks, and each chunk is saved in one transaction along with the job's progress,
+so only one chunk of songs is held in memory and a job that is stopped (or crashes) resumes
+after its last saved chunk when it is run again. Songs that fail (e.g. a search that keeps
+timing out, or lyrics that cannot be read) go to the job's retry queue instead of stopping it;
+the queue is tried again at the end of every run. Progress, throughput, and the estimated time
+left are printed after each chunk.
+    manifest   : Manifest file
+    name       : Job name (None = the manifest's file name without its extension)
+    chunk_size : Number of songs saved per transaction
+    workers    : Number of worker processes creating songs (1 = create them in this process)
+    retries    : Number of retries (with backoff) after a search times out
+    restart    : If True, start the job over instead of resuming it
+    report     : If True, print the job's progress
+Returns the job's number of songs ('total'), songs processed so far ('done'), songs 'saved' and
+'not_found', and songs left in the retry queue ('failed').
+'''
+def run_job(manifest, name: str = None, chunk_size: int = 500, workers: int = 1, retries: int = 3,
+            restart: bool = False, report: bool = True) -> {str : int}:
+    if chunk_size <= 0:
+        raise ValueError(f"run_job: Parameter chunk_size must be a positive integer")
+    if workers <= 0:
+        raise ValueError(f"run_job: Parameter workers must be a positive integer")
+    if retries < 0:
+        raise ValueError(f"run_job: Parameter retries must be a non-negative integer")
+    manifest = pathlib.Path(manifest)
+    name = manifest.stem if name is None else name
+    if _genius is None and not _offline and any('\t' in line for line in _manifest_lines(manifest)):
+        raise ValueError(f"run_job: Songs given by title and artist need init_genius() (or offline mode)")
+
+    store = _get_song_store()
+    digest = hashlib.sha1(manifest.read_bytes()).hexdigest()
+    state = None if restart else store.get_job(name)
+    if state is not None and state['manifest_hash'] != digest:
+        raise ValueError(f"run_job: Manifest of job {name} changed since the job started (restart the job to run it)")
+    if state is None:
+        # Units are counted once, when the job starts, so progress has a total
+        state = {'manifest' : str(manifest), 'manifest_hash' : digest, 'total' : sum(1 for _ in _job_units(manifest)),
+                 'done' : 0, 'saved' : 0, 'not_found' : 0}
+        with store.batch():
+            store.delete_job(name)
+            store.put_job(name, state)
+    elif report:
+        print(f"{name}: resuming after {state['done']}/{state['total']} songs")
+
+    executor = None
+    if workers > 1:
+        executor = concurrent.futures.ProcessPoolExecutor(workers, initializer = _init_worker,
+                                                          initargs = _worker_initargs())
+    started, processed = time.perf_counter(), 0
+    try:
+        # Units before the checkpoint are skipped (paths that hold many songs are read again)
+        units = itertools.islice(enumerate(_job_units(manifest)), state['done'], None)
+        while True:
+            chunk = list(itertools.islice(units, chunk_size))
+            if not chunk:
+                break
+            _run_job_chunk(name, state, chunk, executor, retries, True)
+            processed += len(chunk)
+            if report:
+                _report_job(name, state, processed, time.perf_counter() - started)
+
+        failures = store.get_job_failures(name)
+        if failures and report:
+            print(f'{name}: retrying {len(failures)} failed songs')
+        for start in range(0, len(failures), chunk_size):
+            chunk = [(failure['unit'], failure['item']) for failure in failures[start:start + chunk_size]]
+            _run_job_chunk(name, state, chunk, executor, retries, False)
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures = True)
+
+    counts = {key : state[key] for key in ['total', 'done', 'saved', 'not_found']}
+    counts['failed'] = store.count_job_failures(name)
+    if report:
+        print(f"{name}: {counts['saved']} songs saved, {counts['not_found']} not found, {counts['failed']} failed "
+              f"(in {time.perf_counter() - started:.1f}s)")
+    return counts
+
+'''
+Turn on caching of word-pair rhyme scores. Scores are kept in memory (up to max_size pairs)
+and in 'pair_scores.db' (located in the LyricEmpiricsStorage directory), so later runs reuse
+the scores of word pairs seen before.
+    max_size  : Maximum number of pairs kept in memory
+    read_only : Only read scores from the file (e.g. when many processes share it)
+'''
+def enable_pair_cache(max_size: int = 1000000, read_only: bool = False) -> None:
+    if max_size <= 0:
+        raise ValueError(f"enable_pair_cache: Parameter max_size must be a positive integer")
+    _dir1.mkdir(exist_ok=True)
+    disable_pair_cache()
+    utility.set_pair_cache(PairCache(max_size, _dir1 / 'pair_scores.db', read_only))
+
+'''
+Turn off caching of word-pair rhyme scores.
+'''
+def disable_pair_cache() -> None:
+    cache = utility.get_pair_cache()
+    if cache is not None:
+        cache.close()
+    utility.set_pair_cache(None)
+
+'''
+Return the counters of the word-pair rhyme score cache (hits, misses, evictions, pairs loaded
+from the file, size, and max size), or None if caching is off.
+'''
+def get_pair_cache_stats() -> {str : int}:
+    cache = utility.get_pair_cache()
+    return None if cache is None else cache.get_stats()
+
+'''
+Turn on caching of search results and lyrics. Searches are cached in 'song_cache.db' (located
+in the LyricEmpiricsStorage directory) by their title and artist, and songs by their Genius.com ID,
+so finding a song again does not use the network.
+    ttl       : Seconds before a cached search/song expires and is searched for again (None = never)
+    max_bytes : Maximum total size of cached lyrics and responses; the least recently used songs
+                are removed first (None = no limit)
+'''
+def enable_song_cache(ttl: float = None, max_bytes: int = None) -> None:
+    global _song_cache
+    _dir1.mkdir(exist_ok=True)
+    disable_song_cache()
+    _song_cache = SongCache(_dir1 / 'song_cache.db', ttl, max_bytes)
+
+'''
+Turn off caching of search results and lyrics.
+'''
+def disable_song_cache() -> None:
+    global _song_cache
+    if _song_cache is not None:
+        _song_cache.close()
+    _song_cache = None
+
+'''
+Return the counters of the song cache (hits, misses, evictions, number of songs, and total size),
+or None if caching is off.
+'''
+def get_song_cache_stats() -> {str : int}:
+    return None if _song_cache is None else _song_cache.get_stats()
 
+'''
+Turn offline mode on/off. In offline mode, songs are only found in the song cache (see
+enable_song_cache()) and the network is never used.
+    offline : If True, turn offline mode on; otherwise, turn it off.
+'''
+def set_offline_mode(offline: bool) -> None:
+    global _offline
+    _offline = offline
+    if _verbose():
+        print(f'Offline mode is now {"ON" if offline else "OFF"}')
+
+'''
+Choose how syllables are counted. By default, counts come from the CMU pronouncing dictionary
+and are estimated only for words that are not in it. Statistics saved by earlier versions used
+estimates for every word; turn CMU counts off to compute comparable values.
+    enabled : True to prefer CMU counts; False to always estimate
+'''
+def use_cmu_syllables(enabled: bool) -> None:
+    utility.set_cmu_syllables(enabled)
+    if _verbose():
+        print(f'CMU syllable counts are now {"ON" if enabled else "OFF"}')
+
+'''
+Turn profiling of song analysis on/off. While it is on, each song records the time spent on
+each of its statistics, the number of word pairs whose rhyme score was computed, pair cache hits,
+and its number of unique words (see Song.get_profile()). Profiles of finished songs are added
+to a collector, whose totals and slowest songs are returned by get_profile_summary().
+    enable       : If True, turn profiling on; otherwise, turn it off
+    callback     : Function also called with (song, profile) for every finished song
+    keep_slowest : Number of slowest songs kept by the collector
+'''
+def profile_songs(enable: bool, callback = None, keep_slowest: int = 10) -> None:
+    global _profile_collector
+    profiling.disable()
+    _profile_collector = None
+    if enable:
+        _profile_collector = profiling.ProfileCollector(keep_slowest)
+        profiling.enable(_profile_collector)
+        if callback is not None:
+            profiling.enable(callback)
+    if _verbose():
+        print(f'Profiling is now {"ON" if enable else "OFF"}')
+
+'''
+Return the totals of the profiles collected since profile_songs() turned profiling on (None if
+it is off): number of songs, seconds per statistic, counters, and the slowest songs.
+'''
+def get_profile_summary() -> dict:
+    return None if _profile_collector is None else _profile_collector.get_summary()
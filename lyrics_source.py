@@ -0,0 +1,152 @@
+# lyrics_source.py
+
+# Streaming readers of local lyrics (files, directories, tar/zip archives, and JSONL dumps)
+
+import pathlib
+import tarfile
+import zipfile
+import gzip
+import json
+
+'''
+Return the (name, artist) of a lyrics file named like the ones written by
+lyric_empirics.save_song() ('Name_Artist.txt').
+    filename : Name of the lyrics file (with or without directories)
+'''
+def _name_and_artist(filename: str) -> (str, str):
+    name, _, artist = pathlib.PurePosixPath(filename).stem.partition('_')
+    return name, artist
+
+'''
+Return the (name, artist, lyrics, ID) of a lyrics file. The ID is None since lyrics files only
+hold the lyrics.
+    path : Path of the lyrics file
+'''
+def read_lyrics_file(path) -> (str, str, str, str):
+    path = pathlib.Path(path)
+    with open(path, 'r', encoding='utf-8', errors='replace') as file:
+        return (*_name_and_artist(path.name), file.read(), None)
+
+'''
+Return the (name, artist, lyrics, ID) of a song record from a JSONL dump, or None if the record
+has no lyrics, name, or artist (or they are not strings). Records use the keys of lyricsgenius'
+Song.to_dict() ('title', 'artist', 'lyrics', 'id'); 'name' and 'primary_artist' (an object with a
+'name') are also accepted.
+    record : Decoded JSON object
+'''
+def _record_source(record: dict) -> (str, str, str, str):
+    if not isinstance(record, dict) or not record.get('lyrics'):
+        return None
+    name = record.get('title', record.get('name'))
+    artist = record.get('artist')
+    if artist is None and isinstance(record.get('primary_artist'), dict):
+        artist = record['primary_artist'].get('name')
+    if not all(isinstance(value, str) for value in [name, artist, record['lyrics']]):
+        return None
+    return name, artist, record['lyrics'], record.get('id')
+
+'''
+Yield the (name, artist, lyrics, ID) of every song in a stream of JSONL lines. Blank lines,
+lines that are not valid JSON, and records without lyrics, name, or artist are skipped.
+    lines : Iterable of text lines
+'''
+def _read_jsonl_lines(lines) -> (str, str, str, str):
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            source = _record_source(json.loads(line))
+        except json.JSONDecodeError:
+            continue
+        if source is not None:
+            yield source
+
+'''
+Return True if a file (or archive member) name is a JSONL dump (.jsonl, .jsonl.gz); False otherwise.
+    filename : File name
+'''
+def _is_jsonl(filename: str) -> bool:
+    return filename.endswith('.jsonl') or filename.endswith('.jsonl.gz')
+
+'''
+Yield the songs in an open binary stream of a lyrics file or JSONL dump (archive member).
+    filename : Name of the file the stream belongs to
+    stream   : Binary stream
+'''
+def _read_stream(filename: str, stream) -> (str, str, str, str):
+    if filename.endswith('.gz'):
+        stream = gzip.GzipFile(fileobj = stream)
+    # Members of streamed tar archives cannot be wrapped in text streams, so bytes are decoded here
+    if _is_jsonl(filename):
+        yield from _read_jsonl_lines(line.decode('utf-8', 'replace') for line in stream)
+    else:
+        yield (*_name_and_artist(filename), stream.read().decode('utf-8', 'replace'), None)
+
+'''
+Yield the (name, artist, lyrics, ID) of every song in a JSONL dump (one JSON object per line,
+optionally gzip-compressed). The dump is read one line at a time.
+    path : Path of the dump
+'''
+def read_jsonl(path) -> (str, str, str, str):
+    path = pathlib.Path(path)
+    opener = gzip.open if path.name.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8', errors='replace') as file:
+        yield from _read_jsonl_lines(file)
+
+'''
+Yield the (name, artist, lyrics, ID) of every lyrics file (.txt) and JSONL dump in a directory
+and its subdirectories, in sorted order within each directory.
+    path : Path of the directory
+'''
+def read_directory(path) -> (str, str, str, str):
+    directories = [pathlib.Path(path)]
+    while directories:
+        directory = directories.pop()
+        entries = sorted(directory.iterdir())
+        for entry in entries:
+            if entry.is_file():
+                if entry.suffix == '.txt':
+                    yield read_lyrics_file(entry)
+                elif _is_jsonl(entry.name):
+                    yield from read_jsonl(entry)
+        # Visit subdirectories in sorted order
+        directories.extend(reversed([entry for entry in entries if entry.is_dir()]))
+
+'''
+Yield the (name, artist, lyrics, ID) of every lyrics file (.txt) and JSONL dump in a tar
+(optionally compressed) or zip archive. Tar archives are read as a stream, one member at a time.
+    path : Path of the archive
+'''
+def read_archive(path) -> (str, str, str, str):
+    path = pathlib.Path(path)
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            for info in archive.infolist():
+                if not info.is_dir() and (info.filename.endswith('.txt') or _is_jsonl(info.filename)):
+                    with archive.open(info) as stream:
+                        yield from _read_stream(info.filename, stream)
+    elif tarfile.is_tarfile(path):
+        with tarfile.open(path, 'r|*') as archive:
+            for member in archive:
+                if member.isfile() and (member.name.endswith('.txt') or _is_jsonl(member.name)):
+                    yield from _read_stream(member.name, archive.extractfile(member))
+    else:
+        raise ValueError(f"read_archive: {path} is not a tar or zip archive")
+
+'''
+Yield the (name, artist, lyrics, ID) of every song at a path, which can be a lyrics file,
+a directory, a tar/zip archive, or a JSONL dump. Songs are read lazily, so memory use does not
+grow with the number of songs.
+    path : Path to read
+'''
+def read_sources(path) -> (str, str, str, str):
+    path = pathlib.Path(path)
+    if path.is_dir():
+        yield from read_directory(path)
+    elif _is_jsonl(path.name):
+        yield from read_jsonl(path)
+    elif path.suffix == '.txt':
+        yield read_lyrics_file(path)
+    else:
+        yield from read_archive(path)
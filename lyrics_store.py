@@ -0,0 +1,264 @@
+# lyrics_store.py
+
+# Packed store of song lyrics (one append-only data file plus an index of songs and offsets)
+
+import sqlite3
+import contextlib
+import hashlib
+import mmap
+import os
+import pathlib
+import zlib
+import utility
+try:
+    import fcntl
+except ImportError:
+    fcntl = None # No file locks (e.g. on Windows): only one process may write to a store at a time
+
+class LyricsStore:
+    '''
+    Initializes a packed lyrics store in a directory. Lyrics are appended to one data file
+    ('lyrics.pack') and addressed by the SHA-256 hash of their text, so identical lyrics are
+    stored once. A SQLite index ('lyrics_index.db') maps each song key (see song_key()) to its
+    ID, name, artist, and lyrics hash, and each hash to its offset and size in the data file.
+    Lyrics are read through a memory map of the data file. Many processes can write to a store:
+    a writer locks the data file from its first change until the change is committed (or rolled
+    back), so the lyrics of different processes are appended one transaction at a time.
+        path     : Directory of the store (created if needed)
+        compress : Compress the lyrics that are added (zlib); stored lyrics can be read either way
+    '''
+    def __init__(self, path, compress: bool = True):
+        self._path = pathlib.Path(path)
+        self._path.mkdir(parents=True, exist_ok=True)
+        self._compress = compress
+        self._db = sqlite3.connect(self._path / 'lyrics_index.db', timeout=30)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('CREATE TABLE IF NOT EXISTS blobs (hash BLOB PRIMARY KEY, offset INTEGER, '
+                         'size INTEGER, compressed INTEGER) WITHOUT ROWID')
+        self._db.execute('CREATE TABLE IF NOT EXISTS songs (key TEXT PRIMARY KEY, id, name TEXT, artist TEXT, hash BLOB)')
+        self._db.commit()
+        self._data = open(self._path / 'lyrics.pack', 'a+b')
+        self._map = None
+        self._batch_depth = 0
+        self._locked = False
+        # Bytes past the last indexed blob can belong to a change of another process that is not
+        # committed yet, so they are only cut off if no other process is writing
+        if self._lock(wait=False):
+            self._truncate()
+            self._unlock()
+
+    '''
+    Lock the data file for the changes of this store (see _unlock), waiting for other writers to
+    commit their changes, and return whether it is locked.
+        wait : If False, return False instead of waiting when another process holds the lock
+    '''
+    def _lock(self, wait: bool = True) -> bool:
+        if not self._locked and fcntl is not None:
+            try:
+                fcntl.flock(self._data.fileno(), fcntl.LOCK_EX if wait else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False
+        self._locked = True
+        return True
+
+    '''
+    Unlock the data file once the changes of this store are committed or rolled back.
+    '''
+    def _unlock(self) -> None:
+        if self._locked and fcntl is not None:
+            fcntl.flock(self._data.fileno(), fcntl.LOCK_UN)
+        self._locked = False
+
+    '''
+    Cut the data file after the last indexed blob (the data file must be locked). Bytes past it
+    were written by a save that was interrupted or rolled back, and are overwritten by the next
+    lyrics added.
+    '''
+    def _truncate(self) -> None:
+        end = self._db.execute('SELECT COALESCE(MAX(offset + size), 0) FROM blobs').fetchone()[0]
+        # The map is closed first, since mapped files cannot be truncated on every platform
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._data.flush()
+        self._data.truncate(end)
+        self._data.seek(end)
+
+    '''
+    Return the key of a song in the store: its Genius.com ID or, for songs without one, the
+    name the lyrics file of the song would have had ('Name_Artist').
+        song_id : Song Genius.com ID (None if unknown)
+        name    : Song name
+        artist  : Song artist
+    '''
+    @staticmethod
+    def song_key(song_id, name: str = None, artist: str = None) -> str:
+        if song_id is not None:
+            return str(song_id)
+        return utility.keep_alphanum(name or '') + '_' + utility.keep_alphanum(artist or '')
+
+    '''
+    Write pending data and commit the index unless a batch is open, then unlock the data file.
+    Data is flushed first so the index never points past the end of the data file.
+    '''
+    def _commit(self) -> None:
+        if self._batch_depth == 0:
+            self._data.flush()
+            self._db.commit()
+            self._unlock()
+
+    '''
+    Add or replace the lyrics of a song.
+        song_id : Song Genius.com ID (None if unknown)
+        name    : Song name
+        artist  : Song artist
+        lyrics  : Song lyrics
+    '''
+    def put(self, song_id, name: str, artist: str, lyrics: str) -> None:
+        self.put_many([(song_id, name, artist, lyrics)])
+
+    '''
+    Add or replace the lyrics of many songs in one transaction.
+        songs : Iterable of (ID, name, artist, lyrics)
+    '''
+    def put_many(self, songs) -> None:
+        # Nothing is added if reading the songs fails
+        with self.batch():
+            # Locked before the index is changed, so writers wait for the lock in the same order
+            self._lock()
+            for song_id, name, artist, lyrics in songs:
+                data = lyrics.encode('utf-8')
+                digest = hashlib.sha256(data).digest()
+                if self._db.execute('SELECT 1 FROM blobs WHERE hash = ?', (digest,)).fetchone() is None:
+                    if self._compress:
+                        data = zlib.compress(data)
+                    # The end of the file, which other processes may have moved since the last write
+                    offset = self._data.seek(0, os.SEEK_END)
+                    self._data.write(data)
+                    self._db.execute('INSERT INTO blobs VALUES (?, ?, ?, ?)', (digest, offset, len(data), int(self._compress)))
+                self._db.execute('INSERT OR REPLACE INTO songs VALUES (?, ?, ?, ?, ?)',
+                                 (self.song_key(song_id, name, artist), song_id, name, artist, digest))
+
+    '''
+    Group the changes made inside a with-block into one transaction, committed at the end of the
+    block. If the block raises an exception (including KeyboardInterrupt), the changes are rolled
+    back instead (by the outermost block if batches are nested) and the lyrics written to the data
+    file since the last commit are cut off. The data file stays locked from the first change in
+    the block until its end, so other processes wait to write to the store.
+    '''
+    @contextlib.contextmanager
+    def batch(self):
+        self._batch_depth += 1
+        try:
+            yield self
+        except BaseException:
+            self._batch_depth -= 1
+            if self._batch_depth == 0:
+                self._db.rollback()
+                if self._locked:
+                    self._truncate()
+                    self._unlock()
+            raise
+        self._batch_depth -= 1
+        self._commit()
+
+    '''
+    Return the bytes of a blob in the data file, mapping the file (again) if the blob lies past
+    the end of the current map.
+        offset : Offset of the blob
+        size   : Size of the blob
+    '''
+    def _read(self, offset: int, size: int) -> memoryview:
+        if self._map is None or offset + size > len(self._map):
+            self._data.flush()
+            if self._map is not None:
+                self._map.close()
+            self._map = mmap.mmap(self._data.fileno(), 0, access=mmap.ACCESS_READ)
+        return memoryview(self._map)[offset:offset + size]
+
+    '''
+    Return the (name, artist, lyrics, ID) of a song, or None if it is not stored.
+        key : Song key (see song_key())
+    '''
+    def get_song(self, key: str) -> (str, str, str, str):
+        row = self._db.execute('SELECT s.name, s.artist, s.id, b.offset, b.size, b.compressed FROM songs s '
+                               'JOIN blobs b ON b.hash = s.hash WHERE s.key = ?', (str(key),)).fetchone()
+        if row is None:
+            return None
+        name, artist, song_id, offset, size, compressed = row
+        if size == 0:
+            return name, artist, '', song_id
+        data = self._read(offset, size)
+        try:
+            lyrics = zlib.decompress(data).decode('utf-8') if compressed else str(data, 'utf-8')
+        finally:
+            data.release()
+        return name, artist, lyrics, song_id
+
+    '''
+    Return the lyrics of a song, or None if it is not stored.
+        key : Song key (see song_key())
+    '''
+    def get(self, key: str) -> str:
+        song = self.get_song(key)
+        return None if song is None else song[2]
+
+    '''
+    Remove a song from the index (its lyrics stay in the data file).
+        key : Song key (see song_key())
+    '''
+    def delete(self, key: str) -> None:
+        self._lock()
+        self._db.execute('DELETE FROM songs WHERE key = ?', (str(key),))
+        self._commit()
+
+    '''
+    Return the keys of all stored songs.
+    '''
+    def keys(self) -> [str]:
+        return [row[0] for row in self._db.execute('SELECT key FROM songs')]
+
+    def __contains__(self, key) -> bool:
+        return self._db.execute('SELECT 1 FROM songs WHERE key = ?', (str(key),)).fetchone() is not None
+
+    def __len__(self) -> int:
+        return self._db.execute('SELECT COUNT(*) FROM songs').fetchone()[0]
+
+    '''
+    Return the number of stored songs, the number of distinct lyrics, and the size of the data file.
+    '''
+    def get_stats(self) -> {str : int}:
+        self._data.flush()
+        return {'songs' : len(self), 'blobs' : self._db.execute('SELECT COUNT(*) FROM blobs').fetchone()[0],
+                'bytes' : self._data.seek(0, os.SEEK_END)}
+
+    '''
+    Add the lyrics files of a directory written by an earlier version of save_song() (one
+    'Name_Artist.txt' file per song). Files found in songs get that song's ID, name, and artist;
+    other files are named after the file and keyed by its name (see song_key()).
+        path  : Directory of lyrics files
+        songs : Dict of file names without '.txt' ('Name_Artist') and (ID, name, artist)
+    Returns the number of files added.
+    '''
+    def import_directory(self, path, songs: {str : (str, str, str)} = None) -> int:
+        songs = songs or dict()
+        count = 0
+        with self.batch():
+            for file in sorted(pathlib.Path(path).glob('*.txt')):
+                name, _, artist = file.stem.partition('_')
+                song_id, name, artist = songs.get(file.stem, (None, name, artist))
+                with open(file, 'r', encoding='utf-8', errors='replace') as lyrics_file:
+                    self.put(song_id, name, artist, lyrics_file.read())
+                count += 1
+        return count
+
+    '''
+    Close the data file and the index.
+    '''
+    def close(self) -> None:
+        self._commit()
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._data.close()
+        self._db.close()
@@ -0,0 +1,592 @@
+# pair_cache.py
+
+# Two-tier cache of word-pair rhyme scores (in-process tier + SQLite file)
+
+import json
+import sqlite3
+import hashlib
+import contextlib
+import itertools
+import pathlib
+import numpy as np
+
+# Largest number of pairs added one at a time (see PairCache.put) that wait in a dict before they
+# are moved into the arrays of the in-process tier and written to the SQLite file
+_RECENT_SIZE = 1024
+# Largest number of chunks of new pairs kept beside the main arrays of the in-process tier
+_MAX_CHUNKS = 16
+# Smallest number of new pairs merged into the main arrays of the in-process tier at once
+_MERGE_SIZE = 65536
+# Number of blocks of the SQLite file of about the same size (the same number of base-4 digits) that
+# a writer combines into one block, so each pair is written again only once per size
+_TIER_BLOCKS = 4
+# Largest number of blocks in the SQLite file (a writer combines all of them when there are more)
+_MAX_BLOCKS = 64
+# Smallest number of words numbered by a cache before the words of evicted pairs are dropped
+_MIN_WORDS = 65536
+# Mask of the lower word number of a pair key
+_LOW = 0xFFFFFFFF
+# Odd multiplier that mixes the hashes of the two words of a pair (see _pair_hashes)
+_MIX = 0x9E3779B97F4A7C15
+
+'''
+Return the position of each key in an array of sorted keys, and whether it was found there.
+    sorted_keys : Sorted array of keys (not empty)
+    keys        : Keys to look up
+'''
+def _search(sorted_keys: np.ndarray, keys: np.ndarray) -> (np.ndarray, np.ndarray):
+    positions = np.minimum(np.searchsorted(sorted_keys, keys), len(sorted_keys) - 1)
+    return positions, sorted_keys[positions] == keys
+
+'''
+Return an array of pair keys with only the last occurrence of each key, sorted (along with the
+matching entries of the other given arrays).
+    keys   : Pair keys
+    arrays : Arrays with one entry per key
+'''
+def _unique_last(keys: np.ndarray, *arrays) -> [np.ndarray]:
+    order = np.argsort(keys, kind='stable')
+    keys = keys[order]
+    last = np.append(keys[1:] != keys[:-1], True)
+    return [keys[last]] + [array[order][last] for array in arrays]
+
+'''
+Return a hash of each word that is the same in every process (unlike the numbers of the words).
+    words : List of words
+'''
+def _word_hashes(words: [str]) -> np.ndarray:
+    return np.fromiter((int.from_bytes(hashlib.blake2b(word.encode('utf-8', 'surrogatepass'), digest_size=8).digest(),
+                                       'little') for word in words), dtype=np.uint64, count=len(words))
+
+'''
+Return a hash of each pair of words that does not depend on the order of its words. Blocks of the
+SQLite file are sorted by these hashes, so pairs can be looked up there without decoding a block.
+    hashes1 : Hash of the first word of each pair (see _word_hashes)
+    hashes2 : Hash of the second word of each pair
+'''
+def _pair_hashes(hashes1: np.ndarray, hashes2: np.ndarray) -> np.ndarray:
+    return (np.minimum(hashes1, hashes2) * np.uint64(_MIX)) ^ np.maximum(hashes1, hashes2)
+
+class PairCache:
+    '''
+    Initializes a cache of word-pair rhyme scores. Each pair of words is stored once with the
+    scores of both orders of its words (the two can differ). Scores are kept in an in-process tier
+    holding at most max_size pairs (the least recently used pairs are dropped when it is full) and,
+    if a path is given, in a SQLite file that survives restarts. Only pairs that score above 0 in
+    either order are written to the file, one block of pairs per batch (or per with-block, see
+    batch), and the in-process tier loads the blocks it has not seen (including those of other
+    processes) before each batch of lookups. Pairs dropped from the in-process tier are looked up
+    in the file again when they are missed. Many processes can share the file by opening it
+    read-only; a read-only cache keeps its new pairs until take_unsaved() hands them to a cache
+    that writes them (see put_block).
+        max_size  : Maximum number of pairs in the in-process tier
+        path      : SQLite file for the on-disk tier (None = in-process tier only)
+        read_only : Only read from the SQLite file (new scores stay in the in-process tier)
+    '''
+    def __init__(self, max_size: int = 1000000, path = None, read_only: bool = False):
+        if max_size <= 0:
+            raise ValueError(f"PairCache: Parameter max_size must be a positive integer")
+        self._max_size = max_size
+        self._path = None if path is None else pathlib.Path(path)
+        self._read_only = read_only
+        # Words are numbered in the order they are first seen, and a pair of words is keyed by
+        # its two numbers (higher number in the upper 32 bits) packed into one integer. The words
+        # are numbered again when pairs are evicted (see _renumber), so the tables stay bounded.
+        self._word_ids = dict()
+        self._words = []
+        # In-process tier: sorted keys, the scores of each pair (lower-numbered word first, then
+        # the reverse order), and when each pair was last used. Pairs added since then are kept
+        # in _chunks (as the same three arrays) and in _recent (key -> scores, see put).
+        self._keys = np.zeros(0, dtype=np.int64)
+        self._scores = np.zeros((0, 2))
+        self._used = np.zeros(0, dtype=np.int64)
+        self._chunks = []
+        self._recent = dict()
+        self._clock = 0
+        self._hits = self._misses = self._evictions = self._loaded = 0
+        self._db = None
+        self._last_block = 0     # Last block of the SQLite file that was loaded
+        self._own_blocks = set() # Blocks written by this cache that are past _last_block
+        self._synced = False
+        self._dropped = False    # Whether pairs were evicted (they can still be in the SQLite file)
+        self._unsaved = []       # Pairs not written to the SQLite file yet, as (keys, values) arrays
+        self._batch_depth = 0
+        if self._path is not None:
+            if read_only:
+                self._db = sqlite3.connect(f'file:{self._path.as_posix()}?mode=ro', uri=True, timeout=30)
+                table = self._db.execute("SELECT sql FROM sqlite_master WHERE name = 'pair_blocks'").fetchone()
+                if table is None or 'hashes' not in table[0]:
+                    # File of an older version (or not written yet): no on-disk tier
+                    self.close()
+            else:
+                self._db = sqlite3.connect(self._path, timeout=30)
+                self._db.execute('PRAGMA journal_mode=WAL')
+                self._db.execute('PRAGMA synchronous=NORMAL')
+                # Older versions kept one row per ordered pair of words, reused the ids of combined
+                # blocks (so readers that sync on the last id they loaded missed the new blocks), or
+                # did not sort blocks by pair hash
+                self._db.execute('DROP TABLE IF EXISTS pair_scores')
+                table = self._db.execute("SELECT sql FROM sqlite_master WHERE name = 'pair_blocks'").fetchone()
+                if table is not None and 'hashes' not in table[0]:
+                    self._db.execute('DROP TABLE pair_blocks')
+                self._db.execute('CREATE TABLE IF NOT EXISTS pair_blocks (id INTEGER PRIMARY KEY AUTOINCREMENT, '
+                                 'size INTEGER, words TEXT, pairs BLOB, scores BLOB, hashes BLOB)')
+                self._db.commit()
+
+    '''
+    Return the number of each word as an array, numbering the words not seen before.
+        words : List of words
+    '''
+    def _ids(self, words: [str]) -> np.ndarray:
+        for word in words:
+            if word not in self._word_ids:
+                self._word_ids[word] = len(self._words)
+                self._words.append(word)
+        return np.fromiter(map(self._word_ids.__getitem__, words), dtype=np.int64, count=len(words))
+
+    '''
+    Return the key of each pair of words (given by number) and whether the words of each pair are
+    in the reverse order of its key.
+        ids1 : Number of the first word of each pair
+        ids2 : Number of the second word of each pair
+    '''
+    @staticmethod
+    def _pair_keys(ids1: np.ndarray, ids2: np.ndarray) -> (np.ndarray, np.ndarray):
+        swapped = ids1 > ids2
+        return (np.where(swapped, ids1, ids2) << 32) | np.where(swapped, ids2, ids1), swapped
+
+    '''
+    Return the cached scores of pairs given by key as an array with one row per key (scores in
+    the order of the key, then in the reverse order; NaN if the pair is not cached).
+        keys : Pair keys
+    '''
+    def _lookup(self, keys: np.ndarray) -> np.ndarray:
+        self._clock += 1
+        values = np.full((len(keys), 2), np.nan)
+        # Pairs of the same word always score 0
+        same = (keys >> 32) == (keys & _LOW)
+        values[same] = 0
+        found = same.copy()
+        for sorted_keys, scores, used in [(self._keys, self._scores, self._used)] + self._chunks:
+            missing = np.flatnonzero(~found)
+            if len(missing) == 0:
+                break
+            if len(sorted_keys) != 0:
+                positions, stored = _search(sorted_keys, keys[missing])
+                rows, positions = missing[stored], positions[stored]
+                values[rows] = scores[positions]
+                used[positions] = self._clock
+                found[rows] = True
+        if self._recent:
+            for k in np.flatnonzero(~found).tolist():
+                entry = self._recent.get(int(keys[k]))
+                if entry is not None:
+                    values[k] = entry
+                    found[k] = True
+        hits = int(found.sum()) - int(same.sum())
+        self._hits += hits
+        self._misses += len(keys) - int(same.sum()) - hits
+        return values
+
+    '''
+    Return the cached scores of pairs given by key like _lookup, looking up the pairs that were
+    missed in the SQLite file if pairs were evicted from the in-process tier (the pairs found there
+    are added back to the in-process tier).
+        keys : Pair keys
+    '''
+    def _find(self, keys: np.ndarray) -> np.ndarray:
+        values = self._lookup(keys)
+        if self._dropped and self._db is not None:
+            missing = np.flatnonzero(np.isnan(values[:, 0]))
+            if len(missing) != 0:
+                stored = self._lookup_file(keys[missing])
+                found = np.flatnonzero(~np.isnan(stored[:, 0]))
+                if len(found) != 0:
+                    values[missing[found]] = stored[found]
+                    self._hits += len(found)
+                    self._misses -= len(found)
+                    self._loaded += len(found)
+                    self._add_chunk(keys[missing[found]], stored[found])
+        return values
+
+    '''
+    Return the scores of pairs given by key that are stored in the SQLite file, as an array with
+    one row per key (scores in the order of the key, then in the reverse order; NaN if the pair is
+    not stored). Only the pair hashes of each block are read, and the pairs found by hash are
+    checked against the words of the block.
+        keys : Pair keys
+    '''
+    def _lookup_file(self, keys: np.ndarray) -> np.ndarray:
+        values = np.full((len(keys), 2), np.nan)
+        ids = np.unique(np.concatenate([keys >> 32, keys & _LOW]))
+        hashes = _word_hashes([self._words[i] for i in ids.tolist()])
+        targets = _pair_hashes(hashes[np.searchsorted(ids, keys & _LOW)], hashes[np.searchsorted(ids, keys >> 32)])
+        # Newer blocks first, as their scores replace those of older blocks
+        for block, block_hashes in self._db.execute('SELECT id, hashes FROM pair_blocks ORDER BY id DESC').fetchall():
+            missing = np.flatnonzero(np.isnan(values[:, 0]))
+            if len(missing) == 0:
+                break
+            positions, stored = _search(np.frombuffer(block_hashes, dtype='<u8'), targets[missing])
+            if not stored.any():
+                continue
+            row = self._db.execute('SELECT words, pairs, scores FROM pair_blocks WHERE id = ?', (block,)).fetchone()
+            if row is None:
+                # Combined into a newer block by another process since the hashes were read
+                continue
+            words = json.loads(row[0])
+            pairs = np.frombuffer(row[1], dtype='<i4').reshape(-1, 2)
+            scores = np.frombuffer(row[2], dtype='<f8').reshape(-1, 2)
+            for k, position in zip(missing[stored].tolist(), positions[stored].tolist()):
+                pair = (words[pairs[position, 0]], words[pairs[position, 1]])
+                key = int(keys[k])
+                if pair == (self._words[key & _LOW], self._words[key >> 32]):
+                    values[k] = scores[position]
+                elif pair == (self._words[key >> 32], self._words[key & _LOW]):
+                    values[k] = scores[position, ::-1]
+        return values
+
+    '''
+    Load the blocks of the SQLite file that the in-process tier has not seen yet.
+    '''
+    def _sync(self) -> None:
+        self._synced = True
+        if self._db is None:
+            return
+        rows = self._db.execute('SELECT id, words, pairs, scores FROM pair_blocks WHERE id > ? ORDER BY id',
+                                (self._last_block,)).fetchall()
+        for block, words, pairs, scores in rows:
+            if block not in self._own_blocks:
+                keys, values = self._read_block(words, pairs, scores)
+                self._loaded += len(keys)
+                self._add_chunk(keys, values)
+            self._last_block = block
+        self._own_blocks = {block for block in self._own_blocks if block > self._last_block}
+
+    '''
+    Return the keys and scores (in the order of the key, then in the reverse order) of the pairs
+    of a block of the SQLite file.
+        words  : JSON list of the words of the block
+        pairs  : Positions in the word list of the two words of each pair (little-endian int32)
+        scores : Scores of each pair in both orders of its words (little-endian float64)
+    '''
+    def _read_block(self, words: str, pairs: bytes, scores: bytes) -> (np.ndarray, np.ndarray):
+        return self._decode(json.loads(words), np.frombuffer(pairs, dtype='<i4').reshape(-1, 2),
+                            np.frombuffer(scores, dtype='<f8').reshape(-1, 2))
+
+    '''
+    Return the keys and scores (in the order of the key, then in the reverse order) of pairs given
+    as a block (see _encode).
+        words  : Words of the block
+        pairs  : Positions in words of the two words of each pair
+        scores : Scores of each pair (first word first, then the reverse order)
+    '''
+    def _decode(self, words: [str], pairs: np.ndarray, scores: np.ndarray) -> (np.ndarray, np.ndarray):
+        ids = self._ids(words)
+        scores = np.asarray(scores, dtype=float)
+        keys, swapped = self._pair_keys(ids[pairs[:, 0]], ids[pairs[:, 1]])
+        return keys, np.where(swapped[:, None], scores[:, ::-1], scores)
+
+    '''
+    Return pairs as a block that does not depend on the numbering of words in this process: the
+    words of the pairs, the positions in that list of the two words of each pair, and the scores of
+    each pair.
+        keys   : Pair keys
+        values : Scores of each pair (in the order of the key, then in the reverse order)
+    '''
+    def _encode(self, keys: np.ndarray, values: np.ndarray) -> ([str], np.ndarray, np.ndarray):
+        ids = np.unique(np.concatenate([keys >> 32, keys & _LOW]))
+        # Columns of the pairs follow the key (lower-numbered word first), like the scores
+        pairs = np.column_stack([np.searchsorted(ids, keys & _LOW), np.searchsorted(ids, keys >> 32)])
+        return [self._words[i] for i in ids.tolist()], pairs.astype('<i4'), values.astype('<f8')
+
+    '''
+    Add pairs to the SQLite file as one block sorted by pair hash (pairs that score 0 in both
+    orders are left out), and return the id of the block (None if no pair was left). Block ids are
+    never reused, so a block added after another one (including a combined block) has a higher id.
+        keys   : Pair keys
+        values : Scores of each pair (in the order of the key, then in the reverse order)
+    '''
+    def _insert_block(self, keys: np.ndarray, values: np.ndarray) -> int:
+        nonzero = (values != 0).any(axis=1)
+        keys, values = keys[nonzero], values[nonzero]
+        if len(keys) == 0:
+            return None
+        words, pairs, scores = self._encode(keys, values)
+        word_hashes = _word_hashes(words)
+        hashes = _pair_hashes(word_hashes[pairs[:, 0]], word_hashes[pairs[:, 1]])
+        order = np.argsort(hashes, kind='stable')
+        cursor = self._db.execute('INSERT INTO pair_blocks (size, words, pairs, scores, hashes) VALUES (?, ?, ?, ?, ?)',
+                                  (len(keys), json.dumps(words), pairs[order].tobytes(), scores[order].tobytes(),
+                                   hashes[order].astype('<u8').tobytes()))
+        return cursor.lastrowid
+
+    '''
+    Write the pairs not written yet to the SQLite file as one block, and combine blocks of about
+    the same size (see _compact_blocks) in the same transaction.
+    '''
+    def _write_unsaved(self) -> None:
+        if not self._unsaved:
+            return
+        keys, values = _unique_last(np.concatenate([part[0] for part in self._unsaved]),
+                                    np.concatenate([part[1] for part in self._unsaved]))
+        self._unsaved = []
+        block = self._insert_block(keys, values)
+        if block is not None:
+            self._own_blocks.add(block)
+            self._compact_blocks()
+        self._db.commit()
+
+    '''
+    Combine the blocks of the SQLite file while _TIER_BLOCKS of them have about the same size (or
+    there are more than _MAX_BLOCKS blocks). Combined blocks grow by a factor of about 4 each time,
+    so the file is loaded from a few blocks per size and each pair is written a few times in all.
+    '''
+    def _compact_blocks(self) -> None:
+        while True:
+            rows = self._db.execute('SELECT id, size FROM pair_blocks ORDER BY size, id').fetchall()
+            tiers = [[block for block, _ in tier] for _, tier in
+                     itertools.groupby(rows, lambda row: (row[1].bit_length() + 1) // 2)]
+            full = [tier for tier in tiers if len(tier) >= _TIER_BLOCKS]
+            if full:
+                self._combine_blocks(full[0])
+            elif len(rows) > _MAX_BLOCKS:
+                self._combine_blocks([block for block, _ in rows])
+            else:
+                return
+
+    '''
+    Replace blocks of the SQLite file by one block with their pairs (the scores of newer blocks
+    replace those of older ones).
+        blocks : Ids of the blocks
+    '''
+    def _combine_blocks(self, blocks: [int]) -> None:
+        blocks = sorted(blocks)
+        marks = ', '.join('?' * len(blocks))
+        rows = self._db.execute(f'SELECT words, pairs, scores FROM pair_blocks WHERE id IN ({marks}) ORDER BY id',
+                                blocks).fetchall()
+        parts = [self._read_block(words, pairs, scores) for words, pairs, scores in rows]
+        keys, values = _unique_last(np.concatenate([part[0] for part in parts]),
+                                    np.concatenate([part[1] for part in parts]))
+        self._db.execute(f'DELETE FROM pair_blocks WHERE id IN ({marks})', blocks)
+        block = self._insert_block(keys, values)
+        # The combined block can hold pairs of blocks (of other processes) this cache has not loaded
+        if all(old <= self._last_block or old in self._own_blocks for old in blocks):
+            self._own_blocks.add(block)
+
+    '''
+    Add a chunk of pairs to the in-process tier, merging the chunks into the main arrays when there
+    are many of them or the tier is full.
+        keys   : Pair keys
+        values : Scores of each pair (in the order of the key, then in the reverse order)
+    '''
+    def _add_chunk(self, keys: np.ndarray, values: np.ndarray) -> None:
+        if len(keys) == 0:
+            return
+        keys, values = _unique_last(keys, values)
+        self._chunks.append((keys, values, np.full(len(keys), self._clock, dtype=np.int64)))
+        pending = sum(len(chunk[0]) for chunk in self._chunks)
+        if len(self._chunks) > _MAX_CHUNKS or pending > max(_MERGE_SIZE, len(self._keys) // 4) or \
+                len(self._keys) + pending > self._max_size:
+            self._merge()
+
+    '''
+    Merge the chunks of new pairs into the main arrays of the in-process tier. If there are more
+    than max_size pairs, the least recently used pairs are dropped (down to 7/8 of max_size, so
+    the arrays are not rebuilt for every new chunk).
+    '''
+    def _merge(self) -> None:
+        parts = [(self._keys, self._scores, self._used)] + self._chunks
+        self._chunks = []
+        keys, scores, used = _unique_last(np.concatenate([part[0] for part in parts]),
+                                          np.concatenate([part[1] for part in parts]),
+                                          np.concatenate([part[2] for part in parts]))
+        if len(keys) > self._max_size:
+            size = max(1, self._max_size - self._max_size // 8)
+            kept = np.sort(np.argpartition(used, len(used) - size)[len(used) - size:])
+            self._evictions += len(keys) - size
+            self._dropped = True
+            keys, scores, used = keys[kept], scores[kept], used[kept]
+        self._keys, self._scores, self._used = keys, scores, used
+        if self._dropped:
+            self._renumber()
+
+    '''
+    Number the words again if most of the numbered words are no longer part of a pair of the
+    in-process tier (or of a pair not written yet), dropping the other words. Numbers keep their
+    order, so the keys stay sorted.
+    '''
+    def _renumber(self) -> None:
+        recent = np.fromiter(self._recent, dtype=np.int64, count=len(self._recent))
+        parts = [self._keys, recent] + [chunk[0] for chunk in self._chunks] + [part[0] for part in self._unsaved]
+        ids = np.unique(np.concatenate([part >> 32 for part in parts] + [part & _LOW for part in parts]))
+        if len(self._words) <= max(_MIN_WORDS, 2 * len(ids)):
+            return
+        numbers = np.full(len(self._words), -1, dtype=np.int64)
+        numbers[ids] = np.arange(len(ids))
+        renumber = lambda keys: (numbers[keys >> 32] << 32) | numbers[keys & _LOW]
+        self._keys = renumber(self._keys)
+        self._chunks = [(renumber(keys), scores, used) for keys, scores, used in self._chunks]
+        self._unsaved = [(renumber(keys), values) for keys, values in self._unsaved]
+        self._recent = dict(zip(renumber(recent).tolist(), self._recent.values()))
+        self._words = [self._words[i] for i in ids.tolist()]
+        self._word_ids = {word: i for i, word in enumerate(self._words)}
+
+    '''
+    Move the pairs added one at a time into the arrays of the in-process tier and the SQLite file.
+    '''
+    def _flush_recent(self) -> None:
+        if self._recent:
+            keys = np.fromiter(self._recent, dtype=np.int64, count=len(self._recent))
+            values = np.array(list(self._recent.values()), dtype=float)
+            self._recent = dict()
+            self._store(keys, values)
+
+    '''
+    Add pairs to the in-process tier and the SQLite file. The pairs that score above 0 in either
+    order are written at the end of the outermost batch (see batch), or right away outside of
+    one; a read-only cache keeps them for take_unsaved instead.
+        keys   : Pair keys (of pairs of different words)
+        values : Scores of each pair (in the order of the key, then in the reverse order)
+    '''
+    def _store(self, keys: np.ndarray, values: np.ndarray) -> None:
+        if self._read_only or self._db is not None:
+            nonzero = (values != 0).any(axis=1)
+            if nonzero.any():
+                self._unsaved.append((keys[nonzero], values[nonzero]))
+            if not self._read_only and self._batch_depth == 0:
+                self._write_unsaved()
+        # Added last, since a merge can number the words again (see _renumber)
+        self._add_chunk(keys, values)
+
+    '''
+    Return the cached score of a pair of words, or None if it is not cached.
+        word1 : First word
+        word2 : Second word
+    '''
+    def get(self, word1: str, word2: str) -> float:
+        if not self._synced:
+            self._sync()
+        keys, swapped = self._pair_keys(*self._ids([word1, word2]).reshape(2, 1))
+        values = self._find(keys)[0]
+        score = values[1] if swapped[0] else values[0]
+        return None if np.isnan(score) else float(score)
+
+    '''
+    Return the cached scores of many pairs of words, and of the same pairs in reverse order, as
+    two arrays (NaN for pairs that are not cached). Pair k is (words[first[k]], words[second[k]]).
+        words  : List of words
+        first  : Position in words of the first word of each pair
+        second : Position in words of the second word of each pair
+    '''
+    def get_scores(self, words: [str], first: np.ndarray, second: np.ndarray) -> (np.ndarray, np.ndarray):
+        self._sync()
+        ids = self._ids(words)
+        keys, swapped = self._pair_keys(ids[first], ids[second])
+        values = self._find(keys)
+        return np.where(swapped, values[:, 1], values[:, 0]), np.where(swapped, values[:, 0], values[:, 1])
+
+    '''
+    Add the scores of a pair of words (in both orders) to the cache. Pairs added one at a time
+    are kept aside and written together, so each one does not write a block to the SQLite file.
+        word1         : First word
+        word2         : Second word
+        score         : Rhyme score of (word1, word2)
+        reverse_score : Rhyme score of (word2, word1)
+    '''
+    def put(self, word1: str, word2: str, score: float, reverse_score: float) -> None:
+        if word1 == word2:
+            return
+        keys, swapped = self._pair_keys(*self._ids([word1, word2]).reshape(2, 1))
+        self._recent[int(keys[0])] = (reverse_score, score) if swapped[0] else (score, reverse_score)
+        if len(self._recent) >= _RECENT_SIZE:
+            self._flush_recent()
+
+    '''
+    Add the scores of many pairs of words (in both orders) to the cache in one batch. Pair k is
+    (words[first[k]], words[second[k]]).
+        words          : List of words
+        first          : Position in words of the first word of each pair
+        second         : Position in words of the second word of each pair
+        scores         : Rhyme score of each pair
+        reverse_scores : Rhyme score of each pair in reverse order
+    '''
+    def put_scores(self, words: [str], first: np.ndarray, second: np.ndarray, scores: np.ndarray,
+                   reverse_scores: np.ndarray) -> None:
+        ids = self._ids(words)
+        keys, swapped = self._pair_keys(ids[first], ids[second])
+        values = np.column_stack([np.where(swapped, reverse_scores, scores), np.where(swapped, scores, reverse_scores)])
+        different = (keys >> 32) != (keys & _LOW)
+        self._store(keys[different], values[different].astype(float))
+
+    '''
+    Return the pairs added to a read-only cache that score above 0 in either order, as a block
+    that can be passed to put_block() of another cache (e.g. in another process): the words of
+    the pairs, the positions in that list of the two words of each pair, and the scores of each
+    pair in both orders. The pairs are not returned again by later calls.
+    '''
+    def take_unsaved(self) -> ([str], np.ndarray, np.ndarray):
+        self._flush_recent()
+        unsaved, self._unsaved = self._unsaved, []
+        if not unsaved:
+            return [], np.zeros((0, 2), dtype='<i4'), np.zeros((0, 2), dtype='<f8')
+        return self._encode(*_unique_last(np.concatenate([part[0] for part in unsaved]),
+                                          np.concatenate([part[1] for part in unsaved])))
+
+    '''
+    Add a block of pairs returned by take_unsaved() of another cache.
+        words  : Words of the pairs
+        pairs  : Positions in words of the two words of each pair
+        scores : Scores of each pair (first word first, then the reverse order)
+    '''
+    def put_block(self, words: [str], pairs: np.ndarray, scores: np.ndarray) -> None:
+        if len(pairs) != 0:
+            self._store(*self._decode(words, pairs, scores))
+
+    '''
+    Write the pairs added inside a with-block to the SQLite file as one block, in one transaction
+    at the end of the block, instead of one block (and commit) per batch of pairs. If batches are
+    nested, the outermost block writes the pairs; they are written even if the block raises an
+    exception, since the cached scores are correct either way.
+    '''
+    @contextlib.contextmanager
+    def batch(self):
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if self._batch_depth == 0 and self._db is not None and not self._read_only:
+                self._write_unsaved()
+
+    '''
+    Return the SQLite file of the on-disk tier (None if there is no on-disk tier).
+    '''
+    def get_path(self) -> pathlib.Path:
+        return self._path
+
+    '''
+    Return the cache counters: hits, misses, evictions from the in-process tier, pairs loaded
+    from the SQLite file (including evicted pairs found there), and the number of pairs in the
+    in-process tier.
+    '''
+    def get_stats(self) -> {str : int}:
+        size = len(self._keys) + sum(len(chunk[0]) for chunk in self._chunks) + len(self._recent)
+        return {'hits' : self._hits, 'misses' : self._misses, 'evictions' : self._evictions,
+                'loaded' : self._loaded, 'size' : size, 'max_size' : self._max_size}
+
+    '''
+    Reset the hit, miss, eviction, and load counters.
+    '''
+    def reset_stats(self) -> None:
+        self._hits = self._misses = self._evictions = self._loaded = 0
+
+    '''
+    Write the pairs not written yet and close the SQLite file (the in-process tier stays usable).
+    '''
+    def close(self) -> None:
+        if self._db is not None:
+            if not self._read_only:
+                self._flush_recent()
+                self._write_unsaved()
+            self._db.close()
+            self._db = None
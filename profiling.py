@@ -0,0 +1,111 @@
+# profiling.py
+
+# Optional instrumentation of song analysis (time per statistic, rhyme pairs scored, cache hits)
+
+import heapq
+
+_enabled = False # If True, songs record a profile while their statistics are computed
+_callbacks = [] # Functions called with (song, profile) when a song's statistics are finished
+_records = [] # Profiles being filled (the last one belongs to the song being computed)
+
+'''
+Turn profiling on. While it is on, every song records how long each of its statistics took to
+compute (excluding the statistics it depends on) and counters such as the number of word pairs
+whose rhyme score was computed. When profiling is off, the only cost is checking a flag.
+    callback : Function called with (song, profile) when a song's statistics are finished
+               (None = only record profiles on songs)
+'''
+def enable(callback = None) -> None:
+    global _enabled
+    _enabled = True
+    if callback is not None and callback not in _callbacks:
+        _callbacks.append(callback)
+
+'''
+Turn profiling off and remove all callbacks.
+'''
+def disable() -> None:
+    global _enabled
+    _enabled = False
+    _callbacks.clear()
+
+'''
+Return True if profiling is on; False otherwise.
+'''
+def is_enabled() -> bool:
+    return _enabled
+
+'''
+Return a new, empty profile.
+'''
+def new_record() -> dict:
+    return {'stages' : dict(), 'counts' : dict(), 'total_seconds' : 0.0, 'reported' : False}
+
+'''
+Make a profile the one counters are added to, until end_record() is called.
+    record : Profile of the song being computed
+'''
+def start_record(record: dict) -> None:
+    _records.append(record)
+
+'''
+Stop adding counters to the current profile.
+'''
+def end_record() -> None:
+    _records.pop()
+
+'''
+Add to a counter of the profile of the song being computed (does nothing if there is none).
+    name   : Counter name
+    amount : Amount to add
+'''
+def count(name: str, amount: int = 1) -> None:
+    if _records:
+        counts = _records[-1]['counts']
+        counts[name] = counts.get(name, 0) + amount
+
+'''
+Pass a finished song and its profile to the callbacks.
+    song    : Song whose statistics are finished
+    profile : Profile of the song
+'''
+def emit(song, profile: dict) -> None:
+    for callback in _callbacks:
+        callback(song, profile)
+
+class ProfileCollector:
+    '''
+    Initializes a collector of song profiles, which can be passed to enable() as the callback.
+    It keeps totals over all songs and the slowest songs.
+        keep_slowest : Number of slowest songs to keep
+    '''
+    def __init__(self, keep_slowest: int = 10):
+        self._keep_slowest = keep_slowest
+        self._songs = 0
+        self._seconds = 0.0
+        self._stages = dict() # Statistic -> total seconds
+        self._counts = dict() # Counter -> total
+        self._slowest = [] # Heap of (seconds, order, song name, artist, profile)
+
+    def __call__(self, song, profile: dict) -> None:
+        self._songs += 1
+        self._seconds += profile['total_seconds']
+        for name, seconds in profile['stages'].items():
+            self._stages[name] = self._stages.get(name, 0.0) + seconds
+        for name, amount in profile['counts'].items():
+            self._counts[name] = self._counts.get(name, 0) + amount
+        entry = (profile['total_seconds'], self._songs, song.get_name(), song.get_artist(), profile)
+        if len(self._slowest) < self._keep_slowest:
+            heapq.heappush(self._slowest, entry)
+        elif self._keep_slowest > 0:
+            heapq.heappushpop(self._slowest, entry)
+
+    '''
+    Return the totals over all songs: number of songs, total seconds, seconds per statistic
+    (slowest first), counters, and the slowest songs as (name, artist, profile), slowest first.
+    '''
+    def get_summary(self) -> dict:
+        return {'songs' : self._songs, 'total_seconds' : self._seconds,
+                'stages' : dict(sorted(self._stages.items(), key = lambda item: -item[1])),
+                'counts' : dict(self._counts),
+                'slowest' : [(name, artist, profile) for _, _, name, artist, profile in sorted(self._slowest, reverse=True)]}
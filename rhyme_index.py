@@ -0,0 +1,248 @@
+# rhyme_index.py
+
+# Precomputed phoneme index used for rhyme scoring
+
+import array
+import hashlib
+import io
+import pathlib
+import pickle
+import os
+
+_INDEX_VERSION = 3
+# Start of a saved index, followed by the version (2 bytes) and the SHA-256 digest of the pickled state
+_MAGIC = b'LyricEmpirics rhyme index\n'
+# Classes a saved index may contain (anything else is refused by load())
+_SAFE_CLASSES = {('array', 'array'), ('array', '_array_reconstructor')}
+# Value of _index_path for the default file (see get_default_index_path())
+_DEFAULT_PATH = 'default'
+
+_index = None # Index shared by the whole process
+_index_path = _DEFAULT_PATH # File the index is loaded from/saved to (None = never persisted)
+
+class _IndexUnpickler(pickle.Unpickler):
+    '''
+    Initializes an unpickler of saved indexes, which only creates the classes of _SAFE_CLASSES.
+        file : Binary file to read
+    '''
+    def find_class(self, module: str, name: str):
+        if (module, name) not in _SAFE_CLASSES:
+            raise pickle.UnpicklingError(f'{module}.{name} is not allowed in a rhyme index')
+        return super().find_class(module, name)
+
+class RhymeIndex:
+    '''
+    Initializes a rhyme index from the CMU pronouncing dictionary. For every word, the index
+    holds its pronunciations as tuples of stress-stripped phoneme codes, each paired with the
+    length of its original CMU text (rhyme scoring orders pronunciations by that length), and
+    the ids of its rhyming parts (as defined by pronouncing.rhyming_part). Pronunciations are
+    kept in flat arrays (one byte per phoneme) so the index is small and quick to load, and are
+    decoded the first time a word is looked up.
+    '''
+    def __init__(self):
+        import pronouncing # Only needed to build the index (a saved index is loaded without it)
+        pronouncing.init_cmu()
+        self._codes = dict()          # stress-stripped phoneme -> integer code (starting at 1)
+        self._vowels = set()          # codes of phonemes that contain a vowel
+        self._positions = dict()      # word -> position of its first pronunciation (in order of words)
+        self._pron_starts = array.array('I', [0]) # position of each word's first pronunciation (plus the end)
+        self._phoneme_starts = array.array('I', [0]) # offset of each pronunciation's codes (plus the end)
+        self._phonemes = bytearray()  # codes of all pronunciations, one after the other
+        self._lengths = array.array('H') # CMU text length of each pronunciation
+        self._parts = array.array('I') # rhyming part id of each pronunciation
+
+        part_ids = dict()
+        pronunciations = dict()
+        for word, pronunciation in pronouncing.pronunciations:
+            pronunciations.setdefault(word, []).append(pronunciation)
+        for word, word_pronunciations in pronunciations.items():
+            self._positions[word] = len(self._pron_starts) - 1
+            for pronunciation in word_pronunciations:
+                self._phonemes.extend(self._code(''.join([x for x in phoneme if x.isalpha()]))
+                                      for phoneme in pronunciation.split())
+                self._phoneme_starts.append(len(self._phonemes))
+                self._lengths.append(len(pronunciation))
+                part = pronouncing.rhyming_part(pronunciation)
+                self._parts.append(part_ids.setdefault(part, len(part_ids)))
+            self._pron_starts.append(len(self._lengths))
+        self._phonemes = bytes(self._phonemes)
+        self._decoded = dict() # word -> (pronunciations, rhyming part ids) of the words looked up
+
+    '''
+    Return the integer code of a stress-stripped phoneme, assigning a new one if needed.
+        phoneme : Phoneme without stress numbers
+    '''
+    def _code(self, phoneme: str) -> int:
+        code = self._codes.get(phoneme)
+        if code is None:
+            code = self._codes[phoneme] = len(self._codes) + 1
+            if code > 255:
+                raise ValueError(f"RhymeIndex: More than 255 distinct phonemes")
+            if any(vowel in phoneme.upper() for vowel in 'AEIOU'):
+                self._vowels.add(code)
+        return code
+
+    '''
+    Return the pronunciations and rhyming part ids of a word (decoded from the flat arrays on
+    first lookup), or None if the word is not in the dictionary.
+        word : Word to look up (case-sensitive)
+    '''
+    def _entry(self, word: str) -> ((((int,), int),), frozenset):
+        entry = self._decoded.get(word)
+        if entry is None:
+            position = self._positions.get(word)
+            if position is None:
+                return None
+            prons = range(self._pron_starts[position], self._pron_starts[position + 1])
+            phones = tuple((tuple(self._phonemes[self._phoneme_starts[p]:self._phoneme_starts[p + 1]]), self._lengths[p])
+                           for p in prons)
+            entry = self._decoded[word] = (phones, frozenset(self._parts[p] for p in prons))
+        return entry
+
+    '''
+    Return True if word is a key of the CMU dictionary (case-sensitive); False otherwise.
+        word : Word to look up
+    '''
+    def has_word(self, word: str) -> bool:
+        return word in self._positions
+
+    '''
+    Return all pronunciations of a word as (tuple of stress-stripped phoneme codes,
+    CMU text length) pairs.
+        word : Word to look up (case-insensitive)
+    '''
+    def phones(self, word: str) -> (((int,), int),):
+        entry = self._entry(word.lower())
+        return () if entry is None else entry[0]
+
+    '''
+    Return the set of rhyming part ids of a word.
+        word : Word to look up (case-insensitive)
+    '''
+    def rhyming_parts(self, word: str) -> frozenset:
+        entry = self._entry(word.lower())
+        return frozenset() if entry is None else entry[1]
+
+    '''
+    Return the number of syllables of a word (vowel phonemes of its first CMU pronunciation),
+    or None if the word is not in the dictionary.
+        word : Word to look up (case-insensitive)
+    '''
+    def syllable_count(self, word: str) -> int:
+        phones = self.phones(word)
+        if not phones:
+            return None
+        count = 0
+        for code in phones[0][0]:
+            if code == self._codes.get(''): # '#' starts a comment in some CMU entries
+                break
+            count += code in self._vowels
+        return count
+
+    '''
+    Return True if the phoneme with the given code contains a vowel; False otherwise.
+        code : Phoneme code
+    '''
+    def is_vowel(self, code: int) -> bool:
+        return code in self._vowels
+
+    '''
+    Return the mapping of stress-stripped phonemes to their integer codes.
+    '''
+    def get_codes(self) -> {str : int}:
+        return self._codes
+
+    '''
+    Save the index to a file. The file is written to a temporary path first so that other
+    processes never load a partially written index. Words that were looked up are not saved
+    decoded.
+        path : File to save the index to (its directory is created if needed)
+    '''
+    def save(self, path) -> None:
+        path = pathlib.Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = path.with_name(path.name + f'.{os.getpid()}.tmp')
+        state = {name : value for name, value in self.__dict__.items() if name != '_decoded'}
+        data = pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL)
+        with open(temp_path, 'wb') as file:
+            file.write(_MAGIC + _INDEX_VERSION.to_bytes(2, 'little') + hashlib.sha256(data).digest())
+            file.write(data)
+        os.replace(temp_path, path)
+
+    '''
+    Return the index stored in a file, or None if the file is missing, was written by an
+    incompatible version, or was not written by save() (its header or digest does not match, or
+    it holds objects an index does not have). Files are checked before being unpickled.
+        path : File to load the index from
+    '''
+    @staticmethod
+    def load(path) -> 'RhymeIndex':
+        try:
+            with open(path, 'rb') as file:
+                data = file.read()
+        except OSError:
+            return None
+        header = _MAGIC + _INDEX_VERSION.to_bytes(2, 'little')
+        if data[:len(header)] != header:
+            return None
+        digest, data = data[len(header):len(header) + 32], data[len(header) + 32:]
+        if hashlib.sha256(data).digest() != digest:
+            return None
+        try:
+            state = _IndexUnpickler(io.BytesIO(data)).load()
+        except (pickle.UnpicklingError, EOFError, ValueError, TypeError):
+            return None
+        index = RhymeIndex.__new__(RhymeIndex)
+        index.__dict__.update(state)
+        index._decoded = dict()
+        return index
+
+'''
+Return the default file of the process-wide index: 'rhyme_index.pkl' in the directory named by
+the LYRIC_EMPIRICS_CACHE environment variable or, if it is not set, in a 'lyric_empirics'
+directory of the user's cache directory ($XDG_CACHE_HOME or ~/.cache; %LOCALAPPDATA% on Windows).
+The environment is read on every call, so the file is never resolved at import time.
+'''
+def get_default_index_path() -> pathlib.Path:
+    directory = os.environ.get('LYRIC_EMPIRICS_CACHE')
+    if not directory:
+        if os.name == 'nt':
+            cache = os.environ.get('LOCALAPPDATA') or pathlib.Path.home() / 'AppData' / 'Local'
+        else:
+            cache = os.environ.get('XDG_CACHE_HOME') or pathlib.Path.home() / '.cache'
+        directory = pathlib.Path(cache) / 'lyric_empirics'
+    return pathlib.Path(directory) / 'rhyme_index.pkl'
+
+'''
+Set the file the process-wide index is loaded from (and saved to after being built).
+Worker processes should be given the same path so they load the index instead of building it.
+    path : Index file, None to keep the index in memory only, or 'default' for the default file
+           (see get_default_index_path())
+'''
+def set_index_path(path) -> None:
+    global _index_path
+    _index_path = path if path in [None, _DEFAULT_PATH] else pathlib.Path(path)
+
+'''
+Return the file the process-wide index is loaded from (None if it is kept in memory only).
+'''
+def get_index_path() -> pathlib.Path:
+    return get_default_index_path() if _index_path == _DEFAULT_PATH else _index_path
+
+'''
+Return the process-wide rhyme index, loading or building it on first use.
+'''
+def get_index() -> RhymeIndex:
+    global _index
+    if _index is None:
+        path = get_index_path()
+        if path is not None:
+            _index = RhymeIndex.load(path)
+        if _index is None:
+            _index = RhymeIndex()
+            if path is not None:
+                try:
+                    _index.save(path)
+                except OSError:
+                    pass # Index still works in memory if it cannot be persisted
+    return _index
@@ -0,0 +1,347 @@
+# rhyme_matrix.py
+
+# Batched rhyme scoring: computes utility.pair_rhyme_score for every pair of words at once
+
+import numpy as np
+import rhyme_index
+import profiling
+
+class _Pronunciations:
+    '''
+    Encodes all pronunciations of a list of words as integer phoneme arrays. Pronunciations are
+    stored right-aligned (padded on the left with 0, which is not a phoneme code) so that the
+    ending of every pronunciation is in the same columns. A word's pronunciations are stored
+    together, in the order of the index.
+        words : Words to encode
+        index : Rhyme index to look pronunciations up in
+        width : Minimum number of columns (so pronunciations of two word lists can be compared)
+    '''
+    def __init__(self, words: [str], index: rhyme_index.RhymeIndex, width: int = 2):
+        rows = []
+        word_ids = [] # position in words of each pronunciation's word
+        lengths = []  # length of each pronunciation's CMU text
+        for w, word in enumerate(words):
+            for phonemes, length in index.phones(word):
+                rows.append(phonemes)
+                word_ids.append(w)
+                lengths.append(length)
+
+        width = max([width] + [len(phonemes) for phonemes in rows])
+        self.codes = np.zeros((len(rows), width), dtype=np.int32)
+        for k, phonemes in enumerate(rows):
+            self.codes[k, width - len(phonemes):] = phonemes
+        self.sizes = np.array([len(phonemes) for phonemes in rows], dtype=np.int64)
+        self.lengths = np.array(lengths, dtype=np.int64)
+        self.word_ids = np.array(word_ids, dtype=np.int64)
+        # Number of pronunciations of each word and where they start
+        self.counts = np.bincount(self.word_ids, minlength=len(words))
+        self.starts = np.cumsum(self.counts) - self.counts
+
+'''
+Return the distance from the end of each row of phoneme codes to its last "vowel" phoneme
+(1 = ending phoneme; more than the width if there is none).
+    codes  : Right-aligned phoneme codes (one pronunciation per row)
+    vowels : Table of which phoneme codes contain a vowel
+'''
+def _last_vowels(codes: np.ndarray, vowels: np.ndarray) -> np.ndarray:
+    is_vowel = vowels[codes]
+    return np.where(is_vowel.any(axis=1), np.argmax(is_vowel[:, ::-1], axis=1) + 1, codes.shape[1] + 1)
+
+'''
+Return every pair (i, j) such that query_keys[i] == indexed_keys[j], as two arrays.
+    query_keys   : Keys to look up
+    indexed_keys : Keys to look them up in
+'''
+def _join(query_keys: np.ndarray, indexed_keys: np.ndarray) -> (np.ndarray, np.ndarray):
+    order = np.argsort(indexed_keys, kind='stable')
+    sorted_keys = indexed_keys[order]
+    low = np.searchsorted(sorted_keys, query_keys, 'left')
+    counts = np.searchsorted(sorted_keys, query_keys, 'right') - low
+    queries = np.repeat(np.arange(len(query_keys)), counts)
+    offsets = np.arange(len(queries)) - np.repeat(np.cumsum(counts) - counts, counts)
+    return queries, order[np.repeat(low, counts) + offsets]
+
+'''
+Return integer keys for two arrays of phoneme sequences (one sequence per row, all of the same
+length), equal exactly when the sequences are equal.
+    sequences1 : First array of sequences
+    sequences2 : Second array of sequences
+    base       : Number larger than every phoneme code
+'''
+def _sequence_keys(sequences1: np.ndarray, sequences2: np.ndarray, base: int) -> (np.ndarray, np.ndarray):
+    length = sequences1.shape[1]
+    if base ** length < 2 ** 62:
+        powers = base ** np.arange(length - 1, -1, -1, dtype=np.int64)
+        return sequences1.astype(np.int64) @ powers, sequences2.astype(np.int64) @ powers
+    # Sequences too long to be packed into one number get the ids of the distinct sequences
+    _, ids = np.unique(np.concatenate([sequences1, sequences2]), axis=0, return_inverse=True)
+    ids = ids.reshape(-1)
+    return ids[:len(sequences1)], ids[len(sequences1):]
+
+'''
+Return the pairs of pronunciations (rows of query and indexed) that share a bucket, as two
+arrays. Each pronunciation of query is put in one bucket, chosen so that every pair of
+pronunciations that can score above 0 in utility.pair_rhyme_score shares it (when the query
+pronunciation is phonemes1):
+- 1 or 2 phonemes ending in a "vowel" phoneme: the pronunciations with the same ending phoneme
+- 2 phonemes ending in another phoneme: the pronunciations with the same ending 2 phonemes
+- 3 or more phonemes: the pronunciations that contain its shortest ending of 2 or more phonemes
+  with a "vowel" phoneme (every ending that scores contains that ending), if that ending is
+  not longer than the longest ending that is checked
+Pairs may be returned more than once.
+    query   : Pronunciations used as phonemes1
+    indexed : Pronunciations used as phonemes2
+    vowels  : Table of which phoneme codes contain a vowel
+    base    : Number larger than every phoneme code
+'''
+def _bucket_pairs(query: _Pronunciations, indexed: _Pronunciations, vowels: np.ndarray,
+                  base: int) -> (np.ndarray, np.ndarray):
+    query_rows, indexed_rows = [], []
+    last = query.codes[:, -1]
+    endings = query.codes[:, -2].astype(np.int64) * base + last
+    indexed_endings = indexed.codes[:, -2].astype(np.int64) * base + indexed.codes[:, -1]
+
+    rows = np.flatnonzero((query.sizes <= 2) & vowels[last])
+    found, matches = _join(last[rows], indexed.codes[:, -1])
+    query_rows.append(rows[found])
+    indexed_rows.append(matches)
+
+    rows = np.flatnonzero((query.sizes == 2) & ~vowels[last])
+    found, matches = _join(endings[rows], indexed_endings)
+    query_rows.append(rows[found])
+    indexed_rows.append(matches)
+
+    sub_lens = np.maximum(_last_vowels(query.codes, vowels), 2)
+    long_rows = (query.sizes >= 3) & (sub_lens <= (query.sizes + 1) // 2)
+    width = indexed.codes.shape[1]
+    for sub_len in np.unique(sub_lens[long_rows]).tolist():
+        rows = np.flatnonzero(long_rows & (sub_lens == sub_len))
+        # Windows of indexed pronunciations that do not include padding
+        windows = np.lib.stride_tricks.sliding_window_view(indexed.codes, sub_len, axis=1)
+        owners, starts = np.nonzero(np.arange(width - sub_len + 1)[None, :] >= (width - indexed.sizes)[:, None])
+        keys, window_keys = _sequence_keys(query.codes[rows, -sub_len:], windows[owners, starts], base)
+        found, matches = _join(keys, window_keys)
+        query_rows.append(rows[found])
+        indexed_rows.append(owners[matches])
+    return np.concatenate(query_rows), np.concatenate(indexed_rows)
+
+'''
+Return the pairs of words (positions in the word lists of first and second) that have a pair of
+pronunciations sharing a bucket (see _bucket_pairs), sorted. The phoneme part of the rhyme score
+of every other pair of words is 0.
+    first  : Pronunciations of the first word of each pair
+    second : Pronunciations of the second word of each pair
+    vowels : Table of which phoneme codes contain a vowel
+'''
+def _candidate_pairs(first: _Pronunciations, second: _Pronunciations, vowels: np.ndarray) -> (np.ndarray, np.ndarray):
+    base = len(vowels)
+    # Either pronunciation of a pair can be phonemes1 (the one with the shorter CMU text)
+    rows1, rows2 = _bucket_pairs(first, second, vowels, base)
+    reverse2, reverse1 = _bucket_pairs(second, first, vowels, base)
+    words1 = first.word_ids[np.concatenate([rows1, reverse1])]
+    words2 = second.word_ids[np.concatenate([rows2, reverse2])]
+    found = np.zeros((len(first.counts), len(second.counts)), dtype=bool)
+    found[words1, words2] = True
+    return np.nonzero(found)
+
+'''
+Return the score of each given pair of pronunciations in utility.pair_rhyme_score (where the
+pronunciation with the shorter CMU text is phonemes1), along with a flag for each pair whose
+phonemes1 is short (1 or 2 phonemes). Short pronunciations score 0 or 1; the others score 1/4 of
+the step value of their longest ending that appears in phonemes2.
+    first  : Pronunciations of the first word of each pair
+    second : Pronunciations of the second word of each pair
+    rows1  : Pronunciation (row of first) of each pair
+    rows2  : Pronunciation (row of second) of each pair
+    vowels : Table of which phoneme codes contain a vowel
+'''
+def _pair_scores(first: _Pronunciations, second: _Pronunciations, rows1: np.ndarray, rows2: np.ndarray,
+                 vowels: np.ndarray) -> (np.ndarray, np.ndarray):
+    # One table for both lists, so phonemes1 and phonemes2 of each pair are rows of it
+    codes, sizes, lengths = first.codes, first.sizes, first.lengths
+    if second is not first:
+        codes = np.concatenate([first.codes, second.codes])
+        sizes = np.concatenate([first.sizes, second.sizes])
+        lengths = np.concatenate([first.lengths, second.lengths])
+        rows2 = rows2 + len(first.codes)
+    swap = lengths[rows1] > lengths[rows2]
+    rows1, rows2 = np.where(swap, rows2, rows1), np.where(swap, rows1, rows2)
+
+    last = codes[:, -1]
+    sizes1 = sizes[rows1]
+    short = sizes1 <= 2
+    # Ending phoneme of phonemes1 is a "vowel" phoneme that ends phonemes2, or phonemes1
+    # (2 phonemes) is the ending of phonemes2
+    short_scores = (last[rows1] == last[rows2]) & (vowels[last[rows1]] | ((sizes1 == 2) & (codes[rows1, -2] == codes[rows2, -2])))
+
+    last_vowel = _last_vowels(codes, vowels)[rows1]
+    max_sub_lens = (sizes1 + 1) // 2
+    scores = np.zeros(len(rows1))
+    pending = ~short
+    top = int(max_sub_lens[pending].max()) if pending.any() else 0
+    # Longest matching ending has the highest score, so try lengths from longest to shortest
+    # and keep the first score found for each pair. Endings more than 3 steps shorter than the
+    # longest would not score above 0.
+    for sub_len in range(top, 1, -1):
+        rows = np.flatnonzero(pending & (max_sub_lens >= sub_len) & (max_sub_lens - sub_len < 4) & (last_vowel <= sub_len))
+        if len(rows) == 0:
+            continue
+        # Key of the ending and of every window of each pronunciation (windows with padding
+        # never match an ending)
+        windows = np.lib.stride_tricks.sliding_window_view(codes, sub_len, axis=1)
+        ending_keys, window_keys = _sequence_keys(codes[:, -sub_len:], windows.reshape(-1, sub_len), len(vowels))
+        window_keys = window_keys.reshape(len(codes), -1)
+        match = (window_keys[rows2[rows]] == ending_keys[rows1[rows], None]).any(axis=1)
+        matched = rows[match]
+        scores[matched] = (1 - 0.25*(max_sub_lens[matched] - sub_len)) / 4
+        pending[matched] = False
+    return np.where(short, short_scores, scores), short
+
+'''
+Return the pairs of words (positions in words1 and words2) that share a rhyming part and
+include a dictionary word, i.e. perfect rhymes, as two arrays.
+    words1 : First word list
+    words2 : Second word list
+    index  : Rhyme index to look rhyming parts up in
+'''
+def _perfect_pairs(words1: [str], words2: [str], index: rhyme_index.RhymeIndex) -> (np.ndarray, np.ndarray):
+    keys1, owners1 = [], []
+    for i, word in enumerate(words1):
+        for part in index.rhyming_parts(word):
+            keys1.append(part)
+            owners1.append(i)
+    keys2, owners2 = [], []
+    for j, word in enumerate(words2):
+        for part in index.rhyming_parts(word):
+            keys2.append(part)
+            owners2.append(j)
+    found, matches = _join(np.array(keys1, dtype=np.int64), np.array(keys2, dtype=np.int64))
+    pairs1 = np.array(owners1, dtype=np.int64)[found]
+    pairs2 = np.array(owners2, dtype=np.int64)[matches]
+    in_dict1 = np.array([index.has_word(w) for w in words1], dtype=bool)
+    in_dict2 = np.array([index.has_word(w) for w in words2], dtype=bool)
+    perfect = in_dict1[pairs1] | in_dict2[pairs2] if len(pairs1) != 0 else np.zeros(0, dtype=bool)
+    return pairs1[perfect], pairs2[perfect]
+
+'''
+Return the table of which phoneme codes of a rhyme index contain a vowel.
+    index : Rhyme index
+'''
+def _vowel_table(index: rhyme_index.RhymeIndex) -> np.ndarray:
+    codes = index.get_codes()
+    vowels = np.zeros(len(codes) + 1, dtype=bool)
+    for code in codes.values():
+        vowels[code] = index.is_vowel(code)
+    return vowels
+
+'''
+Return the phoneme part of the rhyme score of each given pair of words (positions in the word
+lists of first and second), i.e. utility.pair_rhyme_score without perfect rhymes and pairs of the
+same word.
+    first       : Pronunciations of the first word of each pair
+    second      : Pronunciations of the second word of each pair
+    candidates1 : Word (position in the first word list) of each pair
+    candidates2 : Word (position in the second word list) of each pair
+    vowels      : Table of which phoneme codes contain a vowel
+'''
+def _word_pair_scores(first: _Pronunciations, second: _Pronunciations, candidates1: np.ndarray,
+                      candidates2: np.ndarray, vowels: np.ndarray) -> np.ndarray:
+    profiling.count('rhyme_pairs_scored', len(candidates1))
+    if len(candidates1) == 0:
+        return np.zeros(0)
+    # Every pair of pronunciations of each pair of words, in loop order
+    counts1, counts2 = first.counts[candidates1], second.counts[candidates2]
+    sizes = counts1 * counts2
+    group_starts = np.cumsum(sizes) - sizes
+    groups = np.repeat(np.arange(len(sizes)), sizes)
+    order = np.arange(sizes.sum()) - group_starts[groups]
+    rows1 = first.starts[candidates1][groups] + order // counts2[groups]
+    rows2 = second.starts[candidates2][groups] + order % counts2[groups]
+    scores, short = _pair_scores(first, second, rows1, rows2, vowels)
+
+    # The first pair of pronunciations (in loop order) with a short phonemes1 decides the
+    # score of a word pair; otherwise the best score over all pairs of pronunciations is used.
+    # Loop order and score of short pairs are packed into one number so a minimum finds both.
+    sentinel = 2 * (order.max() + 1)
+    first_short = np.minimum.reduceat(np.where(short, 2*order + (scores == 0), sentinel), group_starts)
+    best = np.maximum.reduceat(np.where(short, 0, scores), group_starts)
+    return np.where(first_short < sentinel, 1 - first_short % 2, best)
+
+'''
+Set the entries of a rhyme score matrix that belong to pairs of the same word to 0.
+    result : Matrix of rhyme scores of words1 (rows) and words2 (columns)
+    words1 : Words of the rows
+    words2 : Words of the columns
+'''
+def _clear_same_words(result: np.ndarray, words1: [str], words2: [str]) -> None:
+    positions = dict()
+    for j, word in enumerate(words2):
+        positions.setdefault(word, []).append(j)
+    same = [(i, j) for i, word in enumerate(words1) for j in positions.get(word, [])]
+    if same:
+        result[tuple(np.array(same).T)] = 0
+
+'''
+Return a matrix whose entry [i][j] is utility.pair_rhyme_score(words1[i], words2[j]). Only the
+pairs of words found by _candidate_pairs and _perfect_pairs are scored, so the time taken grows
+with the number of pairs that can rhyme rather than with the product of the list lengths.
+    words1 : Words used as the first word of each pair
+    words2 : Words used as the second word of each pair
+'''
+def rhyme_score_block(words1: [str], words2: [str]) -> np.ndarray:
+    index = rhyme_index.get_index()
+    vowels = _vowel_table(index)
+
+    same_words = words1 is words2
+    pron1 = _Pronunciations(words1, index)
+    pron2 = pron1 if same_words else _Pronunciations(words2, index, pron1.codes.shape[1])
+    if pron2.codes.shape[1] > pron1.codes.shape[1]:
+        pron1 = _Pronunciations(words1, index, pron2.codes.shape[1])
+    result = np.zeros((len(words1), len(words2)))
+
+    candidates1, candidates2 = _candidate_pairs(pron1, pron2, vowels)
+    if same_words:
+        different = candidates1 != candidates2
+        candidates1, candidates2 = candidates1[different], candidates2[different]
+    result[candidates1, candidates2] = _word_pair_scores(pron1, pron2, candidates1, candidates2, vowels)
+
+    # Perfect rhymes: words share a rhyming part and at least one is a dictionary word
+    result[_perfect_pairs(words1, words2, index)] = 1.0
+    _clear_same_words(result, words1, words2)
+    return result
+
+'''
+Return the n x n matrix of rhyme scores between every pair of the given words. If a pair score
+cache is given, only the pairs found by _candidate_pairs are looked up in it (every other pair
+scores 0 unless it is a perfect rhyme, which is found without scoring), and only the pairs it
+does not hold are scored and added to it.
+    words : List of n words
+    cache : Pair score cache (see pair_cache.PairCache), or None to score every pair
+'''
+def rhyme_score_matrix(words: [str], cache: 'pair_cache.PairCache' = None) -> np.ndarray:
+    if cache is None:
+        return rhyme_score_block(words, words)
+    index = rhyme_index.get_index()
+    vowels = _vowel_table(index)
+    pron = _Pronunciations(words, index)
+    result = np.zeros((len(words), len(words)))
+    result[_perfect_pairs(words, words, index)] = 1.0
+
+    # Candidate pairs of a word list with itself come in both orders; each is looked up once
+    first, second = _candidate_pairs(pron, pron, vowels)
+    upper = first < second
+    first, second = first[upper], second[upper]
+    scores, reverse_scores = cache.get_scores(words, first, second)
+    missing = np.flatnonzero(np.isnan(scores))
+    profiling.count('pair_cache_hits', len(first) - len(missing))
+    if len(missing) != 0:
+        rows = np.concatenate([first[missing], second[missing]])
+        columns = np.concatenate([second[missing], first[missing]])
+        # Cached scores are full rhyme scores, so perfect rhymes keep their score of 1
+        new_scores = np.where(result[rows, columns] == 1.0, 1.0, _word_pair_scores(pron, pron, rows, columns, vowels))
+        scores[missing], reverse_scores[missing] = new_scores[:len(missing)], new_scores[len(missing):]
+        cache.put_scores(words, first[missing], second[missing], scores[missing], reverse_scores[missing])
+    result[first, second] = scores
+    result[second, first] = reverse_scores
+    _clear_same_words(result, words, words)
+    return result
@@ -1,6 +1,15 @@
 # Song class
 
 import song_utility as sutil
+import utility
+import profiling
+import time
+import collections
+import heapq
+import hashlib
+import array
+import math
+import sys
 
 ## STATISTICS FOR SONG COMPARISON:
 ##    - Number of sections (NumSects)
@@ -20,9 +29,64 @@ import song_utility as sutil
 ##    - Average word proxmity rhyme score (ProxRS/Wd)
 ##    - Section similarity (SectSim): Percent of unique words that appear in at least two sections
 
+# Column names of the values returned by Song.get_stat_group() (in the same order)
+STAT_HEADERS = ['Name','Artist','ID','NumSects','WdCnt','UnqWdCnt','UnqWdPct',
+                'TotRS','ProxRS','RymDens','LgRymDens','Wd/Sect','Syll/Wd',
+                'UnqWd/Sect','RS/Sect','RS/Wd','ProxRS/Sect',
+                'ProxRS/Wd','SectSim','LyrStren']
+# Statistic (Song._DEPENDENCIES key) held by each column after the name, artist, and ID
+STAT_NAMES = dict(zip(STAT_HEADERS[3:], ['num_sections', 'word_count', 'unique_word_count', 'unique_word_pct',
+                                         'total_rhyme_score', 'proximity_rhyme_score', 'rhyme_density',
+                                         'large_rhyme_density', 'avg_section_length', 'avg_syllable_count',
+                                         'avg_section_unique_words', 'avg_section_rhyme_score',
+                                         'avg_word_rhyme_score', 'avg_section_prox_score', 'avg_word_prox_score',
+                                         'section_similarity', 'lyrical_strength']))
 class Song:
+    __slots__ = ['_name', '_artist', '_lyrics', '_ID', '_stats', '_profile']
+
+    # Statistics that each statistic is computed from. Statistics are computed the first time they
+    # are needed (by a getter or another statistic) and then kept. '_rhyme_scores' holds the rhyme
+    # dict and proximity rhyme score, which are computed together from one rhyme matrix.
+    _DEPENDENCIES = {
+        '_sections_and_words' : [],
+        'sections' : ['_sections_and_words'],
+        'section_words' : ['_sections_and_words'],
+        'num_sections' : ['sections'],
+        'sections_unique' : ['section_words'],
+        'all_words' : ['section_words'],
+        'word_count' : ['all_words'],
+        'unique_words' : ['all_words'],
+        'unique_word_count' : ['unique_words'],
+        'avg_section_length' : ['word_count', 'num_sections'],
+        'avg_section_unique_words' : ['unique_word_count', 'num_sections'],
+        'unique_word_pct' : ['unique_word_count', 'word_count'],
+        'section_frequencies' : ['sections_unique'],
+        'word_frequencies' : ['all_words'],
+        'section_similarity' : ['sections', 'sections_unique', 'section_frequencies', 'unique_word_count'],
+        'avg_syllable_count' : ['all_words'],
+        '_rhyme_scores' : ['unique_words', 'sections_unique'],
+        'rhyme_dict' : ['_rhyme_scores'],
+        'total_rhyme_score' : ['rhyme_dict'],
+        'rhyme_density' : ['rhyme_dict', 'unique_word_count'],
+        'large_rhyme_density' : ['rhyme_dict', 'unique_word_count'],
+        'avg_section_rhyme_score' : ['total_rhyme_score', 'num_sections'],
+        'avg_word_rhyme_score' : ['total_rhyme_score', 'unique_word_count'],
+        'proximity_rhyme_score' : ['_rhyme_scores'],
+        'avg_section_prox_score' : ['proximity_rhyme_score', 'num_sections'],
+        'avg_word_prox_score' : ['proximity_rhyme_score', 'unique_word_count'],
+        'lyrical_strength' : ['unique_word_pct', 'rhyme_density', 'large_rhyme_density', 'avg_syllable_count',
+                              'avg_word_rhyme_score', 'avg_word_prox_score', 'section_similarity'],
+    }
+
+    # Version of the way each statistic is computed (1 if not listed). Increase the version of a
+    # statistic when its computation changes, so saved songs can be re-scored (statistics that
+    # depend on it are re-scored too).
+    _VERSIONS = {
+        'avg_syllable_count' : 2, # CMU dictionary syllable counts
+    }
+
     '''
-    Initializes an instance of the Song class.
+    Initializes an instance of the Song class. Statistics are computed when they are first needed.
         song_name   : Song name
         song_artist : Song primary artist
         song_lyrics : Song lyrics
@@ -33,50 +97,211 @@ class Song:
         self._artist = song_artist.replace("’", "'")
         self._lyrics = sutil.remove_tag(song_lyrics)
         self._ID = song_ID
+        self._stats = dict() # Statistics computed so far
+        self._profile = None # Time spent per statistic and counters (see profiling.enable())
 
-        self._sections = sutil.extract_all_sections(self._lyrics)
-        self._num_sections = len(self._sections)
-
-        if self._num_sections != 0:
-            self._find_stats()
-            self._compute_lyrical_strength()
+    '''
+    Return the value of a statistic, computing it (and the statistics it depends on) if needed.
+    Every statistic other than the sections is None if the song has no sections.
+        name : Statistic name (key of _DEPENDENCIES)
+    '''
+    def _stat(self, name: str):
+        if name in self._stats:
+            return self._stats[name]
+        if self._lyrics is None:
+            raise ValueError(f"Song: Statistic {name} was released with the lyrics (see compact())")
+        if name not in ['_sections_and_words', 'sections', 'num_sections'] and self._stat('num_sections') == 0:
+            value = None
+        elif profiling.is_enabled():
+            value = self._profiled_compute(name)
         else:
-            self._sections_unique = self._all_words = self._word_count = self._unique_words = \
-                self._unique_word_count = self._avg_section_length = self._avg_section_unique_words = \
-                self._unique_word_pct = self._section_similarity = self._avg_syllable_count = \
-                self._rhyme_dict = self._total_rhyme_score = self._rhyme_density = \
-                self._large_rhyme_density = self._avg_section_rhyme_score = self._avg_word_rhyme_score = \
-                self._proximity_rhyme_score = self._avg_section_prox_score = self._avg_word_prox_score = \
-                self._lyrical_strength = None
+            value = getattr(self, '_compute_' + name.lstrip('_'))()
+        self._stats[name] = value
+        return value
+
+    '''
+    Compute a statistic while recording its time (excluding the time of the statistics it
+    depends on, which are computed first) and counters in the song's profile.
+        name : Statistic name (key of _DEPENDENCIES)
+    '''
+    def _profiled_compute(self, name: str):
+        if self._profile is None:
+            self._profile = profiling.new_record()
+        self._profile['reported'] = False
+        profiling.start_record(self._profile)
+        try:
+            for dependency in self._DEPENDENCIES[name]:
+                self._stat(dependency)
+            start = time.perf_counter()
+            value = getattr(self, '_compute_' + name.lstrip('_'))()
+            elapsed = time.perf_counter() - start
+        finally:
+            profiling.end_record()
+        self._profile['stages'][name] = self._profile['stages'].get(name, 0.0) + elapsed
+        self._profile['total_seconds'] += elapsed
+        return value
+
+    '''
+    Pass the song's profile to the profiling callbacks, unless nothing was computed since it
+    was last passed to them.
+    '''
+    def _report_profile(self) -> None:
+        if self._profile is not None and not self._profile['reported'] and profiling.is_enabled():
+            self._profile['reported'] = True
+            profiling.emit(self, self.get_profile())
+
+    '''
+    Return the fingerprint of every statistic: a short hash of its version and the fingerprints
+    of the statistics it depends on, which changes whenever the statistic's value could change.
+    '''
+    @classmethod
+    def get_stat_fingerprints(cls) -> {str : str}:
+        versions = dict(cls._VERSIONS)
+        if not utility.get_cmu_syllables():
+            versions['avg_syllable_count'] = 1 # Estimated counts (as before CMU counts)
+        fingerprints = dict()
+        def fingerprint(name):
+            if name not in fingerprints:
+                text = f'{name}:{versions.get(name, 1)}:' + ','.join(fingerprint(dep) for dep in cls._DEPENDENCIES[name])
+                fingerprints[name] = hashlib.sha1(text.encode('utf-8')).hexdigest()[:12]
+            return fingerprints[name]
+        for name in cls._DEPENDENCIES:
+            fingerprint(name)
+        return fingerprints
+
+    '''
+    Use known values of statistics (e.g. ones saved before) instead of computing them. Statistics
+    that depend on them are computed from these values.
+        stats : Dict of column names (STAT_HEADERS) or statistic names and values
+    '''
+    def load_stats(self, stats: dict) -> None:
+        for name, value in stats.items():
+            self._stats[STAT_NAMES.get(name, name)] = value
+
+    '''
+    Compute every statistic of the song (e.g. before sending it to another process).
+    '''
+    def compute_stats(self) -> None:
+        for name in self._DEPENDENCIES:
+            self._stat(name)
+        self._report_profile()
+
+    '''
+    Compute the statistics of get_stat_group() and release everything else the song holds, to
+    save memory when many songs are kept. Released intermediates (sections, word lists, the rhyme
+    dict, etc.) are computed again if they are needed and the lyrics were kept; otherwise, getting
+    them raises a ValueError.
+        keep_lyrics        : Keep the lyrics
+        keep_intermediates : Keep the intermediates (only the lyrics can be released)
+    '''
+    def compact(self, keep_lyrics: bool = False, keep_intermediates: bool = False) -> None:
+        for name in STAT_NAMES.values():
+            self._stat(name)
+        self._report_profile()
+        if not keep_intermediates:
+            self._stats = {name : self._stats[name] for name in STAT_NAMES.values()}
+        if not keep_lyrics:
+            self._lyrics = None
 
     '''
-    Find stats for the given song.
+    Return a SongRecord holding the song's name, artist, ID, and the statistics of
+    get_stat_group() (and the lyrics, if keep_lyrics is True).
+        keep_lyrics : Keep the lyrics in the record
     '''
-    def _find_stats(self) -> None:
-        # Need to make everything None if self._num_sections is 0
-        self._sections_unique = sutil.find_sections_unique_words(self._sections)
-        self._all_words = [word for section in self._sections for line in section for word in line.split()]
-        self._word_count = len(self._all_words)
-        self._unique_words = set(self._all_words)
-        self._unique_word_count = len(self._unique_words)
+    def to_record(self, keep_lyrics: bool = False) -> 'SongRecord':
+        return SongRecord(self.get_stat_group(), self._lyrics if keep_lyrics else None)
+
+    def _compute_sections_and_words(self) -> ([[str]], [[str]]):
+        return sutil.extract_sections_and_words(self._lyrics)
+
+    def _compute_sections(self) -> [[str]]:
+        return self._stat('_sections_and_words')[0]
+
+    def _compute_section_words(self) -> [[str]]:
+        return self._stat('_sections_and_words')[1]
+
+    def _compute_num_sections(self) -> int:
+        return len(self._stat('sections'))
+
+    def _compute_sections_unique(self) -> [{str}]:
+        return [set(words) for words in self._stat('section_words')]
+
+    def _compute_all_words(self) -> [str]:
+        return [word for words in self._stat('section_words') for word in words]
+
+    def _compute_word_count(self) -> int:
+        return len(self._stat('all_words'))
+
+    def _compute_unique_words(self) -> {str}:
+        return set(self._stat('all_words'))
+
+    def _compute_unique_word_count(self) -> int:
+        return len(self._stat('unique_words'))
+
+    def _compute_avg_section_length(self) -> float:
+        return round(self._stat('word_count') / self._stat('num_sections'), 4)
 
-        self._avg_section_length = round(self._word_count / self._num_sections, 4)
-        self._avg_section_unique_words = round(self._unique_word_count / self._num_sections, 4)
-        self._unique_word_pct = round(self._unique_word_count / self._word_count, 4)
+    def _compute_avg_section_unique_words(self) -> float:
+        return round(self._stat('unique_word_count') / self._stat('num_sections'), 4)
 
-        self._section_similarity = sutil.find_shared_unique_pct(self._sections, self._sections_unique, self._unique_word_count)
-        self._avg_syllable_count = sutil.find_syllables_per_word(self._all_words)
+    def _compute_unique_word_pct(self) -> float:
+        return round(self._stat('unique_word_count') / self._stat('word_count'), 4)
 
-        self._rhyme_dict = sutil.find_rhyme_scores(self._unique_words)
-        self._total_rhyme_score = sum(self._rhyme_dict.values())
-        self._rhyme_density = round(sum(map(lambda x : self._rhyme_dict[x] >= 1, self._rhyme_dict)) / self._unique_word_count, 4)
-        self._large_rhyme_density = round(sum(map(lambda x : self._rhyme_dict[x] >= 5, self._rhyme_dict)) / self._unique_word_count, 4)
-        self._avg_section_rhyme_score = round(self._total_rhyme_score / self._num_sections, 4)
-        self._avg_word_rhyme_score = round(self._total_rhyme_score / self._unique_word_count, 4)
+    def _compute_section_frequencies(self) -> {str : int}:
+        return sutil.find_section_frequencies(self._stat('sections_unique'))
 
-        self._proximity_rhyme_score = sum(map(lambda x : sum(sutil.find_rhyme_scores(x).values()), self._sections_unique))
-        self._avg_section_prox_score = round(self._proximity_rhyme_score / self._num_sections, 4)
-        self._avg_word_prox_score = round(self._proximity_rhyme_score / self._unique_word_count, 4)
+    def _compute_word_frequencies(self) -> {str : int}:
+        return collections.Counter(self._stat('all_words'))
+
+    def _compute_section_similarity(self) -> float:
+        return sutil.find_shared_unique_pct(self._stat('sections'), self._stat('sections_unique'),
+                                            self._stat('unique_word_count'), self._stat('section_frequencies'))
+
+    def _compute_avg_syllable_count(self) -> float:
+        return sutil.find_syllables_per_word(self._stat('all_words'))
+
+    '''
+    Return the rhyme dict and proximity rhyme score, computed from one rhyme matrix of the song's
+    unique words. The matrix is kept as '_rhyme_matrix' so edits only score the pairs of new words
+    (see _update_rhyme_scores()). It is not pickled, since it is large to send between processes,
+    and compact() releases it with the other intermediates.
+    '''
+    def _compute_rhyme_scores(self) -> ({str : float}, float):
+        rhyme_words, rhyme_matrix = sutil.find_rhyme_matrix(self._stat('unique_words'))
+        self._stats['_rhyme_matrix'] = (rhyme_words, rhyme_matrix)
+        rhyme_dict = sutil.rhyme_scores_from_matrix(rhyme_words, rhyme_matrix)
+        # Proximity rhyme score reuses the song-level rhyme matrix for each section
+        proximity_rhyme_score = sutil.find_proximity_rhyme_score(rhyme_words, rhyme_matrix, self._stat('sections_unique'))
+        return rhyme_dict, proximity_rhyme_score
+
+    def _compute_rhyme_dict(self) -> {str : float}:
+        return self._stat('_rhyme_scores')[0]
+
+    def _compute_total_rhyme_score(self) -> float:
+        return sum(self._stat('rhyme_dict').values())
+
+    def _compute_rhyme_density(self) -> float:
+        rhyme_dict = self._stat('rhyme_dict')
+        return round(sum(map(lambda x : rhyme_dict[x] >= 1, rhyme_dict)) / self._stat('unique_word_count'), 4)
+
+    def _compute_large_rhyme_density(self) -> float:
+        rhyme_dict = self._stat('rhyme_dict')
+        return round(sum(map(lambda x : rhyme_dict[x] >= 5, rhyme_dict)) / self._stat('unique_word_count'), 4)
+
+    def _compute_avg_section_rhyme_score(self) -> float:
+        return round(self._stat('total_rhyme_score') / self._stat('num_sections'), 4)
+
+    def _compute_avg_word_rhyme_score(self) -> float:
+        return round(self._stat('total_rhyme_score') / self._stat('unique_word_count'), 4)
+
+    def _compute_proximity_rhyme_score(self) -> float:
+        return self._stat('_rhyme_scores')[1]
+
+    def _compute_avg_section_prox_score(self) -> float:
+        return round(self._stat('proximity_rhyme_score') / self._stat('num_sections'), 4)
+
+    def _compute_avg_word_prox_score(self) -> float:
+        return round(self._stat('proximity_rhyme_score') / self._stat('unique_word_count'), 4)
 
     '''
     Find lyrical strength based on unique word percentage, rhyme density, large rhyme density,
@@ -94,18 +319,28 @@ class Song:
         - Proximity rhyme score per word / 2 (cap at 1)
         - 1 - Section similarity
     '''
-    def _compute_lyrical_strength(self):
+    def _compute_lyrical_strength(self) -> float:
         # Statistics that are already between 0 and 1
         # Higher section similarity is worse so we do 1 - value
-        val1 = self._unique_word_pct + self._rhyme_density + self._large_rhyme_density + (1 - self._section_similarity)
-        val2 = 2 * (self._avg_syllable_count - 1)
-        val3 = 1 if (temp := self._avg_word_rhyme_score / 3) > 1 else temp
-        val4 = 1 if (temp := self._avg_word_prox_score / 2) > 1 else temp
-        self._lyrical_strength = val1 + val2 + val3 + val4
+        val1 = self._stat('unique_word_pct') + self._stat('rhyme_density') + self._stat('large_rhyme_density') + \
+            (1 - self._stat('section_similarity'))
+        val2 = 2 * (self._stat('avg_syllable_count') - 1)
+        val3 = 1 if (temp := self._stat('avg_word_rhyme_score') / 3) > 1 else temp
+        val4 = 1 if (temp := self._stat('avg_word_prox_score') / 2) > 1 else temp
+        return val1 + val2 + val3 + val4
 
     def __str__(self) -> str:
         return f'"{self._name}" by {self._artist}'
 
+    '''
+    Return the state of the song for pickling (e.g. to send it between processes), without the
+    rhyme matrix (see _compute_rhyme_scores()).
+    '''
+    def __getstate__(self) -> (None, dict):
+        state = {name : getattr(self, name) for name in self.__slots__}
+        state['_stats'] = {name : value for name, value in self._stats.items() if name != '_rhyme_matrix'}
+        return None, state
+
     def __eq__(self, other) -> bool:
         if other == None:
             return self._name == None or self._artist == None
@@ -125,80 +360,507 @@ class Song:
     def get_id(self) -> str:
         return self._ID
 
+    def get_lyrics_hash(self) -> str:
+        return None if self._lyrics is None else hashlib.sha256(self._lyrics.encode('utf-8')).hexdigest()
+
+    '''
+    Return the profile recorded while the song's statistics were computed with profiling on
+    (see profiling.enable()), or None if there is none: seconds spent on each statistic, the
+    total, counters (rhyme pairs scored, pair cache hits, proximity pairs), and the number of
+    unique words.
+    '''
+    def get_profile(self) -> dict:
+        if self._profile is None:
+            return None
+        return {'stages' : dict(self._profile['stages']), 'counts' : dict(self._profile['counts']),
+                'total_seconds' : self._profile['total_seconds'],
+                'unique_words' : self._stats.get('unique_word_count')}
+
     def get_sections(self) -> [[str]]:
-        return self._sections
+        return self._stat('sections')
 
     def get_sections_unique(self) -> [{str}]:
-        return self._sections_unique
+        return self._stat('sections_unique')
 
     def get_num_sections(self) -> int:
-        return self._num_sections
+        return self._stat('num_sections')
 
     def get_all_words(self) -> [str]:
-        return self._all_words
+        return self._stat('all_words')
 
     def get_word_count(self) -> int:
-        return self._word_count
+        return self._stat('word_count')
 
     def get_unique_words(self) -> {str}:
-        return self._unique_words
+        return self._stat('unique_words')
 
     def get_unique_word_count(self) -> int:
-        return self._unique_word_count
+        return self._stat('unique_word_count')
 
     def get_avg_section_length(self) -> float:
-        return self._avg_section_length
+        return self._stat('avg_section_length')
 
     def get_avg_syllable_count(self) -> float:
-        return self._avg_syllable_count
+        return self._stat('avg_syllable_count')
 
     def get_avg_section_unique_words(self) -> float:
-        return self._avg_section_unique_words
+        return self._stat('avg_section_unique_words')
 
     def get_unique_word_pct(self) -> float:
-        return self._unique_word_pct
+        return self._stat('unique_word_pct')
 
     def get_section_similarity(self) -> float:
-        return self._section_similarity
+        return self._stat('section_similarity')
+
+    def get_section_frequencies(self) -> {str : int}:
+        return self._stat('section_frequencies')
+
+    def get_word_frequencies(self) -> {str : int}:
+        return self._stat('word_frequencies')
 
     def get_rhyme_dict(self) -> {str : float}:
-        return self._rhyme_dict
+        return self._stat('rhyme_dict')
 
     def get_total_rhyme_score(self) -> float:
-        return self._total_rhyme_score
+        return self._stat('total_rhyme_score')
 
     def get_rhyme_density(self) -> float:
-        return self._rhyme_density
+        return self._stat('rhyme_density')
 
     def get_large_rhyme_density(self) -> float:
-        return self._large_rhyme_density
+        return self._stat('large_rhyme_density')
 
     def get_avg_section_rhyme_score(self) -> float:
-        return self._avg_section_rhyme_score
+        return self._stat('avg_section_rhyme_score')
 
     def get_avg_word_rhyme_score(self) -> float:
-        return self._avg_word_rhyme_score
+        return self._stat('avg_word_rhyme_score')
 
     def get_proximity_rhyme_score(self) -> float:
-        return self._proximity_rhyme_score
+        return self._stat('proximity_rhyme_score')
 
     def get_avg_section_prox_score(self) -> float:
-        return self._avg_section_prox_score
+        return self._stat('avg_section_prox_score')
 
     def get_avg_word_prox_score(self) -> float:
-        return self._avg_word_prox_score
+        return self._stat('avg_word_prox_score')
 
     def get_lyrical_strength(self) -> float:
-        return self._lyrical_strength
+        return self._stat('lyrical_strength')
 
     '''
     Get the group of statistics relevant to the song.
     '''
     def get_stat_group(self) -> 'List of stats':
-        return [self._name, self._artist, self._ID, self._num_sections, self._word_count,
-                self._unique_word_count, self._unique_word_pct, self._total_rhyme_score,
-                self._proximity_rhyme_score, self._rhyme_density, self._large_rhyme_density,
-                self._avg_section_length, self._avg_syllable_count, self._avg_section_unique_words,
-                self._avg_section_rhyme_score, self._avg_word_rhyme_score,
-                self._avg_section_prox_score, self._avg_word_prox_score, self._section_similarity,
-                self._lyrical_strength]
+        stats = [self._name, self._artist, self._ID, self.get_num_sections(), self.get_word_count(),
+                 self.get_unique_word_count(), self.get_unique_word_pct(), self.get_total_rhyme_score(),
+                 self.get_proximity_rhyme_score(), self.get_rhyme_density(), self.get_large_rhyme_density(),
+                 self.get_avg_section_length(), self.get_avg_syllable_count(), self.get_avg_section_unique_words(),
+                 self.get_avg_section_rhyme_score(), self.get_avg_word_rhyme_score(),
+                 self.get_avg_section_prox_score(), self.get_avg_word_prox_score(), self.get_section_similarity(),
+                 self.get_lyrical_strength()]
+        self._report_profile()
+        return stats
+
+    ### WORD QUERIES ###
+
+    '''
+    Return the words that appear in at least k sections, ordered by number of sections (most first)
+    and then alphabetically. Return None if the song has no sections.
+        k : Minimum number of sections
+    '''
+    def get_words_in_sections(self, k: int = 2) -> [str]:
+        if k < 1:
+            raise ValueError(f"get_words_in_sections: Parameter k must be a positive integer")
+        frequencies = self._stat('section_frequencies')
+        if frequencies is None:
+            return None
+        return sorted((word for word, count in frequencies.items() if count >= k),
+                      key = lambda word: (-frequencies[word], word))
+
+    '''
+    Return the n most repeated hook words: words that appear in the most sections, with ties
+    broken by total number of occurrences (and then alphabetically). Return None if the song has
+    no sections.
+        n : Number of words to return
+    '''
+    def get_hook_words(self, n: int = 10) -> [str]:
+        if n < 0:
+            raise ValueError(f"get_hook_words: Parameter n must be a non-negative integer")
+        frequencies = self._stat('section_frequencies')
+        if frequencies is None:
+            return None
+        occurrences = self._stat('word_frequencies')
+        return heapq.nsmallest(n, frequencies, key = lambda word: (-frequencies[word], -occurrences[word], word))
+
+    ### EDITING ###
+
+    # Sections and lines are numbered from 0, in the order of get_sections() (lyrics lines outside
+    # of sections are not counted). Edits change the lyrics and update the statistics computed so
+    # far from the words that were added or removed, instead of computing them all again.
+
+    '''
+    Add a section to the song (its header and lines are added to the lyrics).
+        lines  : Lines of the section
+        index  : Position of the new section (None = after the last section)
+        header : Header of the section (in brackets, starting with one of sutil.SECTION_HEADERS)
+    '''
+    def add_section(self, lines: [str], index: int = None, header: str = '[Verse]') -> None:
+        numbers = self._editable_sections()
+        index = len(numbers) if index is None else index
+        if not 0 <= index <= len(numbers):
+            raise ValueError(f"add_section: Parameter index must be between 0 and {len(numbers)}")
+        cleaned_header = utility.clean_string(header)
+        if '\n' in header or not sutil.is_header(cleaned_header) or not sutil.starts_section(cleaned_header):
+            raise ValueError(f"add_section: Parameter header must be a section header such as '[Verse]'")
+        cleaned = [self._clean_line(line) for line in lines]
+        if not cleaned:
+            raise ValueError(f"add_section: Parameter lines must not be empty")
+        if index < len(numbers):
+            # The section goes right before the header of the section now at index
+            start, new_lines = numbers[index][0], [header] + list(lines) + ['']
+        else:
+            start = self._lyrics.count('\n') + 1
+            new_lines = ([''] if self._lyrics.strip() else []) + [header] + list(lines)
+        self._splice_lyrics(start, start, new_lines)
+        first = start + len(new_lines) - len(lines) - (index < len(numbers))
+        numbers.insert(index, (first - 1, list(range(first, first + len(lines)))))
+        self._update_section(index, None, cleaned)
+
+    '''
+    Remove a section (its header and lines are removed from the lyrics).
+        index : Position of the section
+    '''
+    def remove_section(self, index: int) -> None:
+        numbers = self._editable_sections()
+        self._check_position(index, len(numbers), 'remove_section', 'index')
+        header, old = numbers.pop(index)
+        self._splice_lyrics(header, old[-1] + 1, [])
+        self._update_section(index, self._stat('sections')[index], None)
+
+    '''
+    Replace the lines of a section (its header is kept).
+        index : Position of the section
+        lines : New lines of the section
+    '''
+    def replace_section(self, index: int, lines: [str]) -> None:
+        numbers = self._editable_sections()
+        self._check_position(index, len(numbers), 'replace_section', 'index')
+        cleaned = [self._clean_line(line) for line in lines]
+        if not cleaned:
+            raise ValueError(f"replace_section: Parameter lines must not be empty (use remove_section())")
+        header, old = numbers.pop(index)
+        self._splice_lyrics(old[0], old[-1] + 1, list(lines))
+        numbers.insert(index, (header, list(range(old[0], old[0] + len(lines)))))
+        self._update_section(index, self._stat('sections')[index], cleaned)
+
+    '''
+    Add a line to a section.
+        section : Position of the section
+        line    : Line to add
+        index   : Position of the new line in the section (None = after the last line)
+    '''
+    def add_line(self, section: int, line: str, index: int = None) -> None:
+        numbers = self._editable_sections()
+        self._check_position(section, len(numbers), 'add_line', 'section')
+        cleaned = self._clean_line(line)
+        index = len(numbers[section][1]) if index is None else index
+        if not 0 <= index <= len(numbers[section][1]):
+            raise ValueError(f"add_line: Parameter index must be between 0 and {len(numbers[section][1])}")
+        header, old = numbers.pop(section)
+        start = old[index] if index < len(old) else old[-1] + 1
+        self._splice_lyrics(start, start, [line])
+        new = [number + 1 if number >= start else number for number in old]
+        new.insert(index, start)
+        numbers.insert(section, (header, new))
+        lines = list(self._stat('sections')[section])
+        lines.insert(index, cleaned)
+        self._update_section(section, self._stat('sections')[section], lines)
+
+    '''
+    Remove a line from a section. Removing the only line of a section removes the section.
+        section : Position of the section
+        index   : Position of the line in the section
+    '''
+    def remove_line(self, section: int, index: int) -> None:
+        numbers = self._editable_sections()
+        self._check_position(section, len(numbers), 'remove_line', 'section')
+        self._check_position(index, len(numbers[section][1]), 'remove_line', 'index')
+        if len(numbers[section][1]) == 1:
+            self.remove_section(section)
+            return
+        header, old = numbers.pop(section)
+        start = old[index]
+        self._splice_lyrics(start, start + 1, [])
+        numbers.insert(section, (header, [number - (number > start) for number in old if number != start]))
+        lines = list(self._stat('sections')[section])
+        del lines[index]
+        self._update_section(section, self._stat('sections')[section], lines)
+
+    '''
+    Replace a line of a section.
+        section : Position of the section
+        index   : Position of the line in the section
+        line    : New line
+    '''
+    def replace_line(self, section: int, index: int, line: str) -> None:
+        numbers = self._editable_sections()
+        self._check_position(section, len(numbers), 'replace_line', 'section')
+        self._check_position(index, len(numbers[section][1]), 'replace_line', 'index')
+        cleaned = self._clean_line(line)
+        start = numbers[section][1][index]
+        self._splice_lyrics(start, start + 1, [line])
+        lines = list(self._stat('sections')[section])
+        lines[index] = cleaned
+        self._update_section(section, self._stat('sections')[section], lines)
+
+    '''
+    Return the line numbers of the song's sections in its lyrics (see
+    sutil.find_section_line_numbers()), making sure the song can be edited.
+    '''
+    def _editable_sections(self) -> [(int, [int])]:
+        if self._lyrics is None:
+            raise ValueError(f"Song: The lyrics were released (see compact()), so the song cannot be edited")
+        self._stat('_sections_and_words')
+        if '_line_numbers' not in self._stats:
+            self._stats['_line_numbers'] = sutil.find_section_line_numbers(self._lyrics)
+        return self._stats['_line_numbers']
+
+    '''
+    Raise a ValueError unless 0 <= position < count.
+        position : Position of a section or line
+        count    : Number of sections or lines
+        method   : Name of the method (for the error message)
+        name     : Name of the parameter (for the error message)
+    '''
+    @staticmethod
+    def _check_position(position: int, count: int, method: str, name: str) -> None:
+        if not 0 <= position < count:
+            raise ValueError(f"{method}: Parameter {name} must be between 0 and {count - 1}")
+
+    '''
+    Return a line of lyrics cleaned (see utility.clean_string()), raising a ValueError if it
+    cannot be a line of a section (it has no words, has line breaks, or is a header).
+        line : Line of lyrics
+    '''
+    @staticmethod
+    def _clean_line(line: str) -> str:
+        cleaned = utility.clean_string(line) if isinstance(line, str) and '\n' not in line else ''
+        if cleaned == '' or sutil.is_header(cleaned):
+            raise ValueError(f"Song: {line!r} is not a line of lyrics (it must have words, no line breaks, "
+                             f"and not be a section header)")
+        return cleaned
+
+    '''
+    Replace lines start to stop (excluded) of the lyrics with new lines, and move the line
+    numbers of the sections after them.
+        start : Number of the first line replaced
+        stop  : Number of the line after the last line replaced (start = insert before it)
+        lines : New lines
+    '''
+    def _splice_lyrics(self, start: int, stop: int, lines: [str]) -> None:
+        raw = self._lyrics.split('\n')
+        raw[start:stop] = lines
+        self._lyrics = '\n'.join(raw)
+        shift = len(lines) - (stop - start)
+        if shift:
+            numbers = self._stats['_line_numbers']
+            numbers[:] = [(header + shift if header >= stop else header,
+                           [number + shift if number >= stop else number for number in line_numbers])
+                          for header, line_numbers in numbers]
+
+    '''
+    Update the statistics after a section was added, removed, or changed. The sections, section
+    word sets, word counts, syllables per word, and rhyme scores computed so far are updated from
+    the words that were added or removed; other statistics are computed again from them when
+    needed.
+        index     : Position of the section
+        old_lines : Cleaned lines of the section before the edit (None = the section was added)
+        new_lines : Cleaned lines of the section after the edit (None = the section was removed)
+    '''
+    def _update_section(self, index: int, old_lines: [str], new_lines: [str]) -> None:
+        stats = self._stats
+        sections, section_words = (list(x) for x in stats['_sections_and_words'])
+        had_sections = len(sections) > 0
+        # Word counts tell which words join or leave the song
+        if had_sections and any(name in stats for name in ['unique_words', 'avg_syllable_count', '_rhyme_scores']):
+            self._stat('word_frequencies')
+        old_words = [] if old_lines is None else section_words[index]
+        new_words = [] if new_lines is None else [sys.intern(word) for line in new_lines for word in line.split()]
+        if old_lines is None:
+            sections.insert(index, new_lines)
+            section_words.insert(index, new_words)
+        elif new_lines is None:
+            del sections[index], section_words[index]
+        else:
+            sections[index], section_words[index] = new_lines, new_words
+
+        kept = {'_sections_and_words' : (sections, section_words), '_line_numbers' : stats['_line_numbers']}
+        # Statistics of a song that had or now has no sections are computed from scratch
+        if had_sections and sections:
+            old_set, new_set = set(old_words), set(new_words)
+            if 'sections_unique' in stats:
+                sections_unique = list(stats['sections_unique'])
+                if old_lines is None:
+                    sections_unique.insert(index, new_set)
+                elif new_lines is None:
+                    del sections_unique[index]
+                else:
+                    sections_unique[index] = new_set
+                kept['sections_unique'] = sections_unique
+            if 'section_frequencies' in stats:
+                frequencies = collections.Counter(stats['section_frequencies'])
+                frequencies.subtract(old_set)
+                frequencies.update(new_set)
+                kept['section_frequencies'] = +frequencies # Drops words left in no section
+            if 'word_count' in stats:
+                kept['word_count'] = stats['word_count'] - len(old_words) + len(new_words)
+            if 'word_frequencies' in stats:
+                old_counts = stats['word_frequencies']
+                counts = collections.Counter(old_counts)
+                counts.subtract(old_words)
+                counts.update(new_words)
+                counts = kept['word_frequencies'] = +counts
+                joined = [word for word in new_set if word not in old_counts]
+                left = [word for word in old_set if word not in counts]
+                if 'unique_words' in stats:
+                    kept['unique_words'] = stats['unique_words'].difference(left).union(joined)
+                if 'avg_syllable_count' in stats:
+                    kept['avg_syllable_count'] = sutil.syllables_per_word_from_counts(counts, sum(counts.values()))
+                if '_rhyme_scores' in stats:
+                    kept['_rhyme_matrix'], kept['_rhyme_scores'] = self._update_rhyme_scores(
+                        list(old_counts), joined, left, old_set, new_set)
+        self._stats = kept
+
+    '''
+    Return the rhyme matrix (see sutil.find_rhyme_matrix()) and the rhyme dict and proximity rhyme
+    score of the song after an edit of one section. The matrix kept since the rhyme scores were
+    computed is updated, so only the pairs that involve a word that joined the song are scored
+    (songs that were pickled score their words once to build it again); the proximity rhyme score
+    changes by the scores of the edited section before and after the edit.
+        old_words   : Unique words of the song before the edit
+        joined      : Words that joined the song
+        left        : Words that left the song
+        old_section : Unique words of the section before the edit (empty if it was added)
+        new_section : Unique words of the section after the edit (empty if it was removed)
+    '''
+    def _update_rhyme_scores(self, old_words: [str], joined: [str], left: [str], old_section: {str},
+                             new_section: {str}) -> (([str], 'numpy.ndarray'), ({str : float}, float)):
+        if '_rhyme_matrix' in self._stats:
+            words, matrix = self._stats['_rhyme_matrix']
+        else:
+            words, matrix = sutil.find_rhyme_matrix(old_words)
+        proximity_rhyme_score = self._stats['_rhyme_scores'][1] - \
+            sutil.find_proximity_rhyme_score(words, matrix, [old_section])
+        if joined or left:
+            words, matrix = sutil.update_rhyme_matrix(words, matrix, joined, left)
+        proximity_rhyme_score += sutil.find_proximity_rhyme_score(words, matrix, [new_section])
+        return (words, matrix), (sutil.rhyme_scores_from_matrix(words, matrix), proximity_rhyme_score)
+
+class SongRecord:
+    __slots__ = ['_name', '_artist', '_ID', '_values', '_lyrics']
+
+    # Columns of get_stat_group() that hold whole numbers
+    _INTEGER_HEADERS = ['NumSects', 'WdCnt', 'UnqWdCnt']
+
+    '''
+    Initializes a compact record of a song's statistics (see Song.to_record()). The statistics
+    are kept in one array of doubles (missing statistics are NaN), so a record takes a small,
+    fixed amount of memory no matter how long the song is.
+        stats  : Values of Song.get_stat_group()
+        lyrics : Song lyrics (None = not kept)
+    '''
+    def __init__(self, stats: list, lyrics: str = None):
+        self._name, self._artist, self._ID = stats[:3]
+        self._values = array.array('d', (math.nan if value is None else value for value in stats[3:]))
+        self._lyrics = lyrics
+
+    def __str__(self) -> str:
+        return f'"{self._name}" by {self._artist}'
+
+    '''
+    Return the value of a column of get_stat_group() (None if the song has no statistics).
+        header : Column name (STAT_HEADERS)
+    '''
+    def get_stat(self, header: str):
+        if header in ['Name', 'Artist', 'ID']:
+            return [self._name, self._artist, self._ID][STAT_HEADERS.index(header)]
+        value = self._values[STAT_HEADERS.index(header) - 3]
+        if math.isnan(value):
+            return None
+        return int(value) if header in self._INTEGER_HEADERS else value
+
+    '''
+    Return a Song with the record's lyrics, or None if the lyrics were not kept.
+    '''
+    def to_song(self) -> Song:
+        return None if self._lyrics is None else Song(self._name, self._artist, self._lyrics, self._ID)
+
+    def get_name(self) -> str:
+        return self._name
+
+    def get_artist(self) -> str:
+        return self._artist
+
+    def get_lyrics(self) -> str:
+        return self._lyrics
+
+    def get_id(self) -> str:
+        return self._ID
+
+    def get_num_sections(self) -> int:
+        return self.get_stat('NumSects')
+
+    def get_word_count(self) -> int:
+        return self.get_stat('WdCnt')
+
+    def get_unique_word_count(self) -> int:
+        return self.get_stat('UnqWdCnt')
+
+    def get_unique_word_pct(self) -> float:
+        return self.get_stat('UnqWdPct')
+
+    def get_total_rhyme_score(self) -> float:
+        return self.get_stat('TotRS')
+
+    def get_proximity_rhyme_score(self) -> float:
+        return self.get_stat('ProxRS')
+
+    def get_rhyme_density(self) -> float:
+        return self.get_stat('RymDens')
+
+    def get_large_rhyme_density(self) -> float:
+        return self.get_stat('LgRymDens')
+
+    def get_avg_section_length(self) -> float:
+        return self.get_stat('Wd/Sect')
+
+    def get_avg_syllable_count(self) -> float:
+        return self.get_stat('Syll/Wd')
+
+    def get_avg_section_unique_words(self) -> float:
+        return self.get_stat('UnqWd/Sect')
+
+    def get_avg_section_rhyme_score(self) -> float:
+        return self.get_stat('RS/Sect')
+
+    def get_avg_word_rhyme_score(self) -> float:
+        return self.get_stat('RS/Wd')
+
+    def get_avg_section_prox_score(self) -> float:
+        return self.get_stat('ProxRS/Sect')
+
+    def get_avg_word_prox_score(self) -> float:
+        return self.get_stat('ProxRS/Wd')
+
+    def get_section_similarity(self) -> float:
+        return self.get_stat('SectSim')
+
+    def get_lyrical_strength(self) -> float:
+        return self.get_stat('LyrStren')
+
+    '''
+    Get the group of statistics relevant to the song (same values as Song.get_stat_group()).
+    '''
+    def get_stat_group(self) -> 'List of stats':
+        return [self.get_stat(header) for header in STAT_HEADERS]
@@ -0,0 +1,170 @@
+# song_cache.py
+
+# Local cache of Genius search results and lyrics (SQLite file)
+
+import sqlite3
+import threading
+import json
+import time
+import utility
+
+class SongCache:
+    '''
+    Initializes a cache of Genius search results. Searches are keyed by normalized (title, artist)
+    and point to songs keyed by Genius ID, which hold the song's name, artist, lyrics, and the raw
+    response from Genius. Entries older than ttl seconds are treated as missing, and the least
+    recently used songs are evicted when the cached lyrics/responses exceed max_bytes.
+        path      : SQLite file of the cache
+        ttl       : Seconds before an entry expires (None = never)
+        max_bytes : Maximum total size of cached lyrics and responses (None = no limit)
+    '''
+    def __init__(self, path, ttl: float = None, max_bytes: int = None):
+        if ttl is not None and ttl <= 0:
+            raise ValueError(f"SongCache: Parameter ttl must be positive")
+        if max_bytes is not None and max_bytes <= 0:
+            raise ValueError(f"SongCache: Parameter max_bytes must be a positive integer")
+        self._ttl = ttl
+        self._max_bytes = max_bytes
+        self._hits = self._misses = self._evictions = 0
+        # Searches may run on several threads at once (see lyric_empirics.find_songs)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('CREATE TABLE IF NOT EXISTS searches (query TEXT PRIMARY KEY, id, fetched REAL)')
+        self._db.execute('CREATE TABLE IF NOT EXISTS songs (id PRIMARY KEY, name TEXT, artist TEXT, lyrics TEXT, '
+                         'response TEXT, size INTEGER, fetched REAL, accessed REAL)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS songs_accessed ON songs (accessed)')
+        self._db.commit()
+
+    '''
+    Return the normalized key of a search (lowercase, alphanumeric characters only).
+        name   : Song title
+        artist : Artist name
+    '''
+    @staticmethod
+    def _query(name: str, artist: str) -> str:
+        return utility.keep_alphanum(name.lower()) + '\t' + utility.keep_alphanum(artist.lower())
+
+    '''
+    Return True if an entry fetched at the given time has expired; False otherwise.
+        fetched : Time the entry was fetched
+    '''
+    def _expired(self, fetched: float) -> bool:
+        return self._ttl is not None and time.time() - fetched > self._ttl
+
+    '''
+    Return the (name, artist, lyrics, ID) of a cached song, or None if it is not cached or expired.
+    The caller must hold the lock.
+        song_id : Genius.com ID
+    '''
+    def _get_song(self, song_id) -> (str, str, str, str):
+        row = self._db.execute('SELECT name, artist, lyrics, fetched FROM songs WHERE id = ?', (song_id,)).fetchone()
+        if row is None or self._expired(row[3]):
+            return None
+        self._db.execute('UPDATE songs SET accessed = ? WHERE id = ?', (time.time(), song_id))
+        self._db.commit()
+        return row[0], row[1], row[2], song_id
+
+    '''
+    Return (True, source) if a search is cached, where source is the (name, artist, lyrics, ID) of
+    the song found (None if the search found nothing); otherwise, return (False, None).
+        name   : Song title
+        artist : Artist name
+    '''
+    def get(self, name: str, artist: str) -> (bool, (str, str, str, str)):
+        with self._lock:
+            row = self._db.execute('SELECT id, fetched FROM searches WHERE query = ?',
+                                   (self._query(name, artist),)).fetchone()
+            if row is not None and not self._expired(row[1]):
+                source = None if row[0] is None else self._get_song(row[0])
+                if row[0] is None or source is not None:
+                    self._hits += 1
+                    return True, source
+            self._misses += 1
+            return False, None
+
+    '''
+    Return the (name, artist, lyrics, ID) of a cached song, or None if it is not cached.
+        song_id : Genius.com ID
+    '''
+    def get_by_id(self, song_id) -> (str, str, str, str):
+        with self._lock:
+            source = self._get_song(song_id)
+            if source is None:
+                self._misses += 1
+            else:
+                self._hits += 1
+            return source
+
+    '''
+    Return the raw Genius response of a cached song, or None if it is not cached.
+        song_id : Genius.com ID
+    '''
+    def get_response(self, song_id) -> dict:
+        with self._lock:
+            row = self._db.execute('SELECT response FROM songs WHERE id = ?', (song_id,)).fetchone()
+        return None if row is None or row[0] is None else json.loads(row[0])
+
+    '''
+    Add the result of a search to the cache.
+        name     : Song title that was searched for (None = only cache the song)
+        artist   : Artist name that was searched for
+        source   : (name, artist, lyrics, ID) of the song found, or None if nothing was found
+        response : Raw Genius response of the song found (None if not available)
+    '''
+    def put(self, name: str, artist: str, source: (str, str, str, str), response: dict = None) -> None:
+        now = time.time()
+        with self._lock:
+            song_id = None if source is None else source[3]
+            if name is not None:
+                self._db.execute('INSERT OR REPLACE INTO searches VALUES (?, ?, ?)', (self._query(name, artist), song_id, now))
+            if source is not None:
+                response = None if response is None else json.dumps(response, default=str)
+                size = len(source[2].encode('utf-8')) + (0 if response is None else len(response))
+                self._db.execute('INSERT OR REPLACE INTO songs VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                                 (song_id, source[0], source[1], source[2], response, size, now, now))
+            self._evict()
+            self._db.commit()
+
+    '''
+    Remove the least recently used songs (and searches that point to them) until the cache is
+    no larger than max_bytes. The caller must hold the lock.
+    '''
+    def _evict(self) -> None:
+        if self._max_bytes is None:
+            return
+        total = self._db.execute('SELECT COALESCE(SUM(size), 0) FROM songs').fetchone()[0]
+        if total <= self._max_bytes:
+            return
+        removed = []
+        for song_id, size in self._db.execute('SELECT id, size FROM songs ORDER BY accessed').fetchall():
+            if total <= self._max_bytes:
+                break
+            removed.append((song_id,))
+            total -= size
+        self._db.executemany('DELETE FROM songs WHERE id = ?', removed)
+        self._db.executemany('DELETE FROM searches WHERE id = ?', removed)
+        self._evictions += len(removed)
+
+    '''
+    Return the IDs of all cached songs.
+    '''
+    def get_ids(self) -> [str]:
+        with self._lock:
+            return [row[0] for row in self._db.execute('SELECT id FROM songs')]
+
+    '''
+    Return the cache counters: hits, misses, evictions, and the number and total size of cached songs.
+    '''
+    def get_stats(self) -> {str : int}:
+        with self._lock:
+            count, size = self._db.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM songs').fetchone()
+        return {'hits' : self._hits, 'misses' : self._misses, 'evictions' : self._evictions,
+                'songs' : count, 'bytes' : size}
+
+    '''
+    Close the SQLite file.
+    '''
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,177 @@
+# song_query.py
+
+# Queries over saved song statistics (top-k by a statistic, songs by artist, similar songs)
+
+import numpy as np
+from song import STAT_HEADERS
+
+# Columns that can be queried (everything after the name, artist, and ID)
+QUERY_HEADERS = STAT_HEADERS[3:]
+
+'''
+Return a KD-tree of points (scipy's cKDTree), or None if scipy is not installed.
+    points : Array with one point per row
+'''
+def _kd_tree(points: np.ndarray):
+    try:
+        from scipy.spatial import cKDTree
+    except ImportError:
+        return None # Nearest neighbours are found by scanning the normalized statistics instead
+    return cKDTree(points)
+
+class SongIndex:
+    '''
+    Initializes an index of song statistics. The statistics are kept as one array per column,
+    along with each column's order for top-k queries, the rows of each artist, and the statistics
+    normalized to mean 0 and standard deviation 1 (plus a KD-tree of them if scipy is installed)
+    for similarity queries. The orders, artists, and normalized statistics are computed on first use.
+        table : DataFrame of song statistics (columns are STAT_HEADERS)
+    '''
+    def __init__(self, table: 'pandas.DataFrame'):
+        self._table = table.reset_index(drop=True)
+        self._values = self._table[QUERY_HEADERS].to_numpy(dtype=np.float64, na_value=np.nan)
+        self._orders = dict() # Column -> row numbers sorted by value (missing values excluded)
+        self._positions = {str(song_id) : i for i, song_id in enumerate(self._table['ID'].tolist())}
+        self._artists = None # Lowercase artist -> row numbers (see _artist_rows())
+        self._complete = None # Rows with every statistic (see _normalize())
+
+    '''
+    Return an index of the songs of this index with some songs saved (added or replaced) and some
+    removed, without reading the other songs again. Saved songs are placed after the others, as if
+    the index were built again from a table in the order songs were last saved.
+        saved   : DataFrame of the statistics of the saved songs (columns are STAT_HEADERS)
+        removed : IDs of the removed songs
+    '''
+    def updated(self, saved: 'pandas.DataFrame', removed: list) -> 'SongIndex':
+        import pandas as pd
+        changed = set(map(str, removed)) | set(map(str, saved['ID'].tolist()))
+        kept = self._table.drop(index=[self._positions[song_id] for song_id in changed if song_id in self._positions])
+        if saved.empty:
+            return SongIndex(kept)
+        return SongIndex(saved if kept.empty else pd.concat([kept, saved[self._table.columns]], ignore_index=True))
+
+    '''
+    Compute the statistics normalized to mean 0 and standard deviation 1 over the songs that have
+    every statistic (and their KD-tree), unless they were computed already.
+    '''
+    def _normalize(self) -> None:
+        if self._complete is not None:
+            return
+        # Songs without sections have no statistics and are never similar to anything
+        complete = np.flatnonzero(~np.isnan(self._values).any(axis=1))
+        values = self._values[complete]
+        mean = values.mean(axis=0) if len(values) else np.zeros(len(QUERY_HEADERS))
+        std = values.std(axis=0) if len(values) else np.ones(len(QUERY_HEADERS))
+        self._mean, self._std = mean, np.where(std > 0, std, 1)
+        self._normalized = (values - self._mean) / self._std
+        # Squared lengths of the normalized rows, so distances to a song take one matrix product
+        self._norms = (self._normalized ** 2).sum(axis=1)
+        # Row -> position among the songs with statistics (-1 for songs without them)
+        self._complete_positions = np.full(len(self._table), -1)
+        self._complete_positions[complete] = np.arange(len(complete))
+        self._tree = None if len(values) == 0 else _kd_tree(self._normalized)
+        self._complete = complete
+
+    '''
+    Return the position of a queryable column, raising a ValueError for other columns.
+        stat : Column name
+    '''
+    @staticmethod
+    def _column(stat: str) -> int:
+        if stat not in QUERY_HEADERS:
+            raise ValueError(f"SongIndex: {stat} is not a statistic (choose from {', '.join(QUERY_HEADERS)})")
+        return QUERY_HEADERS.index(stat)
+
+    '''
+    Return the rows of the songs of an artist (case-insensitive).
+        artist : Artist name
+    '''
+    def _artist_rows(self, artist: str) -> np.ndarray:
+        if self._artists is None:
+            artists = dict()
+            for i, artist_name in enumerate(self._table['Artist'].tolist()):
+                artists.setdefault(str(artist_name).lower(), []).append(i)
+            self._artists = {artist_name : np.array(rows) for artist_name, rows in artists.items()}
+        return self._artists.get(artist.lower(), np.array([], dtype=int))
+
+    def __len__(self) -> int:
+        return len(self._table)
+
+    '''
+    Return the k songs with the highest (or lowest) value of a statistic, best first. Songs
+    without a value are left out.
+        stat      : Column name (e.g. 'LyrStren')
+        k         : Number of songs
+        artist    : Only consider the songs of this artist (None = all songs)
+        ascending : Return the songs with the lowest values instead
+    '''
+    def top(self, stat: str, k: int = 10, artist: str = None, ascending: bool = False) -> 'pandas.DataFrame':
+        if k < 0:
+            raise ValueError(f"SongIndex.top: Parameter k must be a non-negative integer")
+        column = self._column(stat)
+        if artist is None:
+            if stat not in self._orders:
+                values = self._values[:, column]
+                rows = np.flatnonzero(~np.isnan(values))
+                self._orders[stat] = rows[np.argsort(values[rows], kind='stable')]
+            order = self._orders[stat]
+            rows = order[:k] if ascending else order[::-1][:k]
+        else:
+            rows = self._artist_rows(artist)
+            values = self._values[rows, column]
+            rows, values = rows[~np.isnan(values)], values[~np.isnan(values)]
+            values = values if ascending else -values
+            if k < len(rows):
+                best = np.argpartition(values, k)[:k]
+                rows, values = rows[best], values[best]
+            rows = rows[np.argsort(values, kind='stable')]
+        return self._table.iloc[rows].reset_index(drop=True)
+
+    '''
+    Return the saved songs of an artist (case-insensitive).
+        artist : Artist name
+    '''
+    def by_artist(self, artist: str) -> 'pandas.DataFrame':
+        return self._table.iloc[self._artist_rows(artist)].reset_index(drop=True)
+
+    '''
+    Return the k songs whose statistics are most similar to a song's (smallest Euclidean distance
+    between normalized statistics), most similar first, with a 'Distance' column.
+        song_id : Genius.com ID of a saved song (or 'Name_Artist' for songs saved without one)
+        k       : Number of songs
+        artist  : Only consider the songs of this artist (None = all songs)
+    '''
+    def similar(self, song_id, k: int = 10, artist: str = None) -> 'pandas.DataFrame':
+        if k < 0:
+            raise ValueError(f"SongIndex.similar: Parameter k must be a non-negative integer")
+        if str(song_id) not in self._positions:
+            raise ValueError(f"SongIndex.similar: No saved song has ID {song_id}")
+        row = self._positions[str(song_id)]
+        if np.isnan(self._values[row]).any():
+            return self._table.iloc[[]].assign(Distance = [])
+        self._normalize()
+        target = (self._values[row] - self._mean) / self._std
+
+        if artist is None and self._tree is not None:
+            # The song itself is the nearest point, so one more neighbour is requested
+            distances, found = self._tree.query(target, k = min(k + 1, len(self._complete)))
+            candidates, distances = self._complete[np.atleast_1d(found)], np.atleast_1d(distances)
+        else:
+            # Squared distances as |x|^2 - 2 x.t + |t|^2 (minus |t|^2, the same for every song);
+            # the distances of the chosen songs are then computed exactly
+            if artist is None:
+                positions = np.arange(len(self._complete))
+                distances = self._norms - 2 * (self._normalized @ target)
+            else:
+                positions = self._complete_positions[self._artist_rows(artist)]
+                positions = positions[positions >= 0]
+                distances = self._norms[positions] - 2 * (self._normalized[positions] @ target)
+            distances[positions == self._complete_positions[row]] = np.inf
+            if k < len(positions):
+                positions = positions[np.argpartition(distances, k)[:k]]
+            candidates = self._complete[positions]
+            distances = np.sqrt(((self._normalized[positions] - target) ** 2).sum(axis=1))
+        keep = candidates != row
+        candidates, distances = candidates[keep][:k], distances[keep][:k]
+        order = np.argsort(distances, kind='stable')
+        return self._table.iloc[candidates[order]].reset_index(drop=True).assign(Distance = distances[order])
@@ -0,0 +1,503 @@
+# song_store.py
+
+# Storage of song statistics (SQLite file with one row per song key)
+
+import sqlite3
+import contextlib
+import json
+import hashlib
+import itertools
+from song import STAT_HEADERS
+from lyrics_store import LyricsStore
+from stat_summary import SongSummary, SUMMARY_HEADERS, summarize
+
+# Columns that hold whole numbers (all other statistics are decimals)
+_INTEGER_COLUMNS = ['NumSects', 'WdCnt', 'UnqWdCnt']
+# Columns after the statistics: hash of the lyrics the row was computed from and id of the
+# statistic fingerprints (see Song.get_stat_fingerprints()) it was computed with
+_META_HEADERS = ['LyrHash', 'ScoreVer']
+# Number of summaries kept in memory (beyond it, artist summaries are dropped after each commit)
+_SUMMARY_CACHE = 1000
+# Rows per query when upsert_many() looks up the rows it replaces
+_UPSERT_CHUNK = 500
+# Rows per query when iter_rows() reads the table
+_ROW_PAGE = 1000
+
+class SongStore:
+    '''
+    Initializes a store of song statistics. Each row holds the values of Song.get_stat_group()
+    and is keyed by the song's key (see LyricsStore.song_key(): its Genius.com ID, or 'Name_Artist'
+    for songs without one), which is stored as its ID, so saving a song again replaces its row. Rows can
+    also hold the hash of the song's lyrics and the version of the statistics. The store keeps
+    running summaries of the statistics (see get_summary()) of all songs and of each artist's,
+    updated in the same transaction as the rows.
+        path : SQLite file of the store
+    '''
+    def __init__(self, path):
+        self._db = sqlite3.connect(path, timeout=30)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        columns = []
+        for header in STAT_HEADERS + _META_HEADERS:
+            if header == 'ID':
+                columns.append('"ID" TEXT NOT NULL PRIMARY KEY')
+            elif header in ['Name', 'Artist'] + _META_HEADERS:
+                columns.append(f'"{header}" TEXT')
+            else:
+                columns.append(f'"{header}" {"INTEGER" if header in _INTEGER_COLUMNS else "REAL"}')
+        self._db.execute(f'CREATE TABLE IF NOT EXISTS songs ({", ".join(columns)})')
+        # Stores created before rows had a lyrics hash and version get the columns (empty)
+        existing = {row[1] : row for row in self._db.execute('PRAGMA table_info(songs)')}
+        for header in _META_HEADERS:
+            if header not in existing:
+                self._db.execute(f'ALTER TABLE songs ADD COLUMN "{header}" TEXT')
+        # Stores created before rows were keyed by song key could hold rows without an ID (saved
+        # again on every save); their rows are rekeyed, keeping the last row saved for each key
+        migrate = existing['ID'][2] != 'TEXT' or not existing['ID'][3]
+        if migrate:
+            self._rekey(columns)
+        self._db.execute('CREATE TABLE IF NOT EXISTS versions (id TEXT PRIMARY KEY, fingerprints TEXT)')
+        # Progress of batch jobs (see lyric_empirics.run_job()), committed with the rows they saved
+        self._db.execute('CREATE TABLE IF NOT EXISTS jobs (name TEXT PRIMARY KEY, state TEXT)')
+        self._db.execute('CREATE TABLE IF NOT EXISTS job_failures (job TEXT, unit INTEGER, item TEXT, '
+                         'error TEXT, attempts INTEGER, PRIMARY KEY (job, unit))')
+        # Summaries of statistics (see stat_summary.SongSummary): scope '' for all songs and
+        # 'artist:' followed by the lowercase artist name for each artist
+        self._db.execute('CREATE TABLE IF NOT EXISTS summaries (scope TEXT PRIMARY KEY, state TEXT)')
+        # Last change of each song key (see get_changes()): the change count of the write that saved
+        # or removed its row
+        self._db.execute('CREATE TABLE IF NOT EXISTS changes (key TEXT PRIMARY KEY, seq INTEGER)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS changes_seq ON changes (seq)')
+        self._db.commit()
+        # SQLite's lower() only lowercases ASCII letters, so artists are matched with Python's
+        self._db.create_function('artist_key', 1, lambda artist: str(artist).lower(), deterministic=True)
+        self._batch_depth = 0
+        self._summaries = dict() # Scope -> SongSummary (loaded on first use)
+        self._dirty = set() # Scopes whose summaries changed since the last commit
+        self._data_version = None # Changes when other connections commit (see _refresh_summaries())
+        headers = STAT_HEADERS + _META_HEADERS
+        quoted = ', '.join(f'"{header}"' for header in headers)
+        self._upsert_sql = f'INSERT OR REPLACE INTO songs ({quoted}) VALUES ({", ".join("?" * len(headers))})'
+        self._stat_columns = ', '.join(f'"{header}"' for header in STAT_HEADERS)
+        # Stores created before summaries were kept (or whose rows were rekeyed) get them from their rows
+        if migrate or (self._db.execute('SELECT COUNT(*) FROM summaries').fetchone()[0] == 0 and len(self) > 0):
+            self.rebuild_summaries()
+
+    '''
+    Return the key of a song's row (see LyricsStore.song_key()).
+        song_id : Song Genius.com ID (None if unknown)
+        name    : Song name
+        artist  : Song artist
+    '''
+    @staticmethod
+    def _key(song_id, name: str = None, artist: str = None) -> str:
+        # IDs read from CSV files with missing IDs are floats
+        if isinstance(song_id, float) and song_id.is_integer():
+            song_id = int(song_id)
+        return LyricsStore.song_key(song_id, name, artist)
+
+    '''
+    Copy the rows into a table keyed by song key (see _key()) and replace the songs table with it.
+    Rows with the same key are merged into the last one saved.
+        columns : Column definitions of the songs table
+    '''
+    def _rekey(self, columns: [str]) -> None:
+        self._db.create_function('song_key', 3, self._key, deterministic=True)
+        quoted = ', '.join(f'"{header}"' for header in STAT_HEADERS + _META_HEADERS)
+        selected = quoted.replace('"ID"', 'song_key("ID", "Name", "Artist")')
+        self._db.execute('BEGIN IMMEDIATE')
+        try:
+            self._db.execute(f'CREATE TABLE songs_keyed ({", ".join(columns)})')
+            self._db.execute(f'INSERT OR REPLACE INTO songs_keyed ({quoted}) SELECT {selected} FROM songs ORDER BY rowid')
+            self._db.execute('DROP TABLE songs')
+            self._db.execute('ALTER TABLE songs_keyed RENAME TO songs')
+        except BaseException:
+            self._db.rollback()
+            raise
+        self._db.commit()
+
+    '''
+    Commit pending changes unless a batch is open.
+    '''
+    def _commit(self) -> None:
+        if self._batch_depth == 0:
+            self._write_summaries()
+            self._db.commit()
+
+    '''
+    Roll back the changes since the last commit, and forget the summaries in memory (they are
+    read from the file again).
+    '''
+    def _rollback(self) -> None:
+        self._db.rollback()
+        self._summaries, self._dirty, self._data_version = dict(), set(), None
+
+    '''
+    Start a write transaction unless one is open, so summaries are read and written while no other
+    connection can save songs.
+    '''
+    def _begin(self) -> None:
+        if not self._db.in_transaction:
+            self._db.execute('BEGIN IMMEDIATE')
+        if not self._dirty:
+            self._refresh_summaries()
+
+    '''
+    Forget the summaries in memory if another connection has committed since they were read.
+    '''
+    def _refresh_summaries(self) -> None:
+        version = self._db.execute('PRAGMA data_version').fetchone()[0]
+        if version != self._data_version:
+            self._summaries, self._data_version = dict(), version
+
+    '''
+    Return the key of the summary of an artist's songs (case-insensitive).
+        artist : Artist name
+    '''
+    @staticmethod
+    def _scope(artist) -> str:
+        return 'artist:' + str(artist).lower()
+
+    '''
+    Return the summary of a scope (see _scope()), reading it from the file if it is not in memory.
+        scope : Summary key
+    '''
+    def _summary(self, scope: str) -> SongSummary:
+        summary = self._summaries.get(scope)
+        if summary is None:
+            row = self._db.execute('SELECT state FROM summaries WHERE scope = ?', (scope,)).fetchone()
+            summary = SongSummary() if row is None else SongSummary.from_dict(json.loads(row[0]))
+            self._summaries[scope] = summary
+        return summary
+
+    '''
+    Update the summaries of all songs and of the song's artist after its row was replaced.
+        old : Values of Song.get_stat_group() of the replaced row (None if the song was added)
+        new : Values of Song.get_stat_group() of the new row (None if the song was removed)
+    '''
+    def _summarize(self, old: list, new: list) -> None:
+        for row, add in [(old, False), (new, True)]:
+            if row is None:
+                continue
+            for scope in ['', self._scope(row[1])]:
+                summary = self._summary(scope)
+                summary.add(row) if add else summary.remove(row)
+                self._dirty.add(scope)
+
+    '''
+    Write the summaries that changed since the last commit, then drop the artist summaries from
+    memory if there are too many.
+    '''
+    def _write_summaries(self) -> None:
+        if self._dirty:
+            self._db.executemany('INSERT OR REPLACE INTO summaries VALUES (?, ?)',
+                                 [(scope, json.dumps(self._summaries[scope].to_dict())) for scope in self._dirty])
+            self._dirty = set()
+        if len(self._summaries) > _SUMMARY_CACHE:
+            self._summaries = {scope : summary for scope, summary in self._summaries.items() if scope == ''}
+
+    '''
+    Return the statistics of the stored rows of songs (values of Song.get_stat_group()) by key.
+        keys : Song keys (see _key(); keys that are not stored are left out)
+    '''
+    def _get_stats(self, keys: list) -> dict:
+        keys = list(set(keys))
+        if not keys:
+            return dict()
+        rows = self._db.execute(f'SELECT {self._stat_columns} FROM songs WHERE "ID" IN ({", ".join("?" * len(keys))})',
+                                keys).fetchall()
+        return {row[2] : list(row) for row in rows}
+
+    '''
+    Record that the rows of songs were saved or removed, as one more write (see get_change_count()).
+        keys : Song keys (see _key())
+    '''
+    def _record_changes(self, keys: list) -> None:
+        seq = self.get_change_count() + 1
+        self._db.executemany('INSERT OR REPLACE INTO changes VALUES (?, ?)', [(key, seq) for key in keys])
+
+    '''
+    Add or replace the row of a song.
+        stats       : Values of Song.get_stat_group() (the ID is replaced by the song's key)
+        lyrics_hash : Hash of the lyrics the statistics were computed from (None if unknown)
+        version     : Id of the statistic fingerprints (see add_version(); None if unknown)
+    '''
+    def upsert(self, stats: list, lyrics_hash: str = None, version: str = None) -> None:
+        stats = list(stats)
+        stats[2] = self._key(stats[2], stats[0], stats[1])
+        self._begin()
+        old = self._get_stats([stats[2]]).get(stats[2])
+        self._db.execute(self._upsert_sql, stats + [lyrics_hash, version])
+        self._summarize(old, stats)
+        self._record_changes([stats[2]])
+        self._commit()
+
+    '''
+    Add or replace the rows of many songs in one transaction.
+        rows : Iterable of Song.get_stat_group() values, optionally followed by the lyrics hash
+               and version (as in upsert())
+    '''
+    def upsert_many(self, rows) -> None:
+        padding = len(STAT_HEADERS) + len(_META_HEADERS)
+        rows = iter(rows)
+        # Nothing is saved if reading the rows fails
+        with self.batch():
+            self._begin()
+            seq = self.get_change_count() + 1
+            while chunk := [list(row) + [None] * (padding - len(row)) for row in itertools.islice(rows, _UPSERT_CHUNK)]:
+                for row in chunk:
+                    row[2] = self._key(row[2], row[0], row[1])
+                # The rows being replaced are retracted from the summaries (a song can appear twice in a chunk)
+                stored = self._get_stats([row[2] for row in chunk])
+                self._db.executemany(self._upsert_sql, chunk)
+                for row in chunk:
+                    stats = row[:len(STAT_HEADERS)]
+                    self._summarize(stored.get(row[2]), stats)
+                    stored[row[2]] = stats
+                self._db.executemany('INSERT OR REPLACE INTO changes VALUES (?, ?)', [(row[2], seq) for row in chunk])
+
+    '''
+    Record a set of statistic fingerprints and return its id (a hash of the fingerprints), which
+    rows store as their version.
+        fingerprints : Dict of statistic names and fingerprints (see Song.get_stat_fingerprints())
+    '''
+    def add_version(self, fingerprints: {str : str}) -> str:
+        text = json.dumps(fingerprints, sort_keys=True)
+        version = hashlib.sha1(text.encode('utf-8')).hexdigest()[:16]
+        self._db.execute('INSERT OR IGNORE INTO versions VALUES (?, ?)', (version, text))
+        self._commit()
+        return version
+
+    '''
+    Return the statistic fingerprints of a version, or None if the version is unknown.
+        version : Version id (see add_version())
+    '''
+    def get_version(self, version: str) -> {str : str}:
+        row = self._db.execute('SELECT fingerprints FROM versions WHERE id = ?', (version,)).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    '''
+    Yield every row as a dict (keys are STAT_HEADERS, 'LyrHash', and 'ScoreVer'). Rows are read
+    _ROW_PAGE at a time in rowid order, so only one page is held in memory and rows can be written
+    between pages. Only the rows stored when iterating starts are yielded: a replaced row gets a
+    new rowid past them, so rows written while iterating are not yielded (again).
+    '''
+    def iter_rows(self) -> dict:
+        headers = STAT_HEADERS + _META_HEADERS
+        last, end = 0, self._db.execute('SELECT COALESCE(MAX(rowid), 0) FROM songs').fetchone()[0]
+        while last < end:
+            rows = self._db.execute('SELECT rowid, * FROM songs WHERE rowid > ? AND rowid <= ? ORDER BY rowid LIMIT ?',
+                                    (last, end, _ROW_PAGE)).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield dict(zip(headers, row[1:]))
+            last = rows[-1][0]
+
+    '''
+    Group the changes made inside a with-block into one transaction, committed at the end of the
+    block. If the block raises an exception (including KeyboardInterrupt), the changes are rolled
+    back instead (by the outermost block if batches are nested).
+    '''
+    @contextlib.contextmanager
+    def batch(self):
+        self._batch_depth += 1
+        try:
+            yield self
+        except BaseException:
+            self._batch_depth -= 1
+            if self._batch_depth == 0:
+                self._rollback()
+            raise
+        self._batch_depth -= 1
+        self._commit()
+
+    '''
+    Return the row of a song as a dict (keys are STAT_HEADERS, 'LyrHash', and 'ScoreVer'), or None
+    if it is not stored.
+        song_id : Song Genius.com ID (or 'Name_Artist' for songs saved without one)
+    '''
+    def get(self, song_id) -> dict:
+        row = self._db.execute('SELECT * FROM songs WHERE "ID" = ?', (self._key(song_id),)).fetchone()
+        return None if row is None else dict(zip(STAT_HEADERS + _META_HEADERS, row))
+
+    '''
+    Remove the row of a song.
+        song_id : Song Genius.com ID (or 'Name_Artist' for songs saved without one)
+    '''
+    def delete(self, song_id) -> None:
+        key = self._key(song_id)
+        self._begin()
+        old = self._get_stats([key]).get(key)
+        self._db.execute('DELETE FROM songs WHERE "ID" = ?', (key,))
+        self._summarize(old, None)
+        self._record_changes([key])
+        self._commit()
+
+    '''
+    Return the state of a batch job (a dict of JSON values), or None if there is no such job.
+        name : Job name
+    '''
+    def get_job(self, name: str) -> dict:
+        row = self._db.execute('SELECT state FROM jobs WHERE name = ?', (name,)).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    '''
+    Add or replace the state of a batch job.
+        name  : Job name
+        state : Dict of JSON values
+    '''
+    def put_job(self, name: str, state: dict) -> None:
+        self._db.execute('INSERT OR REPLACE INTO jobs VALUES (?, ?)', (name, json.dumps(state)))
+        self._commit()
+
+    '''
+    Remove a batch job and its failures.
+        name : Job name
+    '''
+    def delete_job(self, name: str) -> None:
+        self._db.execute('DELETE FROM jobs WHERE name = ?', (name,))
+        self._db.execute('DELETE FROM job_failures WHERE job = ?', (name,))
+        self._commit()
+
+    '''
+    Record a failed unit of work of a batch job, counting the attempts made at it.
+        name  : Job name
+        unit  : Position of the unit in the job
+        item  : Dict of JSON values describing the unit (enough to try it again)
+        error : Description of the error
+    '''
+    def put_job_failure(self, name: str, unit: int, item: dict, error: str) -> None:
+        self._db.execute('INSERT INTO job_failures VALUES (?, ?, ?, ?, 1) ON CONFLICT (job, unit) '
+                         'DO UPDATE SET error = excluded.error, attempts = attempts + 1',
+                         (name, unit, json.dumps(item), error))
+        self._commit()
+
+    '''
+    Remove a unit of work from the failures of a batch job (e.g. after it succeeded).
+        name : Job name
+        unit : Position of the unit in the job
+    '''
+    def delete_job_failure(self, name: str, unit: int) -> None:
+        self._db.execute('DELETE FROM job_failures WHERE job = ? AND unit = ?', (name, unit))
+        self._commit()
+
+    '''
+    Return the failures of a batch job in order of units, as dicts with keys 'unit', 'item',
+    'error', and 'attempts'.
+        name : Job name
+    '''
+    def get_job_failures(self, name: str) -> [dict]:
+        rows = self._db.execute('SELECT unit, item, error, attempts FROM job_failures WHERE job = ? ORDER BY unit',
+                                (name,)).fetchall()
+        return [{'unit' : unit, 'item' : json.loads(item), 'error' : error, 'attempts' : attempts}
+                for unit, item, error, attempts in rows]
+
+    '''
+    Return the number of failed units of work of a batch job.
+        name : Job name
+    '''
+    def count_job_failures(self, name: str) -> int:
+        return self._db.execute('SELECT COUNT(*) FROM job_failures WHERE job = ?', (name,)).fetchone()[0]
+
+    '''
+    Return the number of writes (upserts and deletes) made to the rows, by this or any other
+    connection to the file, so results computed from the rows can tell when they are out of date
+    (see get_changes()). The count is stored in the file and only grows.
+    '''
+    def get_change_count(self) -> int:
+        return self._db.execute('SELECT COALESCE(MAX(seq), 0) FROM changes').fetchone()[0]
+
+    '''
+    Return the rows saved and the keys of the rows removed after a change count (see
+    get_change_count()), along with the change count they bring the caller to.
+        since : Change count the caller's results were computed at
+    Returns (change count, DataFrame of saved rows (columns are STAT_HEADERS), removed keys).
+    '''
+    def get_changes(self, since: int) -> (int, 'pandas.DataFrame', [str]):
+        import pandas as pd
+        # One query, so the rows and the change count are read from the same snapshot
+        stat_columns = ', '.join(f's."{header}"' for header in STAT_HEADERS)
+        rows = self._db.execute(f'SELECT c.seq, c.key, {stat_columns} FROM changes c LEFT JOIN songs s ON s."ID" = c.key '
+                                'WHERE c.seq > ? ORDER BY c.seq, s.rowid', (since,)).fetchall()
+        count = max([since] + [row[0] for row in rows])
+        saved = pd.DataFrame.from_records([row[2:] for row in rows if row[4] is not None], columns=STAT_HEADERS)
+        return count, saved, [row[1] for row in rows if row[4] is None]
+
+    '''
+    Return the running summary of the statistics of an artist's songs (case-insensitive), or of
+    all songs if artist is None. It is read from memory or one row of the file, except that a min
+    or max made stale by replaced or removed songs is first recomputed from the rows.
+        artist : Artist name (None = all songs)
+    '''
+    def get_summary(self, artist: str = None) -> SongSummary:
+        if not self._dirty:
+            self._refresh_summaries()
+        scope = '' if artist is None else self._scope(artist)
+        if not any(self._summary(scope).get_column(header).is_stale() for header in SUMMARY_HEADERS):
+            return self._summary(scope)
+        # The bounds are recomputed (and saved) while no other connection can change the rows
+        self._begin()
+        summary = self._summary(scope)
+        stale = [header for header in SUMMARY_HEADERS if summary.get_column(header).is_stale()]
+        if stale:
+            where, params = ('', ()) if artist is None else (' WHERE artist_key("Artist") = ?', (str(artist).lower(),))
+            bounds = ', '.join(f'MIN("{header}"), MAX("{header}")' for header in stale)
+            row = self._db.execute(f'SELECT {bounds} FROM songs{where}', params).fetchone()
+            for i, header in enumerate(stale):
+                summary.get_column(header).set_bounds(row[2 * i], row[2 * i + 1])
+            self._dirty.add(scope)
+        self._commit()
+        return summary
+
+    '''
+    Recompute every summary from the rows (e.g. after the file was changed without this class).
+    '''
+    def rebuild_summaries(self) -> None:
+        self._begin()
+        summaries = summarize(self._db.execute(f'SELECT {self._stat_columns} FROM songs'))
+        self._db.execute('DELETE FROM summaries')
+        self._summaries = {'' if artist is None else self._scope(artist) : summary for artist, summary in summaries.items()}
+        self._dirty = set(self._summaries)
+        self._commit()
+
+    def __len__(self) -> int:
+        return self._db.execute('SELECT COUNT(*) FROM songs').fetchone()[0]
+
+    '''
+    Return all rows as a DataFrame (columns are STAT_HEADERS), in the order they were last saved.
+    '''
+    def to_dataframe(self) -> 'pandas.DataFrame':
+        import pandas as pd
+        return pd.read_sql_query(f'SELECT {self._stat_columns} FROM songs ORDER BY rowid', self._db)
+
+    '''
+    Write all rows to a CSV file (same layout as the original 'song_data.csv').
+        path : CSV file to write
+    '''
+    def export_csv(self, path) -> None:
+        self.to_dataframe().to_csv(path, index=False, encoding='utf-8')
+
+    '''
+    Write all rows to a Parquet file (requires pyarrow or fastparquet).
+        path : Parquet file to write
+    '''
+    def export_parquet(self, path) -> None:
+        self.to_dataframe().to_parquet(path, index=False)
+
+    '''
+    Add the rows of a CSV file written by an earlier version of save_song() (or export_csv()).
+        path : CSV file to read
+    '''
+    def import_csv(self, path) -> None:
+        import pandas as pd
+        df = pd.read_csv(path)
+        df = df.astype(object).where(df.notna(), None)
+        self.upsert_many(df[STAT_HEADERS].itertuples(index=False, name=None))
+
+    '''
+    Close the SQLite file.
+    '''
+    def close(self) -> None:
+        self._write_summaries()
+        self._db.commit()
+        self._db.close()
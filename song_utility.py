@@ -3,7 +3,17 @@
 # Utility functions specifically for songs
 
 import utility
+import rhyme_matrix
+import profiling
+import numpy
 import re
+import collections
+import sys
+
+# Headers of the sections whose lines are analyzed (lines under other headers are skipped)
+SECTION_HEADERS = ['verse','chorus','hook','refrain','bridge','pre chorus', 'post chorus']
+# Largest number of word pairs that find_rhyme_block scores one pair at a time
+_SMALL_BLOCK = 256
 
 '''
 Remove ending tag (number followed by EmbedShare URLCopyEmbedCopy) placed
@@ -19,7 +29,8 @@ def remove_tag(lyrics: str) -> str:
     tag = 'EmbedShare URLCopyEmbedCopy'
     pattern = '([0-9]+(\.[0-9]+)?[KMB]?)?' + tag
     sequence = re.search(pattern, last)
-    match = sequence.group(0)
+    # Lyrics that were not taken from Genius (e.g. local files) may have no tag
+    match = None if sequence is None else sequence.group(0)
     if match:
         lines[-1] = last[:last.find(match)]
     return '\n'.join(lines)
@@ -30,32 +41,80 @@ particular section in the song.
     lyrics : Song lyrics
 '''
 def extract_all_sections(lyrics: str) -> [[str]]:
-    headers = ['verse','chorus','hook','refrain','bridge','pre chorus', 'post chorus']
+    return extract_sections_and_words(lyrics)[0]
+
+'''
+Returns the sections of a song (as in extract_all_sections) and, in the same pass over the
+lyrics, the words of each section (each cleaned line is split into words once).
+    lyrics : Song lyrics
+'''
+def extract_sections_and_words(lyrics: str) -> ([[str]], [[str]]):
+    return _parse_sections(lyrics)[:2]
+
+'''
+Returns, for each section of a song (as in extract_all_sections), the number of the lyrics line
+holding its header and the numbers of the lyrics lines holding its lines (numbered from 0), so
+sections and lines can be edited in the lyrics.
+    lyrics : Song lyrics
+'''
+def find_section_line_numbers(lyrics: str) -> [(int, [int])]:
+    return _parse_sections(lyrics)[2]
+
+'''
+Returns True if a cleaned line is a section header (text in square brackets); False otherwise.
+    line : Cleaned line (see utility.clean_string)
+'''
+def is_header(line: str) -> bool:
+    return len(line) >= 2 and line[0] == '[' and line[-1] == ']'
+
+'''
+Returns True if a cleaned section header starts a section whose lines are analyzed (one of
+SECTION_HEADERS right after the '['); False otherwise.
+    header : Cleaned section header
+'''
+def starts_section(header: str) -> bool:
+    return any(header.find(h) == 1 for h in SECTION_HEADERS)
+
+'''
+Returns the sections of a song, the words of each section, and the line numbers of each section
+(see find_section_line_numbers), in one pass over the lyrics.
+    lyrics : Song lyrics
+'''
+def _parse_sections(lyrics: str) -> ([[str]], [[str]], [(int, [int])]):
     sections = []
+    section_words = []
+    line_numbers = []
     section = []
+    words = []
+    numbers = []
+    header = None
     inside_section = False
-    for line in lyrics.split('\n'):
+    for number, line in enumerate(lyrics.split('\n')):
         line = utility.clean_string(line)
         if line == '':
             continue
-        if len(line) >= 2 and line[0] == '[' and line[-1] == ']': # [] denotes section start
-            for h in headers:
-                if line.find(h) == 1: # header should be right after '['
-                    inside_section = True
-                    break
-                else:
-                    inside_section = False
-            sections.append(section)
+        if is_header(line): # [] denotes section start
+            inside_section = starts_section(line)
+            if section != []:
+                sections.append(section)
+                section_words.append(words)
+                line_numbers.append((header, numbers))
             section = []
+            words = []
+            numbers = []
+            header = number
         # line is not a section header AND we are in a section
         elif inside_section: 
             section.append(line)
+            # Interned words are shared by all songs that use them
+            words.extend(map(sys.intern, line.split()))
+            numbers.append(number)
     # If song ends on a section, we need to add "section" because it is nonempty
-    # If song doesn't end on a section, adding "section" does nothing because
-    #   it is empty
-    sections.append(section)
-    # Return nonempty lists only
-    return [s for s in sections if s != []]
+    if section != []:
+        sections.append(section)
+        section_words.append(words)
+        line_numbers.append((header, numbers))
+    return sections, section_words, line_numbers
 
 '''
 Returns a list of sets where each set contains the unique words in a particular section.
@@ -70,33 +129,134 @@ def find_sections_unique_words(sections: [[str]]) -> [{str}]:
     return unique_words
 
 
+'''
+Returns the number of sections each word appears in (word -> section count), counted in one
+pass over the sections' unique words.
+    sections_unique : List of unique words in each section
+'''
+def find_section_frequencies(sections_unique: [{str}]) -> {str : int}:
+    frequencies = collections.Counter()
+    for words in sections_unique:
+        frequencies.update(words)
+    return frequencies
+
 '''
 Returns the percentage of unique words that are shared by at least two sections.
     sections        : List of list of strings containing lyrics from each section
     sections_unique : List of unique words in each section
     unique_count    : Number of total unique words in the song
+    frequencies     : Section count of each word (computed from sections_unique if not given)
 '''
-def find_shared_unique_pct(sections: [[str]], sections_unique: [{str}], unique_count: int) -> float:
-    shared_words = set()
-    for i in range(len(sections_unique)):
-        set1 = sections_unique[i]
-        for j in range(i+1, len(sections_unique)):
-            set2 = sections_unique[j]
-            shared_words.update(set1.intersection(set2))
-    return round(len(shared_words) / unique_count, 4)
+def find_shared_unique_pct(sections: [[str]], sections_unique: [{str}], unique_count: int,
+                           frequencies: {str : int} = None) -> float:
+    if frequencies is None:
+        frequencies = find_section_frequencies(sections_unique)
+    shared_count = sum(1 for count in frequencies.values() if count >= 2)
+    return round(shared_count / unique_count, 4)
 
 '''
 Returns the number of syllables per word in the song.
     words : List of all words in the song
 '''
 def find_syllables_per_word(words: [str]) -> float:
-    return round(sum(utility.syllable_count(word) for word in words) / len(words), 4)
+    # Count each distinct word once, weighted by how often it appears
+    return syllables_per_word_from_counts(collections.Counter(words), len(words))
+
+'''
+Returns the number of syllables per word in the song, from the number of times each word appears.
+    counts     : Dict of words and their number of occurrences
+    word_count : Total number of words (sum of counts)
+'''
+def syllables_per_word_from_counts(counts: {str : int}, word_count: int) -> float:
+    return round(sum(utility.syllable_count(word) * count for word, count in counts.items()) / word_count, 4)
+
+'''
+Return the list of words in a word set and the matrix of rhyme scores between every pair of
+them (row/column i of the matrix belongs to word i of the list). The pair score cache is used
+if one is set.
+    words : Unique word set of which to find rhyme scores
+'''
+def find_rhyme_matrix(words: {str}) -> ([str], 'numpy.ndarray'):
+    words = list(words)
+    cache = utility.get_pair_cache()
+    return words, rhyme_matrix.rhyme_score_matrix(words, None if len(words) < 2 else cache)
+
+'''
+Return the matrix of rhyme scores of every word of words1 (rows, the first word of each pair) with
+every word of words2 (columns). Small blocks are scored one pair at a time, which is faster than
+setting up rhyme_matrix.rhyme_score_block for a few pairs.
+    words1 : List of words of the rows
+    words2 : List of words of the columns (pairs of the same word score 0)
+'''
+def find_rhyme_block(words1: [str], words2: [str]) -> 'numpy.ndarray':
+    if len(words1) * len(words2) <= _SMALL_BLOCK:
+        scores = [utility.pair_rhyme_score(word1, word2) for word1 in words1 for word2 in words2]
+        return numpy.array(scores, dtype=float).reshape(len(words1), len(words2))
+    return rhyme_matrix.rhyme_score_block(list(words1), list(words2))
+
+'''
+Return the list of words and rhyme score matrix (as returned by find_rhyme_matrix) after words
+are added to and removed from the word set. Only the pairs that involve an added word are scored.
+    words   : List of words of the matrix rows/columns
+    matrix  : Rhyme score matrix of the words
+    added   : Words to add (not in words)
+    removed : Words to remove
+'''
+def update_rhyme_matrix(words: [str], matrix: 'numpy.ndarray', added: [str], removed: [str]) -> ([str], 'numpy.ndarray'):
+    removed = set(removed)
+    kept = [i for i in range(len(words)) if words[i] not in removed]
+    new_words = [words[i] for i in kept] + list(added)
+    new_matrix = numpy.zeros((len(new_words), len(new_words)))
+    new_matrix[:len(kept), :len(kept)] = matrix[numpy.ix_(kept, kept)]
+    if added:
+        new_matrix[len(kept):] = find_rhyme_block(list(added), new_words)
+        new_matrix[:len(kept), len(kept):] = find_rhyme_block(new_words[:len(kept)], list(added))
+    return new_words, new_matrix
+
+'''
+Return a dict with keys being unique words and values being their rhyme scores, taken from
+the rows of a rhyme score matrix.
+    words  : List of words of the matrix rows/columns
+    matrix : Rhyme score matrix of the words
+'''
+def rhyme_scores_from_matrix(words: [str], matrix: 'numpy.ndarray') -> {str : float}:
+    if len(words) < 2:
+        return dict()
+    totals = matrix.sum(axis=1)
+    return {words[i] : float(totals[i]) for i in range(len(words))}
+
+'''
+Return the sum of rhyme scores computed within each section, using the rhyme score matrix
+of the whole song instead of rescoring every section's words.
+    words           : List of words of the matrix rows/columns
+    matrix          : Rhyme score matrix of the song's unique words
+    sections_unique : List of unique words in each section
+'''
+def find_proximity_rhyme_score(words: [str], matrix: 'numpy.ndarray', sections_unique: [{str}]) -> float:
+    positions = {words[i] : i for i in range(len(words))}
+    # Row s of masks marks the words that appear in section s
+    masks = numpy.zeros((len(sections_unique), len(words)))
+    for s in range(len(sections_unique)):
+        masks[s, [positions[word] for word in sections_unique[s]]] = 1
+    profiling.count('proximity_pairs', sum(len(section) * (len(section) - 1) for section in sections_unique))
+    # Sum of matrix[i][j] over pairs of words i, j that are both in the same section
+    return float(((masks @ matrix) * masks).sum())
 
 '''
 Return a dict with keys being unique words and values being their rhyme scores.
+Scores are computed with one rhyme score matrix for the whole word set.
     words : Unique word set of which to find rhyme scores
 '''
 def find_rhyme_scores(words: {str}) -> {str : float}:
+    return rhyme_scores_from_matrix(*find_rhyme_matrix(words))
+
+'''
+Return a dict with keys being unique words and values being their rhyme scores.
+Scores are computed one pair at a time with utility.pair_rhyme_score (reference
+implementation for find_rhyme_scores).
+    words : Unique word set of which to find rhyme scores
+'''
+def find_rhyme_scores_pairwise(words: {str}) -> {str : float}:
     scores = dict()
     for word1 in words:
         for word2 in words:
@@ -104,4 +264,3 @@ def find_rhyme_scores(words: {str}) -> {str : float}:
                 rhyme_score = utility.pair_rhyme_score(word1, word2)
                 scores[word1] = scores.get(word1, 0) + rhyme_score
     return scores
-    
@@ -0,0 +1,332 @@
+# stat_summary.py
+
+# Running summaries of song statistics (count, mean, variance, min/max, quantiles) that are
+# updated one song at a time, can have songs removed, and can be merged
+
+import math
+from song import STAT_HEADERS
+
+# Columns that are summarized (everything after the name, artist, and ID)
+SUMMARY_HEADERS = STAT_HEADERS[3:]
+
+class QuantileSketch:
+    '''
+    Initializes a sketch of a distribution of numbers that answers quantile queries with a
+    relative error of at most accuracy. Numbers are counted in buckets whose bounds grow
+    geometrically (as in DDSketch), so the sketch stays small however many numbers it holds,
+    sketches can be merged by adding their counts, and numbers can be removed as well as added.
+        accuracy : Relative accuracy of quantiles (e.g. 0.01 = 1%)
+    '''
+    def __init__(self, accuracy: float = 0.01):
+        if not 0 < accuracy < 1:
+            raise ValueError(f"QuantileSketch: Parameter accuracy must be between 0 and 1")
+        self._accuracy = accuracy
+        self._gamma = (1 + accuracy) / (1 - accuracy)
+        self._log_gamma = math.log(self._gamma)
+        self._positive = dict() # Bucket -> count of positive numbers
+        self._negative = dict() # Bucket -> count of negative numbers (bucket of their absolute value)
+        self._zeros = 0
+        self._count = 0
+
+    '''
+    Count a number (or remove it, if count is negative).
+        value : Number
+        count : Number of times to count it
+    '''
+    def add(self, value: float, count: int = 1) -> None:
+        if value == 0:
+            self._zeros += count
+        else:
+            buckets = self._positive if value > 0 else self._negative
+            bucket = math.ceil(math.log(abs(value)) / self._log_gamma)
+            total = buckets.get(bucket, 0) + count
+            if total:
+                buckets[bucket] = total
+            else:
+                del buckets[bucket]
+        self._count += count
+
+    '''
+    Remove a number that was added before.
+        value : Number
+    '''
+    def remove(self, value: float) -> None:
+        self.add(value, -1)
+
+    '''
+    Add the counts of another sketch (with the same accuracy) to this one.
+        other : Sketch to merge
+    '''
+    def merge(self, other: 'QuantileSketch') -> None:
+        if other._accuracy != self._accuracy:
+            raise ValueError(f"QuantileSketch.merge: Sketches must have the same accuracy")
+        for buckets, other_buckets in [(self._positive, other._positive), (self._negative, other._negative)]:
+            for bucket, count in other_buckets.items():
+                total = buckets.get(bucket, 0) + count
+                if total:
+                    buckets[bucket] = total
+                else:
+                    del buckets[bucket]
+        self._zeros += other._zeros
+        self._count += other._count
+
+    def __len__(self) -> int:
+        return self._count
+
+    '''
+    Return the q-quantile of the numbers (e.g. q = 0.5 for the median), or None if there are none.
+        q : Quantile, between 0 and 1
+    '''
+    def quantile(self, q: float) -> float:
+        if not 0 <= q <= 1:
+            raise ValueError(f"QuantileSketch.quantile: Parameter q must be between 0 and 1")
+        if self._count <= 0:
+            return None
+        rank = q * (self._count - 1)
+        seen = 0
+        # Negative numbers from the most negative, then zeros, then positive numbers
+        for bucket in sorted(self._negative, reverse=True):
+            seen += self._negative[bucket]
+            if seen > rank:
+                return -self._value(bucket)
+        seen += self._zeros
+        if seen > rank:
+            return 0.0
+        for bucket in sorted(self._positive):
+            seen += self._positive[bucket]
+            if seen > rank:
+                return self._value(bucket)
+        return self._value(max(self._positive)) if self._positive else 0.0
+
+    '''
+    Return the number that represents a bucket (within the sketch's accuracy of all its numbers).
+        bucket : Bucket index
+    '''
+    def _value(self, bucket: int) -> float:
+        return 2 * self._gamma**bucket / (self._gamma + 1)
+
+    '''
+    Return the sketch as a dict of JSON values. Buckets are written as the first bucket and the
+    counts of every bucket from it to the last (the buckets in use are mostly contiguous).
+    '''
+    def to_dict(self) -> dict:
+        dense = lambda buckets: [min(buckets), [buckets.get(bucket, 0) for bucket in range(min(buckets), max(buckets) + 1)]] \
+                                if buckets else [0, []]
+        return {'accuracy' : self._accuracy, 'zeros' : self._zeros,
+                'positive' : dense(self._positive), 'negative' : dense(self._negative)}
+
+    '''
+    Return a sketch from a dict returned by to_dict().
+        data : Dict of JSON values
+    '''
+    @staticmethod
+    def from_dict(data: dict) -> 'QuantileSketch':
+        sketch = QuantileSketch(data['accuracy'])
+        sketch._zeros = data['zeros']
+        sparse = lambda first, counts: {first + i : count for i, count in enumerate(counts) if count}
+        sketch._positive = sparse(*data['positive'])
+        sketch._negative = sparse(*data['negative'])
+        sketch._count = sketch._zeros + sum(sketch._positive.values()) + sum(sketch._negative.values())
+        return sketch
+
+class ColumnSummary:
+    '''
+    Initializes a running summary of the values of one statistic: count, mean and variance
+    (Welford's algorithm), min and max, and a quantile sketch. Values can be removed; if a
+    removed value was the min (or max), that bound is marked stale (see is_stale()) until a value
+    at least as small (or large) is added or set_bounds() gives the new bounds.
+        accuracy : Relative accuracy of quantiles
+    '''
+    def __init__(self, accuracy: float = 0.01):
+        self._count = 0
+        self._mean = 0.0
+        self._m2 = 0.0 # Sum of squared differences from the mean
+        self._min = None
+        self._max = None
+        self._stale = [False, False] # Whether the min and the max may be wrong
+        self._sketch = QuantileSketch(accuracy)
+
+    '''
+    Add a value.
+        value : Value of the statistic
+    '''
+    def add(self, value: float) -> None:
+        self._count += 1
+        delta = value - self._mean
+        self._mean += delta / self._count
+        self._m2 += delta * (value - self._mean)
+        # A stale bound is still a bound of the values, so a value beyond it is the new bound
+        if self._min is None or value <= self._min:
+            self._min, self._stale[0] = value, False
+        if self._max is None or value >= self._max:
+            self._max, self._stale[1] = value, False
+        self._sketch.add(value)
+
+    '''
+    Remove a value that was added before (Welford's algorithm in reverse).
+        value : Value of the statistic
+    '''
+    def remove(self, value: float) -> None:
+        self._count -= 1
+        self._sketch.remove(value)
+        if self._count == 0:
+            self._mean, self._m2, self._min, self._max, self._stale = 0.0, 0.0, None, None, [False, False]
+            return
+        delta = value - self._mean
+        self._mean -= delta / self._count
+        self._m2 = max(self._m2 - delta * (value - self._mean), 0.0)
+        self._stale = [self._stale[0] or value <= self._min, self._stale[1] or value >= self._max]
+
+    '''
+    Add the values of another summary (with the same accuracy) to this one (Chan et al.'s
+    parallel variance formula), e.g. to combine the summaries of songs saved by different workers.
+        other : Summary to merge
+    '''
+    def merge(self, other: 'ColumnSummary') -> None:
+        self._sketch.merge(other._sketch)
+        if other._count == 0:
+            return
+        count = self._count + other._count
+        delta = other._mean - self._mean
+        self._mean += delta * other._count / count
+        self._m2 += other._m2 + delta**2 * self._count * other._count / count
+        if self._min is None or other._min <= self._min:
+            self._min, self._stale[0] = other._min, other._stale[0] or (self._stale[0] and other._min == self._min)
+        if self._max is None or other._max >= self._max:
+            self._max, self._stale[1] = other._max, other._stale[1] or (self._stale[1] and other._max == self._max)
+        self._count = count
+
+    '''
+    Return True if a removed value was the min or max, so the bounds may be wrong; False otherwise.
+    '''
+    def is_stale(self) -> bool:
+        return self._stale[0] or self._stale[1]
+
+    '''
+    Set the min and max (e.g. after values were removed).
+        low  : Smallest value
+        high : Largest value
+    '''
+    def set_bounds(self, low: float, high: float) -> None:
+        self._min, self._max, self._stale = low, high, [False, False]
+
+    '''
+    Return the count, mean, sample variance and standard deviation (None for fewer than two
+    values), min, and max of the values.
+    '''
+    def get_stats(self) -> dict:
+        variance = self._m2 / (self._count - 1) if self._count > 1 else None
+        return {'count' : self._count, 'mean' : self._mean if self._count else None, 'variance' : variance,
+                'std' : None if variance is None else math.sqrt(variance), 'min' : self._min, 'max' : self._max}
+
+    '''
+    Return the q-quantile of the values (within the sketch's accuracy), or None if there are none.
+        q : Quantile, between 0 and 1
+    '''
+    def quantile(self, q: float) -> float:
+        return self._sketch.quantile(q)
+
+    '''
+    Return the summary as a dict of JSON values.
+    '''
+    def to_dict(self) -> dict:
+        return {'count' : self._count, 'mean' : self._mean, 'm2' : self._m2, 'min' : self._min,
+                'max' : self._max, 'stale' : self._stale, 'sketch' : self._sketch.to_dict()}
+
+    '''
+    Return a summary from a dict returned by to_dict().
+        data : Dict of JSON values
+    '''
+    @staticmethod
+    def from_dict(data: dict) -> 'ColumnSummary':
+        summary = ColumnSummary.__new__(ColumnSummary)
+        summary._count, summary._mean, summary._m2 = data['count'], data['mean'], data['m2']
+        summary._min, summary._max, summary._stale = data['min'], data['max'], list(data['stale'])
+        summary._sketch = QuantileSketch.from_dict(data['sketch'])
+        return summary
+
+class SongSummary:
+    '''
+    Initializes a running summary of the statistics of a group of songs (e.g. one artist's), with
+    one ColumnSummary per column of SUMMARY_HEADERS. Missing values (songs without sections) are
+    left out.
+        accuracy : Relative accuracy of quantiles
+    '''
+    def __init__(self, accuracy: float = 0.01):
+        self._columns = {header : ColumnSummary(accuracy) for header in SUMMARY_HEADERS}
+
+    '''
+    Add the statistics of a song.
+        stats : Values of Song.get_stat_group() (or a dict with STAT_HEADERS keys)
+    '''
+    def add(self, stats) -> None:
+        for header, value in self._values(stats):
+            self._columns[header].add(value)
+
+    '''
+    Remove the statistics of a song that were added before.
+        stats : Values of Song.get_stat_group() (or a dict with STAT_HEADERS keys)
+    '''
+    def remove(self, stats) -> None:
+        for header, value in self._values(stats):
+            self._columns[header].remove(value)
+
+    '''
+    Add the songs of another summary to this one.
+        other : Summary to merge
+    '''
+    def merge(self, other: 'SongSummary') -> None:
+        for header, column in other._columns.items():
+            self._columns[header].merge(column)
+
+    '''
+    Return the summary of a column.
+        header : Column name (one of SUMMARY_HEADERS)
+    '''
+    def get_column(self, header: str) -> ColumnSummary:
+        if header not in self._columns:
+            raise ValueError(f"SongSummary: {header} is not a statistic (choose from {', '.join(SUMMARY_HEADERS)})")
+        return self._columns[header]
+
+    '''
+    Return the (column, value) pairs of a song's statistics that are not missing.
+        stats : Values of Song.get_stat_group() (or a dict with STAT_HEADERS keys)
+    '''
+    @staticmethod
+    def _values(stats) -> [(str, float)]:
+        values = [stats[header] for header in SUMMARY_HEADERS] if isinstance(stats, dict) else stats[3:]
+        return [(header, value) for header, value in zip(SUMMARY_HEADERS, values)
+                if value is not None and not (isinstance(value, float) and math.isnan(value))]
+
+    '''
+    Return the summary as a dict of JSON values.
+    '''
+    def to_dict(self) -> dict:
+        return {header : column.to_dict() for header, column in self._columns.items()}
+
+    '''
+    Return a summary from a dict returned by to_dict().
+        data : Dict of JSON values
+    '''
+    @staticmethod
+    def from_dict(data: dict) -> 'SongSummary':
+        summary = SongSummary.__new__(SongSummary)
+        summary._columns = {header : ColumnSummary.from_dict(column) for header, column in data.items()}
+        return summary
+
+'''
+Return the summaries of many songs' statistics: one for all songs (key None) and one per artist
+(keys are lowercase artist names). Summaries of separate groups of songs (e.g. ones analyzed by
+different workers) can be combined with SongSummary.merge().
+    rows     : Iterable of Song.get_stat_group() values
+    accuracy : Relative accuracy of quantiles
+'''
+def summarize(rows, accuracy: float = 0.01) -> {str : SongSummary}:
+    summaries = {None : SongSummary(accuracy)}
+    for row in rows:
+        artist = str(row[1]).lower()
+        if artist not in summaries:
+            summaries[artist] = SongSummary(accuracy)
+        summaries[None].add(row)
+        summaries[artist].add(row)
+    return summaries
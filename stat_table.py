@@ -0,0 +1,90 @@
+# stat_table.py
+
+# Columnar statistics for many songs (one typed column per statistic of Song.get_stat_group())
+
+import numpy as np
+import pandas as pd
+from song import Song, STAT_HEADERS
+
+# Column types of the table (statistics are missing for songs with no sections)
+STAT_DTYPES = {header : 'float64' for header in STAT_HEADERS}
+STAT_DTYPES.update({'Name' : 'object', 'Artist' : 'object', 'ID' : 'object',
+                    'NumSects' : 'int64', 'WdCnt' : 'Int64', 'UnqWdCnt' : 'Int64'})
+
+'''
+Return x rounded to 4 decimal places for every element, giving the same results as round(x, 4)
+in Song. NumPy rounds x * 10^4, which can differ from Python's correctly rounded result when
+that product is (nearly) halfway between two integers, so those elements use Python's round().
+    x : Array to round
+'''
+def _round4(x: np.ndarray) -> np.ndarray:
+    rounded = np.round(x, 4)
+    scaled = x * 10**4
+    halfway = np.nonzero(np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6)[0]
+    for i in halfway:
+        rounded[i] = round(float(x[i]), 4)
+    return rounded
+
+'''
+Return a DataFrame with one row per song and one typed column per statistic (columns are
+STAT_HEADERS, in the order of Song.get_stat_group()). Only the base statistics (counts, rhyme
+scores, syllables, and section similarity) are computed per song; averages, percentages, and
+lyrical strength are computed for all songs at once.
+    songs : Iterable of Song objects or (name, artist, lyrics, ID) tuples
+'''
+def build_stat_table(songs) -> pd.DataFrame:
+    names, artists, ids = [], [], []
+    base = []
+    for song in songs:
+        if not isinstance(song, Song):
+            song = Song(*song)
+        names.append(song.get_name())
+        artists.append(song.get_artist())
+        ids.append(song.get_id())
+        if song.get_num_sections() == 0:
+            base.append([0] + [np.nan] * 8)
+            continue
+        rhyme_dict = song.get_rhyme_dict()
+        base.append([song.get_num_sections(), song.get_word_count(), song.get_unique_word_count(),
+                     song.get_total_rhyme_score(), song.get_proximity_rhyme_score(),
+                     sum(score >= 1 for score in rhyme_dict.values()), sum(score >= 5 for score in rhyme_dict.values()),
+                     song.get_avg_syllable_count(), song.get_section_similarity()])
+
+    base = np.array(base, dtype=np.float64).reshape(-1, 9)
+    num_sections, word_count, unique_count, total_rs, proximity_rs, rhymes, large_rhymes, syllables, similarity = base.T
+    # Songs without sections have no statistics (division by 0 gives NaN/inf, replaced below)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        columns = {
+            'NumSects' : num_sections,
+            'WdCnt' : word_count,
+            'UnqWdCnt' : unique_count,
+            'UnqWdPct' : _round4(unique_count / word_count),
+            'TotRS' : total_rs,
+            'ProxRS' : proximity_rs,
+            'RymDens' : _round4(rhymes / unique_count),
+            'LgRymDens' : _round4(large_rhymes / unique_count),
+            'Wd/Sect' : _round4(word_count / num_sections),
+            'Syll/Wd' : syllables,
+            'UnqWd/Sect' : _round4(unique_count / num_sections),
+            'RS/Sect' : _round4(total_rs / num_sections),
+            'RS/Wd' : _round4(total_rs / unique_count),
+            'ProxRS/Sect' : _round4(proximity_rs / num_sections),
+            'ProxRS/Wd' : _round4(proximity_rs / unique_count),
+            'SectSim' : similarity,
+        }
+    # Same terms (and order of additions) as Song._compute_lyrical_strength
+    val1 = columns['UnqWdPct'] + columns['RymDens'] + columns['LgRymDens'] + (1 - columns['SectSim'])
+    val2 = 2 * (columns['Syll/Wd'] - 1)
+    val3 = np.minimum(columns['RS/Wd'] / 3, 1)
+    val4 = np.minimum(columns['ProxRS/Wd'] / 2, 1)
+    columns['LyrStren'] = val1 + val2 + val3 + val4
+
+    empty = num_sections == 0
+    table = pd.DataFrame({'Name' : pd.Series(names, dtype=object), 'Artist' : pd.Series(artists, dtype=object),
+                          'ID' : pd.Series(ids, dtype=object)})
+    for header in STAT_HEADERS[3:]:
+        column = columns[header]
+        if header != 'NumSects':
+            column = np.where(empty, np.nan, column)
+        table[header] = pd.Series(column).astype(STAT_DTYPES[header])
+    return table
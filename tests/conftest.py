@@ -0,0 +1,8 @@
+# conftest.py
+
+# Makes the modules at the repository root importable by the tests
+
+import pathlib
+import sys
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
@@ -0,0 +1,98 @@
+# test_batch.py
+
+# Tests of batches of saves that fail (changes are rolled back, never half committed)
+
+import pytest
+import lyric_empirics as lyremp
+from song import Song
+from song_store import SongStore
+from lyrics_store import LyricsStore
+
+LYRICS = '[Verse]\nI got love from above\nShining in the night light\n[Chorus]\nMoney for the honey\n'
+
+def _song(i: int) -> Song:
+    return Song(f'Song{i}', 'Artist', LYRICS + f'Line {i}', None)
+
+def test_song_store_batch_is_rolled_back(tmp_path):
+    store = SongStore(tmp_path / 'songs.db')
+    store.upsert(_song(0).get_stat_group())
+    with pytest.raises(KeyboardInterrupt):
+        with store.batch():
+            store.upsert(_song(1).get_stat_group())
+            with store.batch():
+                store.upsert_many([_song(2).get_stat_group()])
+            store.put_job('job', {'done' : 2})
+            raise KeyboardInterrupt
+    assert len(store) == 1
+    assert store.get_job('job') is None
+    assert store.get_change_count() == 1
+    assert store.get_summary('Artist').get_column('WdCnt').get_stats()['count'] == 1
+    # Failing to read the rows of upsert_many() saves none of them
+    with pytest.raises(ValueError):
+        store.upsert_many(_song(i).get_stat_group() if i < 3 else int('x') for i in range(1, 5))
+    store.upsert(_song(3).get_stat_group())
+    store.close()
+
+    store = SongStore(tmp_path / 'songs.db')
+    assert sorted(row['Name'] for row in store.iter_rows()) == ['Song0', 'Song3']
+    assert store.get_summary().get_column('WdCnt').get_stats()['count'] == 2
+
+def test_lyrics_store_batch_is_rolled_back(tmp_path):
+    store = LyricsStore(tmp_path)
+    store.put(1, 'Song1', 'Artist', LYRICS)
+    size = store.get_stats()['bytes']
+    with pytest.raises(KeyboardInterrupt):
+        with store.batch():
+            store.put(2, 'Song2', 'Artist', LYRICS + 'Two')
+            store.get(2)
+            raise KeyboardInterrupt
+    assert store.keys() == ['1']
+    assert store.get_stats()['bytes'] == size == (tmp_path / 'lyrics.pack').stat().st_size
+    store.put(3, 'Song3', 'Artist', LYRICS + 'Three')
+    assert store.get(3) == LYRICS + 'Three'
+    assert store.get(1) == LYRICS
+
+def test_lyrics_stores_share_data_file(tmp_path):
+    first, second = LyricsStore(tmp_path), LyricsStore(tmp_path)
+    second.put(1, 'Song1', 'Artist', LYRICS + 'One')
+    # Lyrics are appended after those of the other store, not where this store last wrote
+    first.put(2, 'Song2', 'Artist', LYRICS + 'Two')
+    with first.batch():
+        first.put(3, 'Song3', 'Artist', LYRICS + 'Three')
+        # Opening a store does not cut off lyrics another store has not committed yet
+        LyricsStore(tmp_path).close()
+    second.close()
+    first.close()
+    store = LyricsStore(tmp_path)
+    assert [store.get(i) for i in (1, 2, 3)] == [LYRICS + 'One', LYRICS + 'Two', LYRICS + 'Three']
+
+def test_interrupted_job_chunk_is_not_saved(tmp_path, monkeypatch):
+    storage = tmp_path / 'LyricEmpiricsStorage'
+    monkeypatch.setattr(lyremp, '_dir1', storage)
+    monkeypatch.setattr(lyremp, '_dir2', storage / 'SongLyrics')
+    monkeypatch.setattr(lyremp, '_dir3', storage / 'LyricsStore')
+    monkeypatch.setattr(lyremp, '_song_store', None)
+    monkeypatch.setattr(lyremp, '_lyrics_store', None)
+    for i in range(4):
+        (tmp_path / f'Song{i}_Artist.txt').write_text(LYRICS + f'Line {i}', encoding='utf-8')
+    manifest = tmp_path / 'job.txt'
+    manifest.write_text('\n'.join(f'Song{i}_Artist.txt' for i in range(4)), encoding='utf-8')
+
+    save_song, saved = lyremp.save_song, []
+    def interrupted_save(song):
+        if len(saved) == 2:
+            raise KeyboardInterrupt
+        saved.append(song)
+        save_song(song)
+    monkeypatch.setattr(lyremp, 'save_song', interrupted_save)
+    with pytest.raises(KeyboardInterrupt):
+        lyremp.run_job(manifest, chunk_size = 4, report = False)
+    store = lyremp._get_song_store()
+    assert len(store) == 0 and len(lyremp._get_lyrics_store()) == 0
+    assert store.get_job('job')['done'] == 0
+
+    monkeypatch.setattr(lyremp, 'save_song', save_song)
+    counts = lyremp.run_job(manifest, chunk_size = 4, report = False)
+    assert (counts['done'], counts['saved'], len(store)) == (4, 4, 4)
+    store.close()
+    lyremp._get_lyrics_store().close()
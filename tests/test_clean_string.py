@@ -0,0 +1,48 @@
+# test_clean_string.py
+
+# Golden tests of utility.clean_string against the original one-character-at-a-time implementation
+
+import random
+import pytest
+import utility
+import benchmark
+
+# Lines and their cleaned versions (output of the original implementation)
+GOLDEN = [
+    ("I'm gon' rock-n-roll", "i'm gon rock n roll"),
+    ("  'Cause   it's the Mr. & Mrs. show  ", "cause it's the mr  and mrs  show"),
+    ('[Verse 1: Eminem]', '[verse 1 eminem]'),
+    ('Café—naïve résumé', 'cafe naive resume'),
+    ('x2', 'x2'),
+    ("''", ''),
+    ("rock'n'roll's 'til", "rock'n'roll's til"),
+    ('Hello, world!!! (yeah)', 'hello world yeah'),
+    ('snake_case and tab\tseparated', 'snakecase and tab separated'),
+    ('Ⅳ ½ ² ﬁne', 'iv 12 2 fine'),
+    ('Oh—oh...oh', 'oh oh   oh'),
+    ('Don’t stop', 'dont stop'),
+    ('', ''),
+    ('   ', ''),
+    ('&&', 'andand'),
+    ('中文 Ωmega жук 😀', ' mega '),
+]
+
+# Characters of the random lines: ASCII, separators, accents, and other scripts and symbols
+_CHARACTERS = "abcXYZ019 '’.-—&[]_()!?,\"\t éÉñüß½²İıﬁ́​Ωж中😀Ⅳ"
+
+@pytest.mark.parametrize('line, cleaned', GOLDEN)
+def test_golden_lines(line, cleaned):
+    assert utility.clean_string(line) == cleaned
+    assert utility.clean_string_reference(line) == cleaned
+
+@pytest.mark.parametrize('kind', list(benchmark.FIXTURES))
+def test_fixture_lines_match_reference(kind):
+    for song in benchmark.make_fixture(kind):
+        for line in song[2].split('\n'):
+            assert utility.clean_string(line) == utility.clean_string_reference(line)
+
+def test_random_lines_match_reference():
+    rng = random.Random(0)
+    for _ in range(20000):
+        line = ''.join(rng.choice(_CHARACTERS) for _ in range(rng.randint(0, 16)))
+        assert utility.clean_string(line) == utility.clean_string_reference(line), repr(line)
@@ -0,0 +1,108 @@
+# test_find_songs.py
+
+# Tests of find_songs() against a local HTTP server that stands in for Genius.com
+
+import http.server
+import json
+import socketserver
+import threading
+import time
+import urllib.parse
+import pytest
+import lyric_empirics as lyremp
+
+LYRICS = '[Verse 1]\nI got love from above\nShining in the night light\n[Chorus]\nMoney for the honey'
+# Fields of the songs and artists in search results (read by the Genius API Client)
+_SONG_FIELDS = ['annotation_count', 'api_path', 'full_title', 'header_image_thumbnail_url', 'header_image_url',
+                'lyrics_owner_id', 'pyongs_count', 'song_art_image_thumbnail_url', 'song_art_image_url',
+                'title_with_featured']
+_ARTIST_FIELDS = ['api_path', 'header_image_url', 'image_url', 'is_meme_verified', 'is_verified', 'url']
+
+class _Server(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    # Times of every request, searches per song number, and songs whose first search is slow
+    requests = []
+    searches = dict()
+    slow = set()
+    delay = 0
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, body: bytes, content_type: str) -> None:
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        type(self).requests.append(time.monotonic())
+        path = urllib.parse.urlparse(self.path)
+        if path.path == '/api/search/multi':
+            number = int(urllib.parse.parse_qs(path.query)['q'][0].split()[0][len('Song'):])
+            searches = type(self).searches
+            searches[number] = searches.get(number, 0) + 1
+            if number in type(self).slow and searches[number] == 1:
+                time.sleep(type(self).delay) # Longer than the client's timeout
+            song = dict.fromkeys(_SONG_FIELDS)
+            song.update({'id' : number, 'title' : f'Song{number}', 'url' : f'https://genius.com/song{number}-lyrics',
+                         'path' : f'/song{number}-lyrics', 'lyrics_state' : 'complete', 'stats' : {},
+                         'primary_artist' : {**dict.fromkeys(_ARTIST_FIELDS), 'id' : 100 + number, 'name' : f'Artist{number}'}})
+            hits = [{'index' : 'song', 'type' : 'song', 'result' : song}]
+            body = {'response' : {'sections' : [{'type' : 'song', 'hits' : hits}]}}
+            self._send(json.dumps(body).encode(), 'application/json')
+        elif path.path.startswith('/song'):
+            html = '<html><div class="lyrics">' + LYRICS.replace('\n', '<br/>') + '</div></html>'
+            self._send(html.encode(), 'text/html')
+        else:
+            self.send_response(404)
+            self.end_headers()
+
+@pytest.fixture
+def genius(monkeypatch):
+    _Handler.requests, _Handler.searches, _Handler.slow, _Handler.delay = [], dict(), set(), 0
+    server = _Server(('127.0.0.1', 0), _Handler)
+    server.root = f'http://127.0.0.1:{server.server_address[1]}/'
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(lyremp, '_genius', None)
+    monkeypatch.setattr(lyremp, '_song_cache', None)
+    monkeypatch.setattr(lyremp, '_offline', False)
+    monkeypatch.setattr(lyremp, '_RETRY_DELAY', 0.05)
+    lyremp.init_genius('token', max_time = 1, display = False)
+    lyremp.change_genius_root(server.root)
+    yield lyremp._genius
+    server.shutdown()
+    server.server_close()
+
+def test_request_rate_is_limited(genius):
+    songs = [(f'Song{i}', f'Artist{i}') for i in range(10)]
+    results = dict(lyremp.find_songs(songs, workers = 4, rate = 20))
+    assert all(results[item].get_name() == item[0] and results[item].get_artist() == item[1] for item in songs)
+    # Each song takes a search and a lyrics page; after a burst of 4 requests, at most 20 per second
+    times = sorted(_Handler.requests)
+    assert len(times) == 20
+    for k in range(len(times)):
+        assert times[k] - times[0] >= (k - 4) / 20 - 0.02
+
+def test_timed_out_search_is_retried(genius):
+    _Handler.slow, _Handler.delay = {1}, 1.5
+    results = dict(lyremp.find_songs([('Song0', 'Artist0'), ('Song1', 'Artist1')], retries = 1, raw = True))
+    assert results[('Song1', 'Artist1')][:2] == ('Song1', 'Artist1')
+    assert _Handler.searches == {0 : 1, 1 : 2}
+
+def test_search_gives_up_after_retries(genius):
+    _Handler.slow, _Handler.delay = {0}, 1.5
+    results = dict(lyremp.find_songs([('Song0', 'Artist0')], retries = 0, raw = True))
+    assert results == {('Song0', 'Artist0') : None}
+    assert _Handler.searches == {0 : 1}
+
+def test_shared_client_is_not_changed(genius):
+    session, sleep_time = genius._session, genius.sleep_time
+    found = lyremp.find_songs([(f'Song{i}', f'Artist{i}') for i in range(3)], raw = True, ordered = True)
+    assert next(found)[0] == ('Song0', 'Artist0')
+    # While find_songs is suspended, the client of init_genius() is the same as before
+    assert genius._session is session and genius.sleep_time == sleep_time
+    assert lyremp.find_song('Song2', 'Artist2').get_name() == 'Song2'
+    assert [item for item, _ in found] == [('Song1', 'Artist1'), ('Song2', 'Artist2')]
@@ -0,0 +1,141 @@
+# test_pair_cache.py
+
+# Tests of the word-pair rhyme score cache
+
+import numpy as np
+import pytest
+import utility
+import rhyme_matrix
+import pair_cache
+from pair_cache import PairCache
+
+WORDS = ['love', 'above', 'night', 'light', 'fire', 'tired', 'trying', 'running', 'nothing', 'dying',
+         'mind', 'line', 'time', 'cat', 'hat', 'xqzv', '', "gon'", 'the', 'a']
+
+@pytest.fixture(autouse=True)
+def no_pair_cache():
+    cache = utility.get_pair_cache()
+    utility.set_pair_cache(None)
+    yield
+    utility.set_pair_cache(cache)
+
+def test_cached_matrix_matches_uncached(tmp_path):
+    expected = rhyme_matrix.rhyme_score_matrix(WORDS)
+    cache = PairCache(path=tmp_path / 'pairs.db')
+    cold = rhyme_matrix.rhyme_score_matrix(WORDS, cache)
+    warm = rhyme_matrix.rhyme_score_matrix(WORDS[::-1], cache)
+    assert (cold == expected).all()
+    assert (warm == expected[::-1, ::-1]).all()
+    assert cache.get_stats()['hits'] > 0
+    cache.close()
+
+    # A new process reads the scores from the file
+    reader = PairCache(path=tmp_path / 'pairs.db', read_only=True)
+    assert (rhyme_matrix.rhyme_score_matrix(WORDS, reader) == expected).all()
+    assert reader.get_stats()['loaded'] > 0
+
+def test_pairs_are_unordered():
+    cache = PairCache()
+    cache.put('fire', 'tired', 0.25, 0.125)
+    assert cache.get('fire', 'tired') == 0.25
+    assert cache.get('tired', 'fire') == 0.125
+    assert cache.get('love', 'love') == 0
+    assert cache.get('love', 'above') is None
+
+def test_zero_scores_are_not_written(tmp_path):
+    cache = PairCache(path=tmp_path / 'pairs.db')
+    cache.put_scores(['love', 'above', 'cat'], np.array([0, 0]), np.array([1, 2]), np.array([1.0, 0]), np.array([1.0, 0]))
+    cache.close()
+    reader = PairCache(path=tmp_path / 'pairs.db', read_only=True)
+    assert reader.get('above', 'love') == 1.0
+    assert reader.get('love', 'cat') is None
+    assert reader.get_stats()['loaded'] == 1
+
+def test_pair_rhyme_score_with_cache():
+    utility.set_pair_cache(PairCache(max_size=8))
+    for word1 in WORDS:
+        for word2 in WORDS:
+            assert utility.pair_rhyme_score(word1, word2) == utility._compute_pair_rhyme_score(word1, word2)
+            assert utility.pair_rhyme_score(word1, word2) == utility._compute_pair_rhyme_score(word1, word2)
+
+def test_least_recently_used_pairs_are_evicted():
+    cache = PairCache(max_size=4)
+    expected = rhyme_matrix.rhyme_score_matrix(WORDS)
+    for _ in range(3):
+        assert (rhyme_matrix.rhyme_score_matrix(WORDS, cache) == expected).all()
+    stats = cache.get_stats()
+    assert stats['size'] <= 4
+    assert stats['evictions'] > 0
+
+def test_read_only_scores_are_handed_to_writer(tmp_path):
+    writer = PairCache(path=tmp_path / 'pairs.db')
+    worker = PairCache(path=tmp_path / 'pairs.db', read_only=True)
+    expected = rhyme_matrix.rhyme_score_matrix(WORDS, worker)
+    worker.put('fire', 'tired', 0.25, 0.25)
+    words, pairs, scores = worker.take_unsaved()
+    assert len(pairs) == (expected != 0).sum() // 2
+    assert len(worker.take_unsaved()[1]) == 0
+    writer.put_block(words, pairs, scores)
+    writer.close()
+
+    reader = PairCache(path=tmp_path / 'pairs.db', read_only=True)
+    assert reader.get('tired', 'fire') == 0.25
+    assert (rhyme_matrix.rhyme_score_matrix(WORDS, reader) == expected).all()
+    assert reader.get_stats()['loaded'] == len(pairs)
+
+def test_reader_sees_combined_blocks(tmp_path):
+    writer = PairCache(path=tmp_path / 'pairs.db')
+    reader = PairCache(path=tmp_path / 'pairs.db', read_only=True)
+    words = [f'word{k}' for k in range(2 * (pair_cache._MAX_BLOCKS + 40))]
+    for k in range(0, len(words), 2):
+        writer.put_scores(words[k:k + 2], np.array([0]), np.array([1]), np.array([0.5]), np.array([0.25]))
+        # The reader loads the blocks written so far, then the writer combines some of them
+        if k == 2 * pair_cache._MAX_BLOCKS:
+            reader.get_scores(words[:2], np.array([0]), np.array([1]))
+    positions = np.arange(0, len(words), 2)
+    scores, reverse_scores = reader.get_scores(words, positions, positions + 1)
+    assert (scores == 0.5).all() and (reverse_scores == 0.25).all()
+
+def test_blocks_are_combined_by_size(tmp_path):
+    writer = PairCache(path=tmp_path / 'pairs.db')
+    insert_block, written = writer._insert_block, []
+    def counted_insert_block(keys, values):
+        written.append(len(keys))
+        return insert_block(keys, values)
+    writer._insert_block = counted_insert_block
+    words = [f'word{k}' for k in range(4000)]
+    for k in range(0, len(words), 10):
+        first = np.arange(k, k + 10, 2)
+        writer.put_scores(words, first, first + 1, np.full(5, 0.5), np.full(5, 0.5))
+    # Each pair is written again about once per size (4 blocks are combined into one), not once
+    # per combined block
+    assert sum(written) < 8 * len(words) // 2
+    assert writer._db.execute('SELECT COUNT(*) FROM pair_blocks').fetchone()[0] <= pair_cache._MAX_BLOCKS
+    writer.close()
+    reader = PairCache(path=tmp_path / 'pairs.db', read_only=True)
+    first = np.arange(0, len(words), 2)
+    assert (reader.get_scores(words, first, first + 1)[0] == 0.5).all()
+
+def test_evicted_pairs_are_read_from_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(pair_cache, '_MIN_WORDS', 16)
+    cache = PairCache(max_size=8, path=tmp_path / 'pairs.db')
+    expected = rhyme_matrix.rhyme_score_matrix(WORDS, cache)
+    words = [f'word{k}' for k in range(200)]
+    first = np.arange(0, len(words), 2)
+    cache.put_scores(words, first, first + 1, np.full(len(first), 0.5), np.full(len(first), 0.25))
+    assert cache.get_stats()['evictions'] > 0
+    # Words of evicted pairs are dropped
+    assert len(cache._words) <= 2 * 2 * cache.get_stats()['size']
+    cache.reset_stats()
+    assert cache.get('above', 'love') == expected[WORDS.index('above'), WORDS.index('love')]
+    assert cache.get('word1', 'word0') == 0.25
+    assert cache.get_stats()['loaded'] == 2
+    assert (rhyme_matrix.rhyme_score_matrix(WORDS, cache) == expected).all()
+
+def test_batch_writes_one_block(tmp_path):
+    cache = PairCache(path=tmp_path / 'pairs.db')
+    with cache.batch():
+        for k in range(10):
+            cache.put_scores([f'word{k}', 'word'], np.array([0]), np.array([1]), np.array([0.5]), np.array([0.5]))
+        assert cache._db.execute('SELECT COUNT(*) FROM pair_blocks').fetchone()[0] == 0
+    assert cache._db.execute('SELECT size FROM pair_blocks').fetchall() == [(10,)]
@@ -0,0 +1,87 @@
+# test_rhyme.py
+
+# Regression tests for rhyme scoring (pair scores, score matrices, and proximity rhyme scores)
+
+import numpy as np
+import pytest
+import utility
+import rhyme_matrix
+import song_utility as sutil
+from song import Song
+
+# Scores of the original pair-at-a-time implementation (word1, word2, score)
+KNOWN_PAIRS = [
+    ('love', 'above', 1.0),
+    ('night', 'light', 1.0),
+    ('cat', 'hat', 1.0),
+    ('money', 'honey', 1.0),
+    ('fire', 'tired', 0.25),
+    ('mind', 'line', 0.25),
+    ('dying', 'nothing', 0.25),
+    ('trying', 'running', 0.1875),
+    ('time', 'mind', 0),
+    ('gone', 'alone', 0),
+    ('love', 'love', 0), # Identical words
+    ('love', 'xqzv', 0), # Word not in the CMU dictionary
+    ('love', '', 0),     # Empty string
+    ('', '', 0),
+]
+
+# Words of a matrix, including a repeated word, a word not in the CMU dictionary, and an empty string
+EDGE_WORDS = ['love', 'above', 'love', 'xqzv', '', "gon'", 'x2', 'fire', 'tired', 'trying', 'running']
+
+FIXTURE_LYRICS = [
+    '[Verse 1]\nI got love from above in the night\nFighting for the light with all my might\n\n'
+    '[Chorus]\nMoney money honey funny\nTrying and dying and running\n\n'
+    '[Verse 2]\nFire in my mind all the time\nTired of the line I call mine\n'
+    '12EmbedShare URLCopyEmbedCopy',
+    '[Intro]\nSkipped words here\n[Hook]\nCold gold told hold bold\nRain pain again\n'
+    '[Bridge]\nDream team seem\nReal feel deal steal\n[Outro]\nSkipped again',
+    '[Verse]\nThe cat in the hat sat on the mat\n[Refrain]\nxqzv blorp zzz\n[Chorus]\n',
+]
+
+@pytest.fixture(autouse=True)
+def no_pair_cache():
+    cache = utility.get_pair_cache()
+    utility.set_pair_cache(None)
+    yield
+    utility.set_pair_cache(cache)
+
+@pytest.mark.parametrize('word1, word2, score', KNOWN_PAIRS)
+def test_pair_rhyme_score(word1, word2, score):
+    assert utility.pair_rhyme_score(word1, word2) == score
+    assert utility.pair_rhyme_score(word2, word1) == score
+
+def test_rhyme_score_matrix_matches_pairs():
+    matrix = rhyme_matrix.rhyme_score_matrix(EDGE_WORDS)
+    assert matrix.shape == (len(EDGE_WORDS), len(EDGE_WORDS))
+    for i in range(len(EDGE_WORDS)):
+        for j in range(len(EDGE_WORDS)):
+            assert matrix[i, j] == utility.pair_rhyme_score(EDGE_WORDS[i], EDGE_WORDS[j])
+    assert not np.diagonal(matrix).any()
+    assert matrix[0, 2] == 0 # Same word at two positions
+
+def test_rhyme_score_matrix_edge_sizes():
+    assert rhyme_matrix.rhyme_score_matrix([]).shape == (0, 0)
+    assert rhyme_matrix.rhyme_score_matrix(['love']).tolist() == [[0]]
+    assert rhyme_matrix.rhyme_score_matrix(['', 'xqzv']).tolist() == [[0, 0], [0, 0]]
+
+def test_rhyme_score_block_matches_pairs():
+    words1, words2 = EDGE_WORDS[:5], EDGE_WORDS[3:]
+    block = rhyme_matrix.rhyme_score_block(words1, words2)
+    expected = [[utility.pair_rhyme_score(word1, word2) for word2 in words2] for word1 in words1]
+    assert block.tolist() == expected
+
+@pytest.mark.parametrize('lyrics', FIXTURE_LYRICS)
+def test_proximity_rhyme_score_matches_sections(lyrics):
+    song = Song('Fixture', 'Tester', lyrics, '1')
+    # Original computation: rhyme scores within each section, one pair at a time
+    sections_unique = sutil.find_sections_unique_words(song.get_sections())
+    expected = sum(sum(sutil.find_rhyme_scores_pairwise(words).values()) for words in sections_unique)
+    assert song.get_proximity_rhyme_score() == pytest.approx(expected)
+
+@pytest.mark.parametrize('lyrics', FIXTURE_LYRICS)
+def test_rhyme_dict_matches_pairs(lyrics):
+    song = Song('Fixture', 'Tester', lyrics, '1')
+    expected = sutil.find_rhyme_scores_pairwise(song.get_unique_words())
+    assert song.get_rhyme_dict() == pytest.approx(expected)
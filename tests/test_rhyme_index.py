@@ -0,0 +1,54 @@
+# test_rhyme_index.py
+
+# Tests of saving and loading the rhyme index, and of where it is saved
+
+import hashlib
+import os
+import pathlib
+import pickle
+import subprocess
+import sys
+import rhyme_index
+from rhyme_index import RhymeIndex
+
+WORDS = ['love', 'above', 'fire', 'tired', 'xqzv']
+
+def _header() -> bytes:
+    return rhyme_index._MAGIC + rhyme_index._INDEX_VERSION.to_bytes(2, 'little')
+
+class _Exploit:
+    def __reduce__(self):
+        return (os.system, ('echo exploited > exploited.txt',))
+
+def test_saved_index_is_loaded(tmp_path):
+    index = rhyme_index.get_index()
+    index.save(tmp_path / 'index.pkl')
+    loaded = RhymeIndex.load(tmp_path / 'index.pkl')
+    assert [loaded.phones(word) for word in WORDS] == [index.phones(word) for word in WORDS]
+    assert [loaded.rhyming_parts(word) for word in WORDS] == [index.rhyming_parts(word) for word in WORDS]
+
+def test_foreign_files_are_not_loaded(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    rhyme_index.get_index().save(tmp_path / 'index.pkl')
+    data = (tmp_path / 'index.pkl').read_bytes()
+    payload = pickle.dumps({'_codes' : _Exploit()})
+    files = {'missing' : None,
+             'truncated' : data[:len(data) // 2],
+             'tampered' : data[:-1] + bytes([data[-1] ^ 1]),
+             'old_version' : pickle.dumps((2, {})),
+             # A valid header and digest, but the pickle would run code
+             'exploit' : _header() + hashlib.sha256(payload).digest() + payload}
+    for name, content in files.items():
+        if content is not None:
+            (tmp_path / name).write_bytes(content)
+        assert RhymeIndex.load(tmp_path / name) is None, name
+    assert not (tmp_path / 'exploited.txt').exists()
+
+def test_import_writes_no_files(tmp_path):
+    source = pathlib.Path(rhyme_index.__file__).resolve().parent
+    environment = {**os.environ, 'PYTHONPATH' : str(source), 'LYRIC_EMPIRICS_CACHE' : str(tmp_path / 'cache')}
+    code = 'import lyric_empirics, rhyme_index; print(rhyme_index.get_index_path())'
+    result = subprocess.run([sys.executable, '-c', code], cwd=tmp_path, env=environment, check=True,
+                            capture_output=True, text=True)
+    assert result.stdout.strip() == str(tmp_path / 'cache' / 'rhyme_index.pkl')
+    assert [path.name for path in tmp_path.iterdir()] == []
@@ -0,0 +1,51 @@
+# test_song_edit.py
+
+# Tests of editing songs whose rhyme scores were computed (only new word pairs are scored)
+
+import pickle
+import pytest
+import utility
+import song_utility as sutil
+from song import Song
+
+LYRICS = ('[Verse 1]\nI got love from above in the night\nFighting for the light with all my might\n\n'
+          '[Chorus]\nMoney money honey funny\nTrying and dying and running\n')
+
+@pytest.fixture(autouse=True)
+def no_pair_cache():
+    cache = utility.get_pair_cache()
+    utility.set_pair_cache(None)
+    yield
+    utility.set_pair_cache(cache)
+
+@pytest.fixture
+def matrices(monkeypatch):
+    # Number of full rhyme matrices computed
+    calls = []
+    find_rhyme_matrix = sutil.find_rhyme_matrix
+    monkeypatch.setattr(sutil, 'find_rhyme_matrix', lambda words: calls.append(len(words)) or find_rhyme_matrix(words))
+    return calls
+
+def _assert_same_scores(song: Song) -> None:
+    fresh = Song(song.get_name(), song.get_artist(), song.get_lyrics(), song.get_id())
+    assert song.get_rhyme_dict() == pytest.approx(fresh.get_rhyme_dict())
+    assert song.get_proximity_rhyme_score() == pytest.approx(fresh.get_proximity_rhyme_score())
+
+def test_first_edit_is_incremental(matrices):
+    song = Song('Name', 'Artist', LYRICS, '1')
+    song.get_stat_group()
+    assert len(matrices) == 1
+    song.add_line(0, 'Cat in the hat with a bat', 1)
+    song.replace_line(1, 0, 'Fire in my mind all the time')
+    assert len(matrices) == 1
+    _assert_same_scores(song)
+
+def test_pickled_song_drops_rhyme_matrix(matrices):
+    song = Song('Name', 'Artist', LYRICS, '1')
+    song.get_stat_group()
+    copy = pickle.loads(pickle.dumps(song))
+    assert '_rhyme_matrix' in song._stats and '_rhyme_matrix' not in copy._stats
+    assert copy.get_stat_group() == song.get_stat_group()
+    copy.add_line(1, 'Tired of the line I call mine')
+    assert len(matrices) == 2 # The copy builds its matrix again for its first edit
+    _assert_same_scores(copy)
@@ -0,0 +1,61 @@
+# test_song_query.py
+
+# Tests of queries over saved song statistics kept up to date with the song store
+
+import random
+import pytest
+import lyric_empirics as lyremp
+from song import STAT_HEADERS
+from song_query import SongIndex, QUERY_HEADERS
+from song_store import SongStore
+
+def _rows(count: int, seed: int) -> [list]:
+    rng = random.Random(seed)
+    return [[f'Song{seed}_{i}', f'Artist{i % 3}', seed * 1000 + i] + [rng.randint(1, 5) for _ in range(3)]
+            + [rng.random() for _ in range(len(STAT_HEADERS) - 6)] for i in range(count)]
+
+def _assert_same(index: SongIndex, expected: SongIndex, song_id) -> None:
+    for stat in ['LyrStren', 'WdCnt']:
+        assert index.top(stat, 5).equals(expected.top(stat, 5))
+        assert index.top(stat, 3, 'artist1', ascending = True).equals(expected.top(stat, 3, 'artist1', ascending = True))
+    assert index.by_artist('Artist2').equals(expected.by_artist('Artist2'))
+    assert index.similar(song_id, 4).equals(expected.similar(song_id, 4))
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = SongStore(tmp_path / 'song_data.db')
+    monkeypatch.setattr(lyremp, '_song_store', store)
+    monkeypatch.setattr(lyremp, '_song_index', None)
+    yield store
+    store.close()
+
+def test_index_applies_changes_of_other_connections(store, tmp_path, monkeypatch):
+    store.upsert_many(_rows(20, 1))
+    lyremp.top_songs('LyrStren')
+    # Another connection (e.g. another process) saves, replaces, and removes songs
+    other = SongStore(tmp_path / 'song_data.db')
+    other.upsert_many(_rows(5, 2) + [_rows(20, 1)[3][:3] + _rows(1, 3)[0][3:]])
+    other.upsert(_rows(1, 4)[0])
+    other.delete(1005)
+    other.close()
+    assert store.get_change_count() == 4
+
+    expected = SongIndex(store.to_dataframe())
+    # The index is updated from the changed songs, without reading the others
+    monkeypatch.setattr(store, 'to_dataframe', lambda: pytest.fail('index was built again'))
+    index = lyremp._get_song_index()
+    assert len(index) == 25
+    _assert_same(index, expected, 1003)
+    assert lyremp._get_song_index() is index
+
+def test_changes_since_count(store):
+    store.upsert_many(_rows(3, 1))
+    store.delete(1001)
+    store.upsert(_rows(1, 2)[0])
+    count, saved, removed = store.get_changes(1)
+    assert count == 3
+    assert saved['ID'].tolist() == ['2000']
+    assert list(saved.columns) == STAT_HEADERS
+    assert removed == ['1001']
+    assert store.get_changes(3)[0] == 3
+    assert set(QUERY_HEADERS) <= set(saved.columns)
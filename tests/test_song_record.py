@@ -0,0 +1,19 @@
+# test_song_record.py
+
+# Tests of compact song records (Song.to_record())
+
+import inspect
+import pytest
+from song import Song, SongRecord, STAT_NAMES
+
+LYRICS = '[Verse 1]\nI got love from above\nShining in the night light\n[Chorus]\nMoney for the honey'
+
+@pytest.mark.parametrize('name', STAT_NAMES.values())
+def test_record_getters_match_song(name):
+    song = Song('Name', 'Artist', LYRICS, '1')
+    record = song.to_record()
+    getter = getattr(SongRecord, 'get_' + name)
+    # Getters are defined in the class, so they can be inspected like Song's
+    assert 'get_' + name in vars(SongRecord)
+    assert list(inspect.signature(getter).parameters) == ['self']
+    assert getter(record) == getattr(song, 'get_' + name)()
@@ -0,0 +1,65 @@
+# test_song_store.py
+
+# Tests of the keys of saved song statistics and of reading malformed JSONL dumps
+
+import json
+import sqlite3
+import lyrics_source
+from song import Song, STAT_HEADERS
+import song_store
+from song_store import SongStore
+
+LYRICS = '[Verse]\nI got love from above\nShining in the night light'
+
+def _row(name: str, artist: str, song_id, word_count: int) -> list:
+    return [name, artist, song_id, 1, word_count] + [0.5] * (len(STAT_HEADERS) - 5)
+
+def test_songs_without_id_are_replaced(tmp_path):
+    store = SongStore(tmp_path / 'songs.db')
+    for _ in range(3):
+        store.upsert(Song('Name', 'Artist', LYRICS, None).get_stat_group())
+        store.upsert_many([Song('Other', 'Artist', LYRICS, None).get_stat_group(), _row('Song', 'Artist', 5, 3)])
+    assert len(store) == 3
+    assert store.get('Name_Artist')['Name'] == 'Name'
+    assert store.get(5)['WdCnt'] == store.get('5')['WdCnt'] == 3
+    assert store.get_summary().get_column('WdCnt').get_stats()['count'] == 3
+    store.delete('Other_Artist')
+    assert len(store) == 2
+    assert store.get_summary('Artist').get_column('WdCnt').get_stats()['count'] == 2
+
+def test_old_store_is_rekeyed(tmp_path):
+    db = sqlite3.connect(tmp_path / 'songs.db')
+    columns = ', '.join('"ID" PRIMARY KEY' if header == 'ID' else f'"{header}"' for header in STAT_HEADERS)
+    db.execute(f'CREATE TABLE songs ({columns})')
+    insert = f'INSERT OR REPLACE INTO songs VALUES ({", ".join("?" * len(STAT_HEADERS))})'
+    # Rows without an ID were added again on every save
+    for word_count in [10, 11, 12]:
+        db.execute(insert, _row('Name', 'Artist', None, word_count))
+    db.execute(insert, _row('Song', 'Artist', 5, 7))
+    db.commit()
+    db.close()
+
+    store = SongStore(tmp_path / 'songs.db')
+    assert sorted((row['ID'], row['WdCnt']) for row in store.iter_rows()) == [('5', 7), ('Name_Artist', 12)]
+    stats = store.get_summary().get_column('WdCnt').get_stats()
+    assert (stats['count'], stats['min'], stats['max']) == (2, 7, 12)
+
+def test_rows_are_read_in_pages(tmp_path, monkeypatch):
+    monkeypatch.setattr(song_store, '_ROW_PAGE', 7)
+    store = SongStore(tmp_path / 'songs.db')
+    store.upsert_many([_row('Song', 'Artist', i, 1) for i in range(50)])
+    seen = []
+    for row in store.iter_rows():
+        seen.append(row['ID'])
+        # Rows replaced while iterating are not yielded again
+        store.upsert(_row('Song', 'Artist', row['ID'], 2))
+    assert sorted(seen, key=int) == [str(i) for i in range(50)]
+    assert all(row['WdCnt'] == 2 for row in store.iter_rows())
+
+def test_malformed_records_are_skipped(tmp_path):
+    records = [{'title' : None, 'artist' : 'Artist', 'lyrics' : LYRICS}, {'title' : 'Title', 'lyrics' : LYRICS},
+               {'title' : 5, 'artist' : 'Artist', 'lyrics' : LYRICS}, {'title' : 'Title', 'artist' : 'Artist', 'lyrics' : [1]},
+               {'name' : 'Name', 'primary_artist' : {'name' : 'Artist'}, 'lyrics' : LYRICS, 'id' : 3}]
+    path = tmp_path / 'dump.jsonl'
+    path.write_text('\n'.join(json.dumps(record) for record in records) + '\n{not json\n', encoding='utf-8')
+    assert list(lyrics_source.read_sources(path)) == [('Name', 'Artist', LYRICS, 3)]
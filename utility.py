@@ -3,9 +3,26 @@
 # General utility functions
 
 import unicodedata
-import pronouncing
+import re
+import functools
 import math
-import syllables
+import rhyme_index
+import profiling
+
+_pair_cache = None # Cache of word-pair rhyme scores (None = no caching)
+_cmu_syllables = True # Prefer CMU dictionary syllable counts over estimates
+
+# Tables used by clean_string (words are separated by single spaces when they are applied)
+# Apostrophes at the start/end of a word
+_EDGE_APOSTROPHES = re.compile(r"(?<![^ ])'|'(?![^ ])")
+# Characters that are not alphanumeric, brackets, apostrophes, separators, '&', or spaces
+# (\w is alphanumeric or '_')
+_REMOVED_CHARS = re.compile(r"[^\w\[\]'.\-\u2014& ]|_")
+# Periods, hyphens, and em dashes are word separators; '&' becomes 'and'
+_SEPARATORS = str.maketrans({'.' : ' ', '-' : ' ', '\u2014' : ' ', '&' : 'and'})
+# Same as the above for ASCII strings, as a byte table and the bytes it removes ('&' is replaced separately)
+_ASCII_SEPARATORS = bytes.maketrans(b'.-', b'  ')
+_ASCII_REMOVED = bytes(c for c in range(128) if not (chr(c).isalnum() or chr(c) in "[]' .-&"))
 
 '''
 Return the given string with only alphanumeric characters.
@@ -25,6 +42,27 @@ Returns the cleaned version of a string by:
     string : The string to clean
 '''
 def clean_string(string: str) -> str:
+    string = ' '.join(string.lower().split())
+    if '\'' in string:
+        string = _EDGE_APOSTROPHES.sub('', string)
+    if string.isascii():
+        # Fast path: one byte translation handles separators and removed characters
+        string = string.encode('ascii').translate(_ASCII_SEPARATORS, _ASCII_REMOVED).decode('ascii')
+        return (string.replace('&', 'and') if '&' in string else string).strip()
+    string = _REMOVED_CHARS.sub('', string).translate(_SEPARATORS).strip()
+    # Normalize unicode string
+    nfkd_form = unicodedata.normalize('NFKD', string)
+    # Encode into ASCII (remove accents)
+    encoded = nfkd_form.encode('ascii', 'ignore')
+    # Return string without accents
+    return str(encoded.decode('utf-8'))
+
+'''
+Returns the cleaned version of a string (as in clean_string), one character at a time
+(reference implementation for clean_string).
+    string : The string to clean
+'''
+def clean_string_reference(string: str) -> str:
     string = string.lower().strip()
     words = string.split()
     new_words = []
@@ -63,42 +101,83 @@ def vowel_in_word(word: str) -> bool:
     return False
 
 '''
-Return the rhyme score of a pair of word (calculation described in comments).
+Return the set of contiguous phoneme sequences of length 2 to max_len in a pronunciation.
+    phonemes : Pronunciation as a tuple of phoneme codes
+    max_len  : Longest sequence length to include
+'''
+@functools.lru_cache(maxsize=65536)
+def _phoneme_sequences(phonemes: (int,), max_len: int) -> {(int,)}:
+    return {phonemes[k : k + n] for n in range(2, max_len + 1) for k in range(len(phonemes) - n + 1)}
+
+'''
+Set the cache used for word-pair rhyme scores (see pair_cache.PairCache).
+    cache : Pair score cache, or None to turn caching off
+'''
+def set_pair_cache(cache: 'pair_cache.PairCache') -> None:
+    global _pair_cache
+    _pair_cache = cache
+
+'''
+Return the cache used for word-pair rhyme scores (None if caching is off).
+'''
+def get_pair_cache() -> 'pair_cache.PairCache':
+    return _pair_cache
+
+'''
+Return the rhyme score of a pair of word, using the pair score cache if one is set.
     word1 : First word
     word2 : Second word
 '''
 def pair_rhyme_score(word1: str, word2: str) -> float:
+    if _pair_cache is None:
+        profiling.count('rhyme_pairs_scored')
+        return _compute_pair_rhyme_score(word1, word2)
+    score = _pair_cache.get(word1, word2)
+    if score is None:
+        profiling.count('rhyme_pairs_scored')
+        score = _compute_pair_rhyme_score(word1, word2)
+        # The cache holds both orders of a pair; pairs that score 0 (most pairs) are not cached
+        if score != 0:
+            profiling.count('rhyme_pairs_scored')
+            _pair_cache.put(word1, word2, score, _compute_pair_rhyme_score(word2, word1))
+    else:
+        profiling.count('pair_cache_hits')
+    return score
+
+'''
+Return the rhyme score of a pair of word (calculation described in comments).
+    word1 : First word
+    word2 : Second word
+'''
+def _compute_pair_rhyme_score(word1: str, word2: str) -> float:
     # Ignore pairs of words that are the same
     if word1 == word2:
         return 0
 
-    rhymes_list1 = pronouncing.rhymes(word1) # words that rhyme with word1
-    rhymes_list2 = pronouncing.rhymes(word2) # words that rhyme with word2
-    if word1 in rhymes_list2 or word2 in rhymes_list1:
-        # Rhyme score = 1 for perfect rhyme (determined by pronouncing package)
+    index = rhyme_index.get_index()
+
+    # Rhyme score = 1 for perfect rhyme (determined by pronouncing package). pronouncing.rhymes()
+    # lists the dictionary words sharing a rhyming part with the given word, so the pair is a
+    # perfect rhyme if either word is in the dictionary and the words share a rhyming part.
+    if (index.has_word(word1) or index.has_word(word2)) and \
+            not index.rhyming_parts(word1).isdisjoint(index.rhyming_parts(word2)):
         return 1.0
 
     max_rhyme_score = 0
 
-    # All pronunciations for words
-    phones_for_word1 = pronouncing.phones_for_word(word1)
-    phones_for_word2 = pronouncing.phones_for_word(word2)
+    # All pronunciations for words (stress numbers already removed by the index)
+    phones_for_word1 = index.phones(word1)
+    phones_for_word2 = index.phones(word2)
 
     # Iterate through each pair of word pronunciations
     for i in range(len(phones_for_word1)):
         for j in range(len(phones_for_word2)):
-            # Initialize phonemes1 at start of 2nd loop because its value changes
-            # during this loop and we want to reset it before starting again
-            phonemes1 = phones_for_word1[i]
-            phonemes2 = phones_for_word2[j]
+            phonemes1, length1 = phones_for_word1[i]
+            phonemes2, length2 = phones_for_word2[j]
 
-            # List with fewer phonemes is first (phonemes1)
-            if len(phonemes1) > len(phonemes2):
+            # Pronunciation with the shorter CMU text is first (phonemes1)
+            if length1 > length2:
                 phonemes1, phonemes2 = phonemes2, phonemes1
-            
-            # Remove stress numbers from phonemes
-            phonemes1 = [''.join([x for x in phoneme if x.isalpha()]) for phoneme in phonemes1.split()]
-            phonemes2 = [''.join([x for x in phoneme if x.isalpha()]) for phoneme in phonemes2.split()]
 
             # If phonemes1 has 1 or 2 phonemes, it is either part of a perfect rhyme
             # (if its ending phoneme is the ending phoneme for phonemes2) or not.
@@ -107,7 +186,7 @@ def pair_rhyme_score(word1: str, word2: str) -> float:
             # ends with the same phoneme and the phoneme is a "vowel" phoneme (the phoneme
             # contains a vowel). Otherwise, it is not part of any rhyme (perfect or not).
             if len(phonemes1) == 1:
-                if vowel_in_word(phonemes1[0]) and phonemes1[0] == phonemes2[-1]:
+                if index.is_vowel(phonemes1[0]) and phonemes1[0] == phonemes2[-1]:
                     return 1
                 return 0
 
@@ -115,49 +194,61 @@ def pair_rhyme_score(word1: str, word2: str) -> float:
             # ends with the same phoneme and the phoneme is a "vowel" phoneme, or
             # phonemes1 is the ending of phonemes2. Otherwise, it is not part of any rhyme.
             if len(phonemes1) == 2:
-                if vowel_in_word(phonemes1[1]) and phonemes1[1] == phonemes2[-1]:
+                if index.is_vowel(phonemes1[1]) and phonemes1[1] == phonemes2[-1]:
                     return 1
                 if phonemes2[-2:] == phonemes1:
                     return 1
                 return 0
-            
-            # If phonemes1 has n > 2 phonemes, a perfect rhyme requires the ending ceil(n/2)
-            # phonemes to match in phonemes1 and phonemes2 (perfect rhyme : rhyme score = 1)
-            # If a perfect rhyme doesn't exist, use ending lists of phonemes of size
-            # ceil(n/2) - 1, ceil(n/2) - 2, ..., 2 and subtract 0.25 from the rhyme score
-            # at each step ... Formula = 1 - 0.25*(ceil(n/2) - k) where 0 <= k <= ceil(n/2)
-            # If the ending X phonemes do not match, check if the ending X phonemes from
-            # phonemes1 match with any sequence of X phonemes in phonemes2. If they do, then
-            # the rhyme score is 1/4 of what it would have been
-            # i.e. Formula = (1 - 0.25*(ceil(n/2) - k)) / 4
+
+            # If phonemes1 has n > 2 phonemes, check whether its ending ceil(n/2) phonemes
+            # appear as a sequence anywhere in phonemes2 (the ending of phonemes2 included).
+            # If they don't, use ending lists of phonemes of size ceil(n/2) - 1, ceil(n/2) - 2,
+            # ..., 2 and subtract 0.25 from the rhyme score at each step. A match scores 1/4
+            # of the step value, i.e. Formula = (1 - 0.25*(ceil(n/2) - k)) / 4 where k is the
+            # longest matching length. Matches must contain a "vowel" phoneme.
             max_sub_len = math.ceil(len(phonemes1) / 2)
-            sub_len = max_sub_len
-            end_val = 2
-            while sub_len >= end_val:
+            sequences = _phoneme_sequences(phonemes2, max_sub_len)
+            for sub_len in range(max_sub_len, 1, -1):
                 phoneme_sub1 = phonemes1[-sub_len : ]
-                phoneme_sub2 = phonemes2[-sub_len : ]
-                if phoneme_sub1 == phoneme_sub2 and vowel_in_word(phoneme_sub1):
-                    temp = 1 - 0.25*(max_sub_len - sub_len)
-                else:
-                    temp = 0
-                for k in range(0, len(phonemes2) - sub_len + 1):
-                    if phoneme_sub1 == phonemes2[k : k + sub_len] and vowel_in_word(''.join(phoneme_sub1)):
-                        temp = (1 - 0.25*(max_sub_len - sub_len)) / 4
-                        break
-                else:
-                    temp = 0
-                max_rhyme_score = max(max_rhyme_score, temp)
-                sub_len -= 1
-    
+                if phoneme_sub1 in sequences and any(index.is_vowel(x) for x in phoneme_sub1):
+                    temp = (1 - 0.25*(max_sub_len - sub_len)) / 4
+                    max_rhyme_score = max(max_rhyme_score, temp)
+                    break
+
     return max_rhyme_score
 
 '''
-Return (estimated) number of syllables in a word.
+Return the number of syllables in a word. The count comes from the CMU pronouncing dictionary
+(see rhyme_index) if the word is in it and CMU counts are enabled; otherwise, it is estimated.
+Counts are kept in a process-wide bounded cache.
     word : String for counting syllables
 '''
+@functools.lru_cache(maxsize=2**17)
 def syllable_count(word: str) -> int:
+    if _cmu_syllables:
+        count = rhyme_index.get_index().syllable_count(word)
+        if count is not None:
+            return count
+    import syllables # Slow to import, and only needed for words missing from the CMU dictionary
     return syllables.estimate(word)
 
+'''
+Choose whether syllable counts come from the CMU pronouncing dictionary when possible (default)
+or are always estimated (as in earlier versions, whose stored statistics used estimates only).
+    enabled : True to prefer CMU counts; False to always estimate
+'''
+def set_cmu_syllables(enabled: bool) -> None:
+    global _cmu_syllables
+    if enabled != _cmu_syllables:
+        _cmu_syllables = enabled
+        syllable_count.cache_clear()
+
+'''
+Return True if syllable counts come from the CMU pronouncing dictionary when possible; False otherwise.
+'''
+def get_cmu_syllables() -> bool:
+    return _cmu_syllables
+
     
 
     